@@ -0,0 +1,238 @@
+"""Headless HTTP API for the image operations.
+
+Runs next to the Streamlit UI and shares its operation logic
+(operations.run_operation), result cache, scheduler and job queue:
+
+    uvicorn api:app --host 0.0.0.0 --port 8505
+
+Synchronous calls return the raw image bytes:
+
+    curl -F prompt="Add a wizard hat" -F image=@dog.png http://localhost:8505/v1/edit -o out.png
+
+Add ``?async=true`` to get ``202 Accepted`` with a job to poll instead.
+
+Request bodies are capped at NANO_BANANA_MAX_BODY_MB (60 MB, the same as
+``client_max_body_size`` in nginx.conf; change both together) and each
+image at ingest's NANO_BANANA_MAX_UPLOAD_MB. Larger requests get ``413``
+before the body is read.
+"""
+import os
+import logging
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import ingest
+import metrics
+from fusion import FUSION_MAX_IMAGES
+from jobs import CANCELLED, DONE, FAILED, get_job_queue
+from operations import check_inputs, run_operation
+from preprocess import MAX_EDGE
+
+logger = logging.getLogger("nano_banana.api")
+
+# Configuration
+API_PORT = int(os.getenv("NANO_BANANA_API_PORT", "8505"))
+API_HOST = os.getenv("NANO_BANANA_API_HOST", "0.0.0.0")
+# Largest request body; keep in step with client_max_body_size in nginx.conf
+MAX_BODY_BYTES = int(os.getenv("NANO_BANANA_MAX_BODY_MB", "60")) * 1024 * 1024
+
+OPERATION_PATHS = {
+    "edit": "edit",
+    "restoration": "restoration",
+    "restore": "restoration",
+    "fusion": "fusion",
+    "fuse": "fusion",
+    "generation": "generation",
+    "generate": "generation",
+}
+
+
+class APIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def error_response(status_code, message, **extra):
+    return JSONResponse({"error": message, **extra}, status_code=status_code)
+
+
+def _flag(value):
+    return str(value or "").lower() in ("1", "true", "yes", "on")
+
+
+def _decode_upload(upload, max_edge):
+    """Check and decode one spooled upload (runs on a worker thread).
+
+    The header is checked against the ingest limits before any pixels are
+    decoded, and the pixels are decoded at ``max_edge``.
+    """
+    upload.file.seek(0)
+    try:
+        return ingest.open_upload(upload.file.read(), max_edge, key=upload.filename)
+    except ingest.UploadRejected as e:
+        raise APIError(400 if e.reason == "format" else 413, f"'{upload.filename}': {e}")
+
+
+def _too_large():
+    return APIError(413, f"The request is larger than {MAX_BODY_BYTES // (1024 * 1024)} MB")
+
+
+def limit_body(request, limit=None):
+    """``request`` refusing bodies over ``limit`` bytes before they are read.
+
+    A declared Content-Length is checked up front; chunked bodies are counted
+    as they stream in, so an oversized one is cut off at the limit.
+    """
+    limit = MAX_BODY_BYTES if limit is None else limit
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise _too_large()
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise _too_large()
+        return message
+
+    return Request(request.scope, receive)
+
+
+async def read_request(request):
+    """Parse prompt, options and images from a multipart form or a JSON body."""
+    request = limit_body(request)
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise APIError(400, "The request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise APIError(400, "The JSON body must be an object")
+        return str(body.get("prompt") or ""), body, []
+
+    # Multipart bodies are parsed incrementally and file parts spooled to disk
+    form = await request.form(max_files=FUSION_MAX_IMAGES, max_fields=32)
+    try:
+        uploads = [value for key in ("image", "images") for value in form.getlist(key)
+                   if isinstance(value, UploadFile)]
+        for upload in uploads:
+            if upload.size is not None:
+                try:
+                    ingest.check_size(upload.size)
+                except ingest.UploadRejected as e:
+                    raise APIError(413, f"'{upload.filename}': {e}")
+        options = {key: value for key, value in form.items() if not isinstance(value, UploadFile)}
+        # Only tiled restoration needs more pixels than the model is sent
+        max_edge = 0 if _flag(options.get("tiled")) else MAX_EDGE
+        images = [await run_in_threadpool(_decode_upload, upload, max_edge) for upload in uploads]
+    finally:
+        await form.close()
+    return options.get("prompt", ""), options, images
+
+
+def operation_job(operation_type, prompt, images, tiled):
+    """Job body shared by the sync and async endpoints: ``(result, notices)``."""
+    notices = []
+    result = run_operation(operation_type, prompt, images, notices, tiled=tiled)
+    return result, notices
+
+
+def image_response(result, notices):
+    if result is None:
+        return error_response(422, "The model returned no image",
+                              notices=[message for _, message in notices])
+    return Response(result.data, media_type=result.mime_type,
+                    headers={"X-Image-Digest": result.digest})
+
+
+async def run(request):
+    operation_type = OPERATION_PATHS.get(request.path_params["operation"])
+    if operation_type is None:
+        return error_response(404, f"Unknown operation '{request.path_params['operation']}'")
+    try:
+        prompt, options, images = await read_request(request)
+        if not prompt.strip():
+            raise APIError(400, "A prompt is required")
+        try:
+            check_inputs(operation_type, images)
+        except ValueError as e:
+            raise APIError(400, str(e))
+    except APIError as e:
+        return error_response(e.status_code, e.message)
+
+    tiled = _flag(options.get("tiled"))
+    if _flag(request.query_params.get("async")):
+        job_id = get_job_queue().submit(operation_job, operation_type, prompt, images, tiled,
+                                        description=f"api:{operation_type}")
+        return JSONResponse({"id": job_id, "status_url": f"/v1/jobs/{job_id}",
+                             "result_url": f"/v1/jobs/{job_id}/result"},
+                            status_code=202, headers={"Location": f"/v1/jobs/{job_id}"})
+
+    # Model calls block, so they run on the threadpool rather than the event loop
+    try:
+        result, notices = await run_in_threadpool(operation_job, operation_type, prompt, images, tiled)
+    except Exception as e:
+        logger.exception("%s request failed", operation_type)
+        return error_response(502, f"Error processing image: {e}")
+    return image_response(result, notices)
+
+
+async def job_status(request):
+    job = get_job_queue().get(request.path_params["job_id"])
+    if job is None:
+        return error_response(404, "Unknown or expired job")
+    return JSONResponse(dict(job.to_dict(), elapsed=job.elapsed))
+
+
+async def job_result(request):
+    job = get_job_queue().get(request.path_params["job_id"])
+    if job is None:
+        return error_response(404, "Unknown or expired job")
+    if job.status == DONE:
+        return image_response(*job.result)
+    if job.status == FAILED:
+        return error_response(502, f"Error processing image: {job.error}")
+    if job.status == CANCELLED:
+        return error_response(410, "Job was cancelled")
+    return JSONResponse(job.to_dict(), status_code=202, headers={"Retry-After": "1"})
+
+
+async def cancel_job(request):
+    if not get_job_queue().cancel(request.path_params["job_id"]):
+        return error_response(404, "Unknown or already finished job")
+    return JSONResponse({"id": request.path_params["job_id"], "status": CANCELLED})
+
+
+async def health(request):
+    return PlainTextResponse("ok")
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.get_registry().render(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+app = Starlette(routes=[
+    Route("/v1/jobs/{job_id}", job_status, methods=["GET"]),
+    Route("/v1/jobs/{job_id}", cancel_job, methods=["DELETE"]),
+    Route("/v1/jobs/{job_id}/result", job_result, methods=["GET"]),
+    Route("/v1/{operation}", run, methods=["POST"]),
+    Route("/healthz", health, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(name)s: %(message)s")
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
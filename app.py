@@ -1,19 +1,27 @@
 import os
+import logging
+import threading
 import streamlit as st
-import google.generativeai as genai
-from PIL import Image
-from io import BytesIO
-import tempfile
-import base64
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import uuid
+import core
+import ingest
+import metrics
+import shared_store
+import transforms
+from edit_session import EditSession
+from image_io import FORMATS, encode_in_background
+from image_memo import preview, rotated, rotated_handle, upload_digest, upload_info
+from preprocess import MAX_EDGE
+from image_store import SESSION_TTL_SECONDS, get_image_store
+from jobs import DONE, FAILED, QUEUED, get_job_queue
+from fusion import FUSION_MAX_IMAGES, FUSION_MAX_INPUTS
+from operations import model_name_for, run_operation
+from router import get_router
 
 # Configuration
-from dotenv import load_dotenv
-load_dotenv()
-
-# Configure AI Models
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-image_gen_model = genai.GenerativeModel('imagen-4.0-generate-001')  # Main model for generation
-analysis_model = genai.GenerativeModel('gemini-2.5-flash')  # For image analysis only
+# Models are built lazily, once per process, by core.get_model
+JOB_POLL_SECONDS = float(os.getenv("NANO_BANANA_JOB_POLL_SECONDS", "1"))
 
 # Custom CSS for super appealing artistic photographic theme
 st.markdown("""
@@ -238,103 +246,320 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def save_image_from_response(response, filename=None):
-    """Helper function to save the image from the API response."""
-    try:
-        # Check for direct image in response
-        if hasattr(response, '_result') and hasattr(response._result, 'candidates'):
-            for candidate in response._result.candidates:
-                if hasattr(candidate, 'content'):
-                    for part in candidate.content.parts:
-                        if hasattr(part, 'inline_data'):
-                            image_data = BytesIO(part.inline_data.data)
-                            img = Image.open(image_data)
-                            return img
-        
-        # Check standard format
-        if hasattr(response, 'candidates') and response.candidates:
-            for candidate in response.candidates:
-                if hasattr(candidate, 'content') and candidate.content:
-                    for part in candidate.content.parts:
-                        if hasattr(part, 'inline_data') and part.inline_data:
-                            try:
-                                # Handle base64 encoded data
-                                if hasattr(part.inline_data, 'data'):
-                                    image_data = part.inline_data.data
-                                    st.write(f"Debug: Data type: {type(image_data)}, Length: {len(image_data) if hasattr(image_data, '__len__') else 'N/A'}")
-                                    
-                                    if isinstance(image_data, str):
-                                        # Base64 string
-                                        image_data = base64.b64decode(image_data)
-                                        st.write(f"Debug: Decoded data length: {len(image_data)}")
-                                    
-                                    if len(image_data) < 100:
-                                        st.error(f"Debug: Data too small, content: {image_data[:50]}")
-                                        continue
-                                    
-                                    # Check if data starts with valid image headers
-                                    if not (image_data.startswith(b'\xff\xd8') or  # JPEG
-                                           image_data.startswith(b'\x89PNG') or   # PNG
-                                           image_data.startswith(b'GIF')):        # GIF
-                                        st.error(f"Debug: Invalid image format. First 20 bytes: {image_data[:20]}")
-                                        continue
-                                        
-                                    img = Image.open(BytesIO(image_data))
-                                    return img
-                            except Exception as e:
-                                st.error(f"Error decoding image data: {str(e)}")
-                                continue
-                        elif hasattr(part, 'file_data') and part.file_data:
-                            # Handle file data format
-                            pass
-        
-        # Check if request was blocked/filtered
-        if hasattr(response, 'candidates') and response.candidates:
-            candidate = response.candidates[0]
-            if hasattr(candidate, 'finish_reason') and candidate.finish_reason == 1:
-                st.error("🚫 Image generation was blocked. Try a different, more appropriate prompt.")
-                return None
-        
-        # No image found - check for text response
-        try:
-            if hasattr(response, 'text') and response.text:
-                st.info(f"Model response: {response.text}")
-        except:
-            st.warning("⚠️ No image was generated. The request may have been filtered or the model returned no content.")
-        
-        return None
-    except Exception as e:
-        if "finish_reason is 1" in str(e):
-            st.error("🚫 Image generation was blocked. Try a different, more appropriate prompt.")
+def generation_job(operation_type, prompt, handles, slots, stream_text=None, progress=None, tiled=False):
+    """Background job body: fills ``slots`` as variants arrive.
+
+    ``handles`` are the input ImageHandles; they are decoded here rather
+    than on the script thread.
+
+    When ``stream_text`` is a list, a single request is streamed and its text
+    parts are appended there as they arrive. With ``tiled`` a restoration is
+    run tile by tile, reporting ``(done, total)`` in ``progress["tiles"]``.
+    Fusions of more than FUSION_MAX_INPUTS images are reduced in a tree and
+    each intermediate merge is appended to ``progress["intermediates"]``.
+    Returns the finished images, any messages for the UI and the stream
+    timings.
+    """
+    # Raises LookupError (the job's error message) if an upload was evicted meanwhile
+    images = [handle.image for handle in handles]
+    notices = []
+    if (tiled and operation_type == "restoration") or \
+       (operation_type == "fusion" and len(images) > FUSION_MAX_INPUTS):
+        progress["intermediates"] = []
+        def on_tile(done, total):
+            progress["tiles"] = (done, total)
+        result = run_operation(
+            operation_type, prompt, images, notices, tiled=tiled, on_tile=on_tile,
+            on_intermediate=lambda level, index, merged: progress["intermediates"].append(merged),
+        )
+        slots[0] = result
+        return [result] if result is not None else [], notices, None
+    if stream_text is not None and len(slots) == 1:
+        def on_image(result):
+            slots[0] = result
+        result, timings = core.stream_operation(
+            operation_type, prompt, images, model_name_for(operation_type), notices,
+            on_text=stream_text.append, on_image=on_image,
+        )
+        slots[0] = result
+        return [result] if result is not None else [], notices, timings
+    for index, result, result_notices, error in core.iter_variants(
+        operation_type, prompt, images, len(slots), model_name_for(operation_type)
+    ):
+        notices.extend(result_notices)
+        if error is not None:
+            notices.append(("error", f"Error processing image: {error}"))
+        slots[index] = result
+    return [result for result in slots if result is not None], notices, None
+
+def edit_session_job(holder, handle, prompt):
+    """Background job body for one conversational edit: a new step on the session's timeline.
+
+    The session is started here on first use, so decoding the upload and
+    preparing it for the model stay off the script thread.
+    """
+    with holder["lock"]:
+        if holder["session"] is None:
+            holder["session"] = EditSession(handle.image, model_name_for("edit"))
+    notices = []
+    result = holder["session"].send(prompt, notices)
+    return [result] if result is not None else [], notices, None
+
+def edit_session_holder(handle):
+    """This tab's edit session slot, emptied when the upload or its rotation changes."""
+    source = (handle.key, handle.orientation)
+    holder = st.session_state.get('edit_session_holder')
+    if holder is None or holder["source"] != source:
+        holder = {"source": source, "session": None, "lock": threading.Lock()}
+        st.session_state.edit_session_holder = holder
+    return holder
+
+def current_edit_session():
+    holder = st.session_state.get('edit_session_holder')
+    return holder["session"] if holder else None
+
+def show_step(index):
+    step = current_edit_session().checkout(index)
+    st.session_state.result_image = step.image
+    st.session_state.variant_results = [step.image]
+    st.session_state.download_job = None
+
+def undo_step():
+    show_step(current_edit_session().undo().index)
+
+def edit_timeline(session, columns=4):
+    """Every step of the edit session; continuing from an earlier one starts a branch."""
+    steps = list(session.steps)
+    on_path = {step.index for step in session.path()}
+    st.markdown("**🕘 Edit timeline**")
+    for row_start in range(0, len(steps), columns):
+        cols = st.columns(columns)
+        for offset, step in enumerate(steps[row_start:row_start + columns]):
+            with cols[offset]:
+                label = "Original" if step.parent is None else f"{step.index}. {step.prompt[:40]}"
+                if step.index == session.head:
+                    label = f"⭐ {label}"
+                elif step.index not in on_path:
+                    label = f"↪ from {step.parent}: {label}"
+                st.image(preview(step.image.digest, step.image.data), use_container_width=True, caption=label)
+                st.button("Continue from here", key=f"edit_step_{step.index}", on_click=show_step,
+                          args=(step.index,), disabled=step.index == session.head, use_container_width=True)
+    st.button("↩️ UNDO LAST EDIT", key="undo_edit", on_click=undo_step,
+              disabled=session.current.parent is None, use_container_width=True)
+
+def select_variant(index):
+    st.session_state.result_image = st.session_state.variant_results[index]
+    st.session_state.download_job = None
+
+def variant_grid(results, columns=4, selectable=False, caption="Variation"):
+    """Thumbnail grid of variants; empty slots are still being generated."""
+    for row_start in range(0, len(results), columns):
+        cols = st.columns(columns)
+        for offset, result in enumerate(results[row_start:row_start + columns]):
+            index = row_start + offset
+            with cols[offset]:
+                if result is None:
+                    st.caption(f"⏳ {caption} {index + 1}")
+                    continue
+                st.image(preview(result.digest, result.data), use_container_width=True, caption=f"{caption} {index + 1}")
+                if selectable:
+                    st.button("Select", key=f"select_variant_{index}", on_click=select_variant, args=(index,), use_container_width=True)
+                    st.download_button(
+                        "📥",
+                        data=result.data,
+                        file_name=f"vision_ai_variation_{index + 1}{result.extension}",
+                        mime=result.mime_type,
+                        key=f"download_variant_{index}",
+                        use_container_width=True
+                    )
+
+def metrics_panel():
+    """Sidebar view of this server process's stage timings and counters."""
+    registry = metrics.get_registry()
+    stages = registry.stages()
+    if not stages:
+        st.sidebar.caption("No requests yet.")
+        return
+    st.sidebar.dataframe(
+        [{"stage": stage, "calls": summary["count"], "mean ms": round(summary["mean_ms"], 1),
+          "p95 ms ≤": summary["p95_ms"], "total s": round(summary["total_s"], 2)}
+         for stage, summary in stages.items()],
+        hide_index=True, use_container_width=True
+    )
+    totals = {}
+    errors = []
+    for (name, labels), value in registry.counters().items():
+        labels = dict(labels)
+        if name == metrics.ERRORS:
+            errors.append(f"{labels['stage']}: {labels['type']} × {value}")
+        elif name == "nano_banana_cache_requests_total":
+            totals[f"cache_{labels['result']}"] = totals.get(f"cache_{labels['result']}", 0) + value
         else:
-            st.error(f"Error processing response: {str(e)}")
-        return None
+            totals[name] = totals.get(name, 0) + value
+    lookups = totals.get("cache_hit", 0) + totals.get("cache_miss", 0)
+    st.sidebar.caption(
+        f"⬆️ {totals.get('nano_banana_bytes_in_total', 0) / 1e6:.1f} MB sent • "
+        f"⬇️ {totals.get('nano_banana_bytes_out_total', 0) / 1e6:.1f} MB received • "
+        f"cache hit rate {totals.get('cache_hit', 0) / lookups if lookups else 0:.0%} • "
+        f"{totals.get('nano_banana_coalesced_calls_total', 0)} calls saved by coalescing"
+    )
+    gauges = registry.gauges()
+    if "nano_banana_scheduler_in_flight" in gauges:
+        st.sidebar.caption(
+            f"Model calls: {gauges['nano_banana_scheduler_in_flight']} in flight, "
+            f"{gauges['nano_banana_scheduler_queue_depth']} queued, "
+            f"limit {gauges['nano_banana_scheduler_concurrency_limit']}"
+        )
+    routes = [row for row in get_router().snapshot() if row["calls"]]
+    if routes:
+        st.sidebar.dataframe(
+            [{"operation": row["operation"], "model": row["model"], "calls": row["calls"],
+              "errors": f"{row['error_rate']:.0%}",
+              "p50 s": round(row["p50"], 2) if row["p50"] is not None else None,
+              "p95 s": round(row["p95"], 2) if row["p95"] is not None else None}
+             for row in routes],
+            hide_index=True, use_container_width=True
+        )
+        routing = get_router().stats()
+        st.sidebar.caption(
+            f"Routing: {routing['hedges']} hedged, {routing['fallbacks']} fell back, "
+            f"{routing['abandoned']} slower attempts dropped of {routing['requests']} requests"
+        )
+    for line in errors:
+        st.sidebar.caption(f"⚠️ {line}")
 
-def process_image_edit(image, prompt, operation_type):
-    """Process image based on operation type"""
+def accept_upload(uploaded):
+    """Content hash of an upload within the byte and pixel limits, or None after showing why not."""
     try:
-        # Generate content based on operation type
-        if operation_type == "edit":
-            response = analysis_model.generate_content([prompt, image])
-        elif operation_type == "fusion" and len(st.session_state.get('fusion_images', [])) > 1:
-            img2 = st.session_state.fusion_images[1]
-            response = analysis_model.generate_content([prompt, image, img2])
-        elif operation_type == "restoration":
-            response = analysis_model.generate_content([prompt, image])
-        elif operation_type == "generation":
-            response = image_gen_model.generate_content(prompt)
-        else:
-            return None
-        
-        return save_image_from_response(response)
-        
-    except Exception as e:
-        st.error(f"Error processing image: {str(e)}")
-        st.error(f"Operation: {operation_type}, Prompt: {prompt[:50]}...")
+        # Both checks read the header only; nothing is decoded yet
+        ingest.check_size(uploaded.size)
+        digest = upload_digest(uploaded)
+        upload_info(digest, uploaded.getvalue, record=True)
+    except ingest.UploadRejected as e:
+        st.error(f"🚫 {uploaded.name}: {e}")
         return None
+    return digest
+
+def upload_caption(digest, data):
+    info = upload_info(digest, data)
+    caption = f"📐 {info.size[0]}×{info.size[1]} {info.format} • {info.nbytes / 1024 / 1024:.1f} MB"
+    peak = ingest.peak_bytes(digest)
+    if peak:
+        caption += f" • decode peak ~{peak / 1024 / 1024:.0f} MB"
+    return caption
+
+def track_session_images():
+    """Tell the image store which images this session still holds handles to."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    handles = [st.session_state.get('uploaded_image'), *st.session_state.get('fusion_images', [])]
+    store = get_image_store()
+    store.touch_session(ctx.session_id, [handle.key for handle in handles if handle is not None])
+    # Closed tabs never say goodbye; free what idle sessions were holding
+    store.release_idle_sessions()
+
+def session_token():
+    """Id for this browser tab that survives websocket reconnects, kept in the page URL."""
+    token = st.query_params.get("session")
+    if not token:
+        token = st.query_params["session"] = uuid.uuid4().hex
+    return token
+
+def restore_session():
+    """After a reconnect (possibly to another replica) pick up this tab's job and results."""
+    if st.session_state.get('session_restored'):
+        return
+    st.session_state.session_restored = True
+    store = shared_store.get_shared_store()
+    record = store.get_json("session", session_token())
+    if record is None:
+        return
+    results = [result for result in shared_store.decode(store, record["results"]) if result is not None]
+    st.session_state.active_job = record["active_job"]
+    st.session_state.variant_results = results
+    selected = record["selected"]
+    st.session_state.result_image = results[selected] if selected is not None and selected < len(results) else None
+    # Whatever this tab saved last is already in the store
+    st.session_state.saved_session = session_fingerprint()
+
+def session_fingerprint():
+    results = st.session_state.get('variant_results') or []
+    result = st.session_state.get('result_image')
+    selected = next((index for index, item in enumerate(results) if item is result), None)
+    return st.session_state.get('active_job'), tuple(item.digest for item in results), selected
+
+def save_session():
+    """Write the tab's job id and results to the shared store when they change."""
+    fingerprint = session_fingerprint()
+    if st.session_state.get('saved_session') == fingerprint:
+        return
+    store = shared_store.get_shared_store()
+    store.put_json("session", session_token(), {
+        "active_job": fingerprint[0],
+        "results": shared_store.encode(store, st.session_state.get('variant_results') or []),
+        "selected": fingerprint[2],
+    }, SESSION_TTL_SECONDS)
+    st.session_state.saved_session = fingerprint
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_status_panel():
+    """Poll the active background job and hand its result to the page when done."""
+    job_id = st.session_state.get('active_job')
+    if not job_id:
+        return
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        st.session_state.active_job = None
+        return
+    
+    if not job.finished:
+        label = "Waiting for a free slot" if job.status == QUEUED else "Creating your masterpiece"
+        slots = st.session_state.get('variant_slots') or []
+        done = sum(result is not None for result in slots)
+        progress = f" ({done}/{len(slots)} ready)" if len(slots) > 1 else ""
+        job_progress = st.session_state.get('job_progress') or {}
+        tiles = job_progress.get("tiles")
+        if tiles:
+            progress = f" (tile {tiles[0]}/{tiles[1]})"
+        intermediates = list(job_progress.get("intermediates") or [])
+        if intermediates:
+            progress = f" ({len(intermediates)} intermediate merges done)"
+        st.info(f"🎨 {label}...{progress} {job.elapsed:.0f}s")
+        if len(slots) > 1 and done:
+            # Show each variation as soon as it arrives
+            variant_grid(list(slots))
+        if intermediates:
+            # Partial fusions, shown as each level's merges land
+            variant_grid(intermediates, caption="Merge")
+        stream_text = st.session_state.get('stream_text')
+        if stream_text:
+            st.markdown("".join(stream_text))
+        if len(slots) == 1 and slots[0] is not None:
+            # The image chunk has landed; show it while the stream finishes
+            st.image(preview(slots[0].digest, slots[0].data), use_container_width=True)
+        if st.button("✖️ CANCEL", use_container_width=True, key="cancel_job"):
+            queue.cancel(job_id)
+            st.session_state.active_job = None
+            st.rerun()
+        return
+    
+    st.session_state.active_job = None
+    queue.forget(job_id)
+    if job.status == DONE:
+        results, st.session_state.job_notices, st.session_state.stream_timings = job.result
+        st.session_state.variant_results = results
+        st.session_state.result_image = results[0] if results else None
+    elif job.status == FAILED:
+        st.session_state.job_notices = [("error", f"Error processing image: {job.error}")]
+    st.rerun()
 
 # Streamlit App
 def main():
+    # Prometheus scrape endpoint; started once per server process
+    metrics.start_metrics_server()
+    
     # Add custom fonts
     st.markdown(
         '<link href="https://fonts.googleapis.com/css2?family=Playfair+Display:wght@900&family=Montserrat:wght@400;600;700&display=swap" rel="stylesheet">',
@@ -356,6 +581,8 @@ def main():
         st.session_state.fusion_images = []
     if 'result_image' not in st.session_state:
         st.session_state.result_image = None
+    restore_session()
+    pending_download = None
     
     # Sidebar for operation selection
     st.sidebar.markdown('<h2 class="sub-header">🎨 CREATIVE TOOLS</h2>', unsafe_allow_html=True)
@@ -384,6 +611,15 @@ def main():
         unsafe_allow_html=True
     )
     
+    stream_responses = st.sidebar.toggle(
+        "⚡ Stream responses",
+        value=core.STREAM,
+        help="Show the model's progress as it arrives instead of waiting for the full response"
+    )
+    
+    if st.sidebar.toggle("📊 Show metrics", value=False, help="Per-stage timings, bytes and cache hits for this server"):
+        metrics_panel()
+    
     # Main content area
     col1, col2 = st.columns([1, 1])
     
@@ -396,9 +632,10 @@ def main():
                 type=['png', 'jpg', 'jpeg'],
                 help="Upload a high-quality image for best results"
             )
-            if uploaded_file is not None:
-                image = Image.open(uploaded_file)
-                
+            digest = accept_upload(uploaded_file) if uploaded_file is not None else None
+            if digest is None:
+                st.session_state.uploaded_image = None
+            else:
                 # Rotation controls
                 col_rot1, col_rot2, col_rot3 = st.columns([1, 2, 1])
                 with col_rot2:
@@ -409,49 +646,49 @@ def main():
                         format_func=lambda x: f"{x}°"
                     )
                 
-                if rotation != 0:
-                    image = image.rotate(-rotation, expand=True)
-                
-                st.session_state.uploaded_image = image
-                st.image(image, caption="📷 Your Original Masterpiece", use_container_width=True, output_format="PNG")
+                # Session state keeps only a handle; pixels are decoded on first use, at the
+                # size the model receives unless tiled restoration needs every pixel
+                full_resolution = operation == "Image Restoration" and st.session_state.get("tiled_restoration")
+                st.session_state.uploaded_image = rotated_handle(
+                    digest, uploaded_file.getvalue, rotation, max_edge=0 if full_resolution else MAX_EDGE
+                )
+                st.image(preview(digest, uploaded_file.getvalue, rotation), caption="📷 Your Original Masterpiece", use_container_width=True)
+                st.caption(upload_caption(digest, uploaded_file.getvalue))
         
         elif operation == "Image Fusion":
             uploaded_files = st.file_uploader(
-                "🖼️ Select two images to blend", 
+                f"🖼️ Select 2-{FUSION_MAX_IMAGES} images to blend", 
                 type=['png', 'jpg', 'jpeg'], 
                 accept_multiple_files=True,
-                help="Choose two images that you want to merge creatively"
+                help="Choose the reference images that you want to merge creatively"
             )
+            if uploaded_files and len(uploaded_files) > FUSION_MAX_IMAGES:
+                st.warning(f"⚠️ Only the first {FUSION_MAX_IMAGES} images will be used.")
+                uploaded_files = uploaded_files[:FUSION_MAX_IMAGES]
             if uploaded_files and len(uploaded_files) >= 2:
-                images = [Image.open(uploaded_files[0]), Image.open(uploaded_files[1])]
-                
-                # Rotation controls for both images
-                col1_1, col1_2 = st.columns(2)
-                with col1_1:
-                    rot1 = st.select_slider(
-                        "🔄 Rotate First Image",
-                        options=[0, 90, 180, 270],
-                        value=0,
-                        format_func=lambda x: f"{x}°",
-                        key="rot1"
-                    )
-                    if rot1 != 0:
-                        images[0] = images[0].rotate(-rot1, expand=True)
-                    st.image(images[0], caption="🖼️ First Image", use_container_width=True)
-                
-                with col1_2:
-                    rot2 = st.select_slider(
-                        "🔄 Rotate Second Image",
-                        options=[0, 90, 180, 270],
-                        value=0,
-                        format_func=lambda x: f"{x}°",
-                        key="rot2"
-                    )
-                    if rot2 != 0:
-                        images[1] = images[1].rotate(-rot2, expand=True)
-                    st.image(images[1], caption="🖼️ Second Image", use_container_width=True)
-                
-                st.session_state.fusion_images = images
+                handles = []
+                # Rotation controls for every image, two per row
+                for row_start in range(0, len(uploaded_files), 2):
+                    row = st.columns(2)
+                    for offset, uploaded in enumerate(uploaded_files[row_start:row_start + 2]):
+                        index = row_start + offset
+                        with row[offset]:
+                            digest = accept_upload(uploaded)
+                            if digest is None:
+                                continue
+                            rotation = st.select_slider(
+                                f"🔄 Rotate Image {index + 1}",
+                                options=[0, 90, 180, 270],
+                                value=0,
+                                format_func=lambda x: f"{x}°",
+                                key=f"rot{index + 1}"
+                            )
+                            st.image(preview(digest, uploaded.getvalue, rotation), caption=f"🖼️ Image {index + 1}", use_container_width=True)
+                            st.caption(upload_caption(digest, uploaded.getvalue))
+                        handles.append(rotated_handle(digest, uploaded.getvalue, rotation, max_edge=MAX_EDGE))
+                st.session_state.fusion_images = handles
+            else:
+                st.session_state.fusion_images = []
         
         elif operation == "Text to Image":
             st.info("🌟 Describe your vision in detail below. The more descriptive, the better!")
@@ -478,33 +715,85 @@ def main():
         # Show example below the text area
         st.markdown(f'<div class="caption">💡 {prompt_examples[operation]}</div>', unsafe_allow_html=True)
         
+        variants = 1
+        tiled_restoration = False
+        edit_session_mode = False
+        if operation == "Image Edit":
+            edit_session_mode = st.checkbox(
+                "💬 Conversational editing",
+                key="edit_session_mode",
+                help="Each prompt builds on the previous result, e.g. 'now make the sky darker'; undo or branch from any step"
+            )
+        if operation == "Image Restoration":
+            tiled_restoration = st.checkbox(
+                "🧩 Full-resolution tiled restoration",
+                key="tiled_restoration",
+                help="Restore large scans in overlapping tiles instead of letting the model downscale them"
+            )
+        if operation == "Text to Image":
+            variants = st.slider("🎲 Variations", min_value=1, max_value=core.MAX_VARIANTS, value=1,
+                                 help="Generate several versions in parallel and pick your favourite")
+        
         if st.button("🚀 GENERATE MASTERPIECE", use_container_width=True):
             if (operation in ["Image Edit", "Image Restoration"] and st.session_state.uploaded_image is None) or \
                (operation == "Image Fusion" and len(st.session_state.fusion_images) < 2) or \
-               (operation == "Text to Image" and not prompt.strip()):
+               ((operation == "Text to Image" or edit_session_mode) and not prompt.strip()):
                 st.warning("⚠️ Please provide all required inputs first!")
             else:
-                with st.spinner("🎨 Creating your masterpiece... This may take a few moments."):
-                    if operation == "Image Edit" and st.session_state.uploaded_image:
-                        result = process_image_edit(st.session_state.uploaded_image, prompt, "edit")
-                        st.session_state.result_image = result
-                    
-                    elif operation == "Image Fusion" and len(st.session_state.fusion_images) >= 2:
-                        result = process_image_edit(st.session_state.fusion_images[0], prompt, "fusion")
-                        st.session_state.result_image = result
-                    
-                    elif operation == "Image Restoration" and st.session_state.uploaded_image:
-                        result = process_image_edit(st.session_state.uploaded_image, prompt, "restoration")
-                        st.session_state.result_image = result
-                    
-                    elif operation == "Text to Image":
-                        result = process_image_edit(None, prompt, "generation")
-                        st.session_state.result_image = result
+                if operation == "Image Fusion":
+                    operation_type, handles = "fusion", list(st.session_state.fusion_images)
+                elif operation == "Text to Image":
+                    operation_type, handles = "generation", []
+                else:
+                    operation_type = "edit" if operation == "Image Edit" else "restoration"
+                    handles = [st.session_state.uploaded_image]
+                
+                # Run off the script thread so the page stays responsive and the job can be cancelled
+                queue = get_job_queue()
+                if st.session_state.get('active_job'):
+                    queue.cancel(st.session_state.active_job)
+                st.session_state.variant_slots = [None] * variants
+                st.session_state.stream_text = [] if stream_responses else None
+                st.session_state.stream_timings = None
+                st.session_state.job_progress = {}
+                if edit_session_mode:
+                    st.session_state.active_job = queue.submit(
+                        edit_session_job, edit_session_holder(st.session_state.uploaded_image),
+                        st.session_state.uploaded_image, prompt,
+                        description="Edit session"
+                    )
+                else:
+                    st.session_state.active_job = queue.submit(
+                        generation_job, operation_type, prompt, handles, st.session_state.variant_slots,
+                        st.session_state.stream_text, st.session_state.job_progress, tiled_restoration,
+                        description=operation
+                    )
+                st.session_state.result_image = None
+                st.session_state.variant_results = []
+        
+        track_session_images()
+        job_status_panel()
+        for level, message in st.session_state.pop('job_notices', []):
+            getattr(st, level)(message)
+        
+        session = current_edit_session()
+        if edit_session_mode and session is not None and len(session.steps) > 1:
+            edit_timeline(session)
         
         # Display result
         if st.session_state.result_image:
             st.markdown('<div class="success-message">🎉 YOUR MASTERPIECE IS READY!</div>', unsafe_allow_html=True)
             
+            timings = st.session_state.get('stream_timings')
+            if timings and timings.get("total") is not None:
+                st.caption(f"⚡ First response after {timings['first_chunk'] or 0:.1f}s • complete after {timings['total']:.1f}s")
+            if st.session_state.get('stream_text'):
+                with st.expander("💬 Model notes"):
+                    st.markdown("".join(st.session_state.stream_text))
+            
+            if len(st.session_state.get('variant_results') or []) > 1:
+                variant_grid(st.session_state.variant_results, selectable=True)
+            
             # Add rotation control for generated image
             result_rotation = st.select_slider(
                 "🔄 Rotate Generated Image",
@@ -514,26 +803,50 @@ def main():
                 key="result_rotation"
             )
             
-            display_image = st.session_state.result_image
-            if result_rotation != 0:
-                display_image = st.session_state.result_image.rotate(-result_rotation, expand=True)
+            download_format = st.selectbox(
+                "💾 Download format",
+                ["Original", "WebP", "Optimized PNG"],
+                key="download_format"
+            )
             
-            st.image(display_image, use_container_width=True, output_format="PNG", caption="✨ AI-Generated Masterpiece")
+            result = st.session_state.result_image
+            if result_rotation == 0:
+                # Serve the model's bytes as-is; no decode or re-encode needed
+                st.image(result.data, use_container_width=True, caption="✨ AI-Generated Masterpiece")
+                original_data = result.data
+            else:
+                st.image(preview(result.digest, result.data, result_rotation), use_container_width=True, caption="✨ AI-Generated Masterpiece")
+                # JPEG results rotate losslessly via their EXIF tag; others need a re-encode
+                original_data = transforms.lossless_bytes(result.data, transforms.from_rotation(result_rotation))
             
             # Download button
-            buf = BytesIO()
-            display_image.save(buf, format="PNG")
-            st.download_button(
-                label="📥 DOWNLOAD HIGH-QUALITY IMAGE",
-                data=buf.getvalue(),
-                file_name=f"vision_ai_{operation.lower().replace(' ', '_')}.png",
-                mime="image/png",
-                use_container_width=True
-            )
+            file_stem = f"vision_ai_{operation.lower().replace(' ', '_')}"
+            if original_data is not None and download_format == "Original":
+                st.download_button(
+                    label="📥 DOWNLOAD HIGH-QUALITY IMAGE",
+                    data=original_data,
+                    file_name=f"{file_stem}{result.extension}",
+                    mime=result.mime_type,
+                    use_container_width=True
+                )
+            else:
+                # Re-encode on the background encoder so the rest of the page renders first
+                target_format = "WEBP" if download_format == "WebP" else "PNG"
+                job_key = (result.digest, result_rotation, target_format)
+                job = st.session_state.get('download_job')
+                if job is None or job[0] != job_key:
+                    # The rotation is applied here, once, as a single lossless transpose
+                    job = (job_key, encode_in_background(rotated(result.digest, result.data, result_rotation), target_format))
+                    st.session_state.download_job = job
+                download_slot = st.empty()
+                download_slot.button("⏳ Preparing download...", disabled=True, use_container_width=True)
+                pending_download = (download_slot, job[1], f"{file_stem}{FORMATS[target_format][1]}", FORMATS[target_format][0])
             
             # Reset button
             if st.button("🔄 CREATE ANOTHER MASTERPIECE", use_container_width=True):
                 st.session_state.result_image = None
+                st.session_state.variant_results = []
+                st.session_state.download_job = None
                 st.rerun()
 
     # Footer
@@ -545,6 +858,20 @@ def main():
         '</div>', 
         unsafe_allow_html=True
     )
+    
+    save_session()
+    
+    # Fill in the download button once the background encode finishes
+    if pending_download is not None:
+        download_slot, future, file_name, mime = pending_download
+        download_slot.download_button(
+            label="📥 DOWNLOAD HIGH-QUALITY IMAGE",
+            data=future.result(),
+            file_name=file_name,
+            mime=mime,
+            use_container_width=True
+        )
 
 if __name__ == "__main__":
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(name)s: %(message)s")
     main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+import os
+import glob
+import json
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Configuration
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".bmp")
+DEFAULT_WORKERS = int(os.getenv("NANO_BANANA_BATCH_WORKERS", "4"))
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def collect_inputs(source):
+    """Return the sorted image paths for a directory or a glob pattern."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def input_root(source):
+    """Directory that inputs from ``source`` are relative to: the directory itself or a glob's fixed prefix."""
+    if os.path.isdir(source):
+        return source
+    fixed = []
+    for part in source.split(os.sep):
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    root = os.sep.join(fixed)
+    return root if os.path.isdir(root) else os.path.dirname(root)
+
+
+def output_path_for(input_path, output_dir, suffix, root=None, keep_extension=False):
+    """Map an input image to its output path inside output_dir, without an extension.
+
+    The path below ``root`` is kept, so inputs from a recursive glob with
+    the same name in different folders do not collide. The extension is
+    left to the result (see core.save_result), so the model's bytes are
+    written as they are instead of being re-encoded to the input's format.
+    With ``keep_extension`` the input's extension becomes part of the name,
+    for inputs that differ only by extension.
+    """
+    relative = os.path.relpath(input_path, root or os.path.dirname(input_path))
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(input_path)
+    stem, ext = os.path.splitext(relative)
+    if keep_extension:
+        stem = f"{stem}_{ext[1:].lower()}"
+    return os.path.join(output_dir, f"{stem}{suffix}")
+
+
+def existing_output(output_path):
+    """The file already written for ``output_path``, in whichever format it was saved, or None."""
+    for ext in IMAGE_EXTENSIONS:
+        if os.path.exists(output_path + ext):
+            return output_path + ext
+    return None
+
+
+class Manifest:
+    """Append-only JSONL record of every processed input."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+def run_batch(source, output_dir, process, workers=DEFAULT_WORKERS, suffix=""):
+    """Run ``process(input_path, output_path)`` over every image in source.
+
+    ``output_path`` has no extension; ``process`` saves the result in the
+    model's format and returns the file name it wrote (see
+    core.save_result). Work is spread over a bounded thread pool of
+    ``workers`` threads. Inputs that already have an output file are
+    skipped, so an interrupted run picks up where it stopped. Every attempt is appended to the manifest in
+    output_dir. Returns a summary dict including throughput in images/min.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+
+    inputs = collect_inputs(source)
+    root = input_root(source)
+    # Inputs differing only by extension ("a.jpg", "a.png") would share an output name
+    stems = Counter(output_path_for(path, output_dir, suffix, root) for path in inputs)
+    pending = []
+    skipped = 0
+    for input_path in inputs:
+        output_path = output_path_for(input_path, output_dir, suffix, root)
+        if stems[output_path] > 1:
+            output_path = output_path_for(input_path, output_dir, suffix, root, keep_extension=True)
+        if existing_output(output_path):
+            skipped += 1
+        else:
+            pending.append((input_path, output_path))
+
+    print(f"Found {len(inputs)} images, {skipped} already done, {len(pending)} to process with {workers} workers.")
+
+    def run_one(input_path, output_path):
+        started = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            written = process(input_path, output_path)
+            ok = bool(written)
+            error = None if ok else "no image in response"
+        except Exception as e:
+            written, ok, error = None, False, f"{type(e).__name__}: {e}"
+        record = {
+            "input": input_path,
+            "output": (written if isinstance(written, str) else output_path) if ok else None,
+            "status": "ok" if ok else "error",
+            "seconds": round(time.perf_counter() - started, 3),
+            "error": error,
+        }
+        manifest.write(record)
+        return record
+
+    succeeded = failed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run_one, i, o) for i, o in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            if record["status"] == "ok":
+                succeeded += 1
+            else:
+                failed += 1
+                print(f"Failed: {record['input']} ({record['error']})")
+            print(f"[{done}/{len(pending)}] {record['input']}")
+    elapsed = time.perf_counter() - started
+
+    throughput = succeeded / elapsed * 60 if elapsed > 0 else 0.0
+    summary = {
+        "processed": succeeded,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 2),
+        "images_per_minute": round(throughput, 2),
+    }
+    print(f"Batch finished: {succeeded} ok, {failed} failed, {skipped} skipped "
+          f"in {elapsed:.1f}s ({throughput:.1f} images/min).")
+    return summary
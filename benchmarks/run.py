@@ -0,0 +1,334 @@
+"""Benchmarks for the local hot paths and end-to-end throughput.
+
+Model calls are served by benchmarks.stub_model, so the numbers measure this
+project's own overhead. Results are printed as JSON (or written with
+--output) so runs can be diffed to catch regressions:
+
+    python -m benchmarks.run --latency 0.2 --concurrency 1 4 16 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import subprocess
+import argparse
+import contextlib
+import platform
+import tempfile
+import statistics
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from benchmarks.stub_model import install_stub, make_png, make_response
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def upload_bytes(size):
+    """A JPEG upload of the given size, like a phone photo."""
+    buf = BytesIO()
+    Image.effect_noise(size, 48).convert("RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def micro_benchmarks(repeat, upload_size):
+    import core
+
+    results = {}
+    response = make_response(make_png())
+    results["parse_response"] = summarize(time_calls(lambda: core.extract_image(response, []), repeat))
+
+    upload = upload_bytes(upload_size)
+
+    def decode():
+        image = Image.open(BytesIO(upload))
+        image.load()
+        return image
+    results["upload_decode"] = summarize(time_calls(decode, repeat))
+
+    import ingest
+    from preprocess import MAX_EDGE
+    results["upload_sniff"] = summarize(time_calls(lambda: ingest.sniff(upload), repeat))
+    # Draft-mode decode straight to the size the model is sent
+    results["upload_decode_for_model"] = summarize(time_calls(lambda: ingest.decode(upload, MAX_EDGE), repeat))
+
+    image = decode()
+    results["rotate_90"] = summarize(time_calls(lambda: image.rotate(-90, expand=True), repeat))
+
+    def png_encode():
+        buf = BytesIO()
+        image.save(buf, format="PNG")
+    results["png_encode"] = summarize(time_calls(png_encode, max(1, repeat // 4)))
+
+    from preprocess import prepare_image
+    results["prepare_upload"] = summarize(time_calls(lambda: prepare_image(image), max(1, repeat // 4)))
+    return results
+
+
+def use_scheduler(concurrency):
+    """Replace the process scheduler with one that only limits concurrency."""
+    import scheduler
+    scheduler._default_scheduler = scheduler.Scheduler(
+        rate=0, max_concurrency=concurrency, initial_concurrency=concurrency
+    )
+
+
+def end_to_end(requests, concurrency_levels, image):
+    """Throughput and latency of core.run_operation, the path non-streaming UI, API and CLI requests take."""
+    import core
+
+    results = {}
+    for concurrency in concurrency_levels:
+        use_scheduler(concurrency)
+        run_id = f"{time.time_ns()}-{concurrency}"
+
+        def one(index):
+            started = time.perf_counter()
+            # Unique prompts so every request misses the result cache
+            core.run_operation("edit", f"benchmark {run_id} {index}", [image])
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+        results[str(concurrency)] = dict(summarize(samples), requests_per_second=round(requests / elapsed, 3))
+    return results
+
+
+def batch_benchmark(requests, concurrency_levels, image):
+    """Throughput of the directory batch path (image_editor + batch.run_batch)."""
+    import batch
+    import image_editor
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="nano_banana_bench_")
+    try:
+        input_dir = os.path.join(workdir, "in")
+        os.makedirs(input_dir)
+        for index in range(requests):
+            # Distinct pixels per file so inputs don't share a cache key
+            distinct = image.copy()
+            distinct.putpixel((0, 0), (index % 256, index // 256 % 256, 0))
+            distinct.save(os.path.join(input_dir, f"{index:05d}.png"))
+        for concurrency in concurrency_levels:
+            use_scheduler(concurrency)
+            output_dir = os.path.join(workdir, f"out-{concurrency}")
+            prompt = f"benchmark batch {time.time_ns()}"
+            summary = batch.run_batch(input_dir, output_dir,
+                                      lambda i, o: image_editor.edit_image(i, o, prompt),
+                                      workers=concurrency)
+            results[str(concurrency)] = summary
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def edit_session_benchmark(steps, image):
+    """Image bytes and latency per step of a multi-step edit.
+
+    ``fresh_calls`` chains plain edits, re-preparing the previous result for
+    every call. ``chat_inline`` sends the trimmed chat history as inline
+    bytes; ``chat_files`` (the default) uploads each step once and refers to
+    it afterwards. ``request_bytes_per_step`` is what each model request
+    carries; ``upload_bytes_per_step`` adds the background file uploads.
+    ``retry_request_bytes`` is what re-running the last prompt from the
+    previous step costs (a retry or a new branch).
+    """
+    import core
+    import metrics
+    from edit_session import EditSession, MAX_STEPS
+
+    def counter(name):
+        return metrics.get_registry().counters().get((name, ()), 0)
+
+    def measure(step, session=None):
+        samples, sent = [], []
+        uploaded = counter("nano_banana_file_upload_bytes_total")
+        for index in range(steps):
+            before = counter("nano_banana_bytes_in_total")
+            started = time.perf_counter()
+            step(f"benchmark edit {time.time_ns()} {index}")
+            samples.append(time.perf_counter() - started)
+            sent.append(counter("nano_banana_bytes_in_total") - before)
+        result = dict(summarize(samples), request_bytes_per_step=round(statistics.fmean(sent)))
+        if session is not None:
+            if session.current.file is not None:
+                session.current.file.result()
+            uploaded = counter("nano_banana_file_upload_bytes_total") - uploaded
+            result["upload_bytes_per_step"] = round((sum(sent) + uploaded) / steps)
+            # Same prompt again from the step before: a new branch, sent like a retry
+            session.undo()
+            before = counter("nano_banana_bytes_in_total")
+            session.send(f"benchmark retry {time.time_ns()}")
+            result["retry_request_bytes"] = counter("nano_banana_bytes_in_total") - before
+        else:
+            result["upload_bytes_per_step"] = result["request_bytes_per_step"]
+        return result
+
+    use_scheduler(1)
+    results = {}
+    current = [image]
+
+    def fresh(prompt):
+        current[0] = core.run_operation("edit", prompt, [current[0]]).image
+
+    results["fresh_calls"] = measure(fresh)
+    for name, file_uploads in (("chat_inline", False), ("chat_files", True)):
+        session = EditSession(image, max_steps=max(MAX_STEPS, steps + 2), file_uploads=file_uploads)
+        results[name] = measure(session.send, session)
+    return results
+
+
+def routing_benchmark(requests, concurrency, image, latency, jitter, tail_latency, tail_probability):
+    """Tail latency with and without hedging against a stub with a slow tail.
+
+    ``unhedged`` only routes; ``hedged`` sends a duplicate once a call
+    passes the rolling p90 of the calls before it (twice the normal stub
+    latency until there are enough samples). The slow tail is drawn from a
+    seeded generator, so both runs see about the same slow calls.
+    """
+    import core
+    import router
+
+    install_stub(latency, jitter, tail_latency=tail_latency, tail_probability=tail_probability)
+    use_scheduler(concurrency)
+    normal = latency + jitter
+    results = {}
+    try:
+        for name, options in (("unhedged", dict(hedge_max_ratio=0)),
+                              ("hedged", dict(hedge_quantile=0.9, hedge_min=normal, hedge_default=2 * normal,
+                                              min_samples=10, hedge_burst=concurrency,
+                                              hedge_max_ratio=max(0.1, tail_probability * 2)))):
+            random.seed(0)
+            router._default_router = router.Router(**options)
+            run_id = f"{time.time_ns()}-{name}"
+
+            def one(index):
+                started = time.perf_counter()
+                core.run_operation("edit", f"benchmark {run_id} {index}", [image])
+                return time.perf_counter() - started
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(one, range(requests)))
+            results[name] = dict(summarize(samples), **router._default_router.stats())
+    finally:
+        router._default_router = None
+        install_stub(latency, jitter)
+    return results
+
+
+def cold_start(repeat):
+    """Wall time for fresh interpreter launches of the nano-banana CLI.
+
+    ``python -c pass`` is the floor; ``import core`` is what every command
+    paid before imports were deferred to the subcommand that needs them.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    commands = {
+        "python": [sys.executable, "-c", "pass"],
+        "cli_help": [sys.executable, "cli.py", "--help"],
+        "cli_gen_help": [sys.executable, "cli.py", "gen", "--help"],
+        "import_core": [sys.executable, "-c", "import core"],
+    }
+    results = {}
+    for name, command in commands.items():
+        results[name] = summarize(time_calls(
+            lambda: subprocess.run(command, cwd=root, stdout=subprocess.DEVNULL, check=True), repeat,
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local hot paths against a stub model.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Stub model latency jitter in seconds")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="Slow-tail latency for the routing benchmark")
+    parser.add_argument("--tail-probability", type=float, default=0.05, help="Share of calls in the slow tail")
+    parser.add_argument("--edit-steps", type=int, default=8, help="Steps in the edit session benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="Iterations per microbenchmark")
+    parser.add_argument("--upload-size", type=int, nargs=2, default=[4000, 3000], metavar=("W", "H"))
+    parser.add_argument("--skip", nargs="*", default=[], choices=["micro", "e2e", "batch", "edit_session", "routing", "cold_start"])
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    # Keep benchmark results out of the real cache
+    cache_dir = tempfile.mkdtemp(prefix="nano_banana_bench_cache_")
+    os.environ["NANO_BANANA_CACHE_DIR"] = cache_dir
+    import result_cache
+    result_cache._default_cache = result_cache.ResultCache(cache_dir)
+
+    install_stub(args.latency, args.jitter)
+    image = Image.open(BytesIO(upload_bytes((1024, 768))))
+    image.load()
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stub_latency_s": args.latency,
+        "stub_jitter_s": args.jitter,
+    }
+    try:
+        # Progress prints from the CLI paths go to stderr so stdout stays valid JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            if "micro" not in args.skip:
+                report["micro"] = micro_benchmarks(args.repeat, tuple(args.upload_size))
+            if "e2e" not in args.skip:
+                report["end_to_end"] = end_to_end(args.requests, args.concurrency, image)
+            if "batch" not in args.skip:
+                report["batch"] = batch_benchmark(args.requests, args.concurrency, image)
+            if "edit_session" not in args.skip:
+                report["edit_session"] = edit_session_benchmark(args.edit_steps, image)
+            if "routing" not in args.skip:
+                report["routing"] = routing_benchmark(args.requests * 4, 4, image, args.latency, args.jitter,
+                                                      args.tail_latency, args.tail_probability)
+            if "cold_start" not in args.skip:
+                report["cold_start"] = cold_start(args.repeat)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import time
+import random
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+
+def make_png(size=(1024, 1024), seed=0):
+    """Canned PNG payload roughly the size of a real model response."""
+    rng = random.Random(seed)
+    image = Image.effect_noise(size, 64).convert("RGB")
+    image.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (0, 0, size[0] // 4, size[1] // 4))
+    buf = BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def make_response(payload, mime_type="image/png", text=None):
+    """Build an object shaped like a GenerateContentResponse."""
+    parts = []
+    if text:
+        parts.append(SimpleNamespace(text=text, inline_data=None))
+    if payload:
+        parts.append(SimpleNamespace(text="", inline_data=SimpleNamespace(data=payload, mime_type=mime_type)))
+    candidate = SimpleNamespace(content=SimpleNamespace(parts=parts), finish_reason=0)
+    return SimpleNamespace(candidates=[candidate])
+
+
+class StubModel:
+    """Local stand-in for genai.GenerativeModel.
+
+    Sleeps for ``latency`` (+/- ``jitter``) seconds and returns a canned
+    ``inline_data`` payload, so benchmarks measure this project's overhead
+    without any network time. With ``tail_probability`` a call instead takes
+    ``tail_latency`` seconds, to model a backend's slow tail.
+    """
+
+    def __init__(self, model_name="stub", latency=0.5, jitter=0.0, payload=None, first_chunk_fraction=0.3,
+                 tail_latency=0.0, tail_probability=0.0):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.payload = payload if payload is not None else make_png()
+        self.first_chunk_fraction = first_chunk_fraction
+        self.tail_latency = tail_latency
+        self.tail_probability = tail_probability
+        self.calls = 0
+
+    def _sleep(self, fraction=1.0):
+        latency = self.tail_latency if random.random() < self.tail_probability else self.latency
+        delay = max(0.0, latency + random.uniform(-self.jitter, self.jitter)) * fraction
+        if delay:
+            time.sleep(delay)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        self._sleep()
+        return make_response(self.payload)
+
+    def start_chat(self, history=None):
+        return StubChat(self, history)
+
+    def _stream(self):
+        self._sleep(self.first_chunk_fraction)
+        yield make_response(None, text="Working on it...")
+        self._sleep(1 - self.first_chunk_fraction)
+        yield make_response(self.payload)
+
+
+class StubChat:
+    """Stand-in for genai.ChatSession: sends the history plus the new message."""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+        self.sent = []
+
+    def send_message(self, content, **kwargs):
+        message = {"role": "user", "parts": content if isinstance(content, list) else [content]}
+        self.sent.append(self.history + [message])
+        response = self.model.generate_content(self.history + [message], **kwargs)
+        self.history += [message, {"role": "model", "parts": response.candidates[0].content.parts}]
+        return response
+
+
+def stub_upload_file(path, mime_type=None, **kwargs):
+    """Stand-in for genai.upload_file: reads the upload and returns a File-like reference."""
+    data = path.read() if hasattr(path, "read") else open(path, "rb").read()
+    stub_upload_file.uploads.append(len(data))
+    return SimpleNamespace(name=f"files/stub-{len(stub_upload_file.uploads)}", mime_type=mime_type,
+                           size_bytes=len(data))
+
+
+stub_upload_file.uploads = []
+
+
+def install_stub(latency=0.5, jitter=0.0, payload=None, tail_latency=0.0, tail_probability=0.0):
+    """Swap genai.GenerativeModel for StubModel (and upload_file for a stub) and reset the model cache.
+
+    Returns a factory whose ``models`` list holds every stub created.
+    """
+    import google.generativeai as genai
+    import core
+
+    payload = payload if payload is not None else make_png()
+    models = []
+
+    def factory(model_name, *args, **kwargs):
+        model = StubModel(model_name, latency, jitter, payload,
+                          tail_latency=tail_latency, tail_probability=tail_probability)
+        models.append(model)
+        return model
+
+    factory.models = models
+    genai.GenerativeModel = factory
+    genai.upload_file = stub_upload_file
+    core.get_model.cache_clear()
+    return factory
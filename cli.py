@@ -0,0 +1,314 @@
+"""nano-banana: one command line for generation, editing, restoration and fusion.
+
+    nano-banana gen "a lighthouse at dusk, oil painting" -o lighthouse.png
+    nano-banana edit photo.jpg -p "make it snow" > snowy.png
+    cat old.jpg | nano-banana restore - --tiled > restored.png
+    nano-banana fuse a.png b.png c.png -p "put everyone in one group photo" -o group.png
+    echo "add a rainbow" | nano-banana edit photo.jpg -o rainbow.png
+    nano-banana sweep "a lighthouse, {style}, {lens} lens" -P style=oil,ink -P lens=24mm,85mm
+
+Images are read from paths or ``-`` (stdin) and written to ``-o PATH`` or,
+when stdout is not a terminal, straight to stdout as raw bytes. Prompts come
+from ``-p``, a positional argument (gen) or stdin. Progress and messages go
+to stderr so the output can be piped.
+
+Only argparse is imported up front: the SDK, PIL and the rest of the
+pipeline load when a subcommand actually runs, so ``--help`` and usage
+errors return immediately. ``python -m benchmarks.run --skip micro e2e batch``
+reports the cold-start times.
+"""
+import sys
+import argparse
+
+DEFAULT_OUTPUTS = {
+    "generation": "text_to_image_result.png",
+    "edit": "edited_image_result.png",
+    "restoration": "restored_image_result.png",
+    "fusion": "fused_image_result.png",
+}
+
+
+class CLIError(Exception):
+    pass
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def load_images(paths, full_resolution=False):
+    """Read images from paths; ``-`` reads one image from stdin.
+
+    Each file is checked against the ingest limits from its header and
+    decoded at the size sent to the model unless ``full_resolution``.
+    """
+    import ingest
+    from preprocess import MAX_EDGE
+
+    if paths.count("-") > 1:
+        raise CLIError("Only one image can be read from stdin")
+    images = []
+    max_edge = 0 if full_resolution else MAX_EDGE
+    for path in paths:
+        try:
+            if path == "-":
+                if sys.stdin.isatty():
+                    raise CLIError("Expected image data on stdin")
+                images.append(ingest.open_upload(sys.stdin.buffer.read(), max_edge, key=path))
+            else:
+                images.append(ingest.open_file(path, max_edge))
+        except FileNotFoundError:
+            raise CLIError(f"The file '{path}' was not found.")
+        except ingest.UploadRejected as e:
+            raise CLIError(f"{path}: {e}")
+    return images
+
+
+def resolve_prompt(args, default=None, stdin_free=True):
+    """Prompt from -p or the positional prompt, then piped stdin, then ``default``.
+
+    ``stdin_free`` is False when stdin already carries the input image.
+    """
+    prompt = args.prompt or getattr(args, "prompt_text", None)
+    if not prompt and stdin_free and not sys.stdin.isatty():
+        prompt = sys.stdin.read().strip()
+    prompt = prompt or default
+    if not prompt:
+        raise CLIError("A prompt is required (use -p, or pipe it on stdin)")
+    return prompt
+
+
+def write_result(result, output, operation_type):
+    """Write to ``output``, to stdout when it is piped, or to the default file name."""
+    if result is None:
+        log("No image data found in the response.")
+        return 1
+    if output is None:
+        output = DEFAULT_OUTPUTS[operation_type] if sys.stdout.isatty() else "-"
+    if output == "-":
+        sys.stdout.buffer.write(result.data)
+        sys.stdout.buffer.flush()
+        log(f"Wrote {len(result.data)} bytes ({result.mime_type}) to stdout")
+    else:
+        # Raw bytes when the extension matches; re-encoded otherwise
+        try:
+            result.save(output)
+        except (OSError, ValueError) as e:
+            raise CLIError(e)
+        log(f"Image successfully saved as {output}")
+    return 0
+
+
+def run(operation_type, prompt, images, args):
+    """Run one request and write its image; returns the process exit code."""
+    import core
+    from fusion import FUSION_MAX_INPUTS
+    from operations import model_name_for, run_operation
+
+    notices = []
+    if args.stream and len(images) <= FUSION_MAX_INPUTS:
+        result, timings = core.stream_operation(
+            operation_type, prompt, images, model_name_for(operation_type), notices,
+            on_text=lambda text: print(text, end="", file=sys.stderr, flush=True),
+        )
+        if timings["total"] is not None:
+            log(f"\nFirst chunk after {timings['first_chunk'] or 0:.2f}s, complete after {timings['total']:.2f}s")
+    else:
+        result = run_operation(
+            operation_type, prompt, images, notices,
+            on_intermediate=lambda level, index, _: log(f"Level {level + 1}: merge {index + 1} done"),
+        )
+    for _, message in notices:
+        log(message)
+    return write_result(result, args.output, operation_type)
+
+
+def tile_options(args):
+    from tiling import TILE_OVERLAP, TILE_SIZE, TILE_WORKERS
+    return {
+        "tiled": args.tiled,
+        "tile_size": args.tile_size or TILE_SIZE,
+        "overlap": args.overlap or TILE_OVERLAP,
+        "tile_workers": args.tile_workers or TILE_WORKERS,
+    }
+
+
+def run_batch_command(process, args, output_dir, suffix):
+    """Directory/glob mode for edit and restore (see batch.run_batch)."""
+    import contextlib
+    from batch import DEFAULT_WORKERS, run_batch
+
+    # The script helpers print progress; keep stdout for data
+    with contextlib.redirect_stdout(sys.stderr):
+        summary = run_batch(args.batch, args.output_dir or output_dir, process,
+                            workers=args.workers or DEFAULT_WORKERS, suffix=suffix)
+    return 1 if summary["failed"] else 0
+
+
+def cmd_gen(args):
+    return run("generation", resolve_prompt(args), [], args)
+
+
+def cmd_edit(args):
+    if args.batch:
+        from image_editor import edit_image
+        prompt = resolve_prompt(args)
+        return run_batch_command(lambda i, o: edit_image(i, o, prompt, args.stream),
+                                 args, "edited", "_edited")
+    if not args.input:
+        raise CLIError("An input image is required (a path, or - for stdin)")
+    # A missing prompt fails before the image is read and decoded
+    prompt = resolve_prompt(args, stdin_free=args.input != "-")
+    return run("edit", prompt, load_images([args.input]), args)
+
+
+def cmd_restore(args):
+    from image_restoration import prompt as default_prompt
+    if args.batch:
+        from image_restoration import restore_image
+        prompt = resolve_prompt(args, default_prompt)
+        options = tile_options(args)
+        return run_batch_command(lambda i, o: restore_image(i, o, prompt, args.stream, **options),
+                                 args, "restored", "_restored")
+    if not args.input:
+        raise CLIError("An input image is required (a path, or - for stdin)")
+    prompt = resolve_prompt(args, default_prompt, stdin_free=args.input != "-")
+    images = load_images([args.input], full_resolution=args.tiled)
+    if not args.tiled:
+        return run("restoration", prompt, images, args)
+
+    from operations import model_name_for
+    from tiling import run_tiled_restoration
+    options = tile_options(args)
+    result = run_tiled_restoration(
+        images[0], prompt, model_name_for("restoration"), options["tile_size"], options["overlap"],
+        options["tile_workers"], on_tile=lambda done, total: log(f"Tile {done}/{total} restored"),
+    )
+    return write_result(result, args.output, "restoration")
+
+
+def cmd_fuse(args):
+    from fusion import FUSION_MAX_IMAGES
+    if not 2 <= len(args.inputs) <= FUSION_MAX_IMAGES:
+        raise CLIError(f"Fusion needs 2-{FUSION_MAX_IMAGES} images")
+    prompt = resolve_prompt(args, stdin_free="-" not in args.inputs)
+    return run("fusion", prompt, load_images(args.inputs), args)
+
+
+def cmd_sweep(args):
+    import contextlib
+    from sweep import SWEEP_WORKERS, SHEET_CELL, load_matrix, parse_param, run_sweep
+
+    template = resolve_prompt(args)
+    try:
+        matrix = load_matrix(args.matrix) if args.matrix else {}
+        matrix.update(parse_param(param) for param in args.param or ())
+    except (OSError, ValueError) as e:
+        raise CLIError(e)
+
+    def on_result(record):
+        # One finished file per line on stdout, for shell pipelines
+        if record["output"]:
+            print(record["output"], file=sys.__stdout__, flush=True)
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = run_sweep(template, matrix, args.output_dir, workers=args.workers or SWEEP_WORKERS,
+                                cell=args.cell or SHEET_CELL, on_result=on_result)
+    except ValueError as e:
+        raise CLIError(e)
+    return 1 if summary["failed"] else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="nano-banana", description="Generate, edit, restore and fuse images with Gemini.",
+    )
+    subcommands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    def common(sub):
+        sub.add_argument("-p", "--prompt", help="The prompt (default: read from stdin when piped)")
+        sub.add_argument("-o", "--output",
+                         help="Output file, or - for stdout (default: stdout when piped, else a result file)")
+
+    def streaming(sub):
+        sub.add_argument("--stream", action="store_true",
+                         help="Stream the response and report time to first chunk")
+
+    def batching(sub):
+        sub.add_argument("--batch", metavar="DIR_OR_GLOB",
+                         help="Process every image in a directory or glob pattern")
+        sub.add_argument("--output-dir", help="Where batch outputs and manifest.jsonl are written")
+        sub.add_argument("--workers", type=int, help="Maximum concurrent requests in batch mode")
+
+    gen = subcommands.add_parser("gen", help="Generate an image from text")
+    gen.add_argument("prompt_text", nargs="?", metavar="PROMPT", help="The prompt (or use -p / stdin)")
+    common(gen)
+    streaming(gen)
+    gen.set_defaults(func=cmd_gen)
+
+    edit = subcommands.add_parser("edit", help="Edit an image")
+    edit.add_argument("input", nargs="?", help="Input image path, or - for stdin")
+    common(edit)
+    streaming(edit)
+    batching(edit)
+    edit.set_defaults(func=cmd_edit)
+
+    restore = subcommands.add_parser("restore", help="Restore an old photograph")
+    restore.add_argument("input", nargs="?", help="Input image path, or - for stdin")
+    common(restore)
+    streaming(restore)
+    batching(restore)
+    restore.add_argument("--tiled", action="store_true",
+                         help="Restore large scans at full resolution as overlapping tiles")
+    restore.add_argument("--tile-size", type=int, help="Tile edge in pixels")
+    restore.add_argument("--overlap", type=int, help="Tile overlap in pixels")
+    restore.add_argument("--tile-workers", type=int, help="Maximum tiles restored concurrently")
+    restore.set_defaults(func=cmd_restore)
+
+    fuse = subcommands.add_parser("fuse", help="Fuse two or more images")
+    fuse.add_argument("inputs", nargs="+", metavar="IMAGE", help="Input image paths (one may be -)")
+    common(fuse)
+    streaming(fuse)
+    fuse.set_defaults(func=cmd_fuse)
+
+    sweep = subcommands.add_parser("sweep", help="Generate every combination of a prompt template")
+    sweep.add_argument("prompt_text", nargs="?", metavar="TEMPLATE",
+                       help="Prompt with {name} fields, e.g. 'a fox, {style}, {lens} lens' (or -p / stdin)")
+    sweep.add_argument("-p", "--prompt", help="The prompt template")
+    sweep.add_argument("-P", "--param", action="append", metavar="NAME=V1,V2",
+                       help="Values for one template field (repeatable)")
+    sweep.add_argument("--matrix", metavar="JSON", help='File of {"name": [values, ...]} parameters')
+    sweep.add_argument("--output-dir", default="sweep",
+                       help="Where images, manifest.jsonl and contact_sheet.png are written")
+    sweep.add_argument("--workers", type=int, help="Maximum concurrent requests")
+    sweep.add_argument("--cell", type=int, help="Contact sheet thumbnail size in pixels")
+    sweep.set_defaults(func=cmd_sweep)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # Parsing (and --help) happens before anything heavy is imported
+    import logging
+    import metrics
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(message)s", stream=sys.stderr)
+    try:
+        code = args.func(args)
+    except CLIError as e:
+        log(f"Error: {e}")
+        code = 1
+    except KeyboardInterrupt:
+        code = 130
+    except Exception as e:
+        # API and SDK failures (quota, auth, timeouts) get the same one-line report
+        logging.getLogger("nano_banana.cli").debug("Command failed", exc_info=True)
+        log(f"Error: {type(e).__name__}: {e}")
+        code = 1
+    metrics.log_summary()
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
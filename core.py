@@ -0,0 +1,405 @@
+import os
+import base64
+import logging
+import time
+import threading
+from io import BytesIO
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from image_io import GeneratedImage, sniff_format
+from preprocess import prepare_image
+from result_cache import get_default_cache, make_cache_key
+from router import get_router
+from singleflight import get_single_flight
+
+logger = logging.getLogger("nano_banana.core")
+
+# Model names
+IMAGE_MODEL_NAME = 'gemini-2.5-flash-image-preview'  # Used by the CLI scripts
+IMAGE_GEN_MODEL_NAME = 'imagen-4.0-generate-001'  # Main model for generation in the app
+ANALYSIS_MODEL_NAME = 'gemini-2.5-flash'  # For image analysis in the app
+
+OPERATIONS = ("edit", "restoration", "fusion", "generation")
+MAX_VARIANTS = int(os.getenv("NANO_BANANA_MAX_VARIANTS", "8"))
+# Stream responses by default in the CLI helpers
+STREAM = os.getenv("NANO_BANANA_STREAM", "0") == "1"
+# Per-request timeout handed to the SDK, in seconds
+REQUEST_TIMEOUT = float(os.getenv("NANO_BANANA_REQUEST_TIMEOUT", "120"))
+REQUEST_OPTIONS = {"timeout": REQUEST_TIMEOUT}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure():
+    """Load .env and configure the SDK once per process.
+
+    google.generativeai is imported here rather than at module load so that
+    importing this module (or running ``--help``) stays cheap.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        from dotenv import load_dotenv
+        import google.generativeai as genai
+        load_dotenv()
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _configured = True
+
+
+@lru_cache(maxsize=None)
+def get_model(model_name):
+    """Return the process-wide GenerativeModel for model_name, built on first use."""
+    configure()
+    import google.generativeai as genai
+    return genai.GenerativeModel(model_name)
+
+
+def upload_blob(blob):
+    """Upload an encoded image (see prepare_image) through the Files API.
+
+    The returned File can stand in for the bytes in any later request, so
+    an image that is sent repeatedly is uploaded only once.
+    """
+    configure()
+    import google.generativeai as genai
+    with metrics.span("file_upload"):
+        file = genai.upload_file(BytesIO(blob["data"]), mime_type=blob["mime_type"])
+    metrics.inc("nano_banana_file_upload_bytes_total", len(blob["data"]))
+    return file
+
+
+def _notify(notices, level, message):
+    if notices is not None:
+        notices.append((level, message))
+    else:
+        logger.info(message)
+
+
+def image_from_part(part, notices=None):
+    """Decode one response part into a GeneratedImage, or None if it holds no valid image."""
+    if not (hasattr(part, 'inline_data') and part.inline_data):
+        return None
+    try:
+        image_data = part.inline_data.data
+        logger.debug("Inline data type: %s, length: %s", type(image_data),
+                     len(image_data) if hasattr(image_data, '__len__') else 'N/A')
+        if isinstance(image_data, str):
+            # Base64 string
+            image_data = base64.b64decode(image_data)
+            logger.debug("Decoded data length: %d", len(image_data))
+
+        if len(image_data) < 100:
+            logger.debug("Data too small, content: %r", image_data[:50])
+            return None
+
+        # Check if data starts with valid image headers (PNG, JPEG, GIF, WEBP)
+        if sniff_format(image_data) is None:
+            logger.debug("Invalid image format. First 20 bytes: %r", image_data[:20])
+            return None
+
+        # Keep the original bytes; decoding happens only if a transform needs pixels
+        return GeneratedImage(image_data, part.inline_data.mime_type)
+    except Exception as e:
+        _notify(notices, "error", f"Error decoding image data: {str(e)}")
+        return None
+
+
+def extract_image(response, notices=None):
+    """Return the first valid image in a model response as a GeneratedImage.
+
+    Handles both the raw ``_result`` protobuf and the standard ``candidates``
+    format, base64-encoded string payloads, and PNG/JPEG/GIF/WEBP bytes.
+    When no image is found, user-facing explanations (blocked prompt, model
+    text reply, empty response) are appended to ``notices`` as
+    ``(level, message)`` pairs and None is returned.
+    """
+    try:
+        # Check for direct image in response
+        if hasattr(response, '_result') and hasattr(response._result, 'candidates'):
+            for candidate in response._result.candidates:
+                if hasattr(candidate, 'content'):
+                    for part in candidate.content.parts:
+                        if hasattr(part, 'inline_data') and part.inline_data.data:
+                            return GeneratedImage(part.inline_data.data, part.inline_data.mime_type)
+
+        # Check standard format
+        if hasattr(response, 'candidates') and response.candidates:
+            for candidate in response.candidates:
+                if not (hasattr(candidate, 'content') and candidate.content):
+                    continue
+                for part in candidate.content.parts:
+                    result = image_from_part(part, notices)
+                    if result is not None:
+                        return result
+
+        # Check if request was blocked/filtered
+        if hasattr(response, 'candidates') and response.candidates:
+            candidate = response.candidates[0]
+            if hasattr(candidate, 'finish_reason') and candidate.finish_reason == 1:
+                _notify(notices, "error", "🚫 Image generation was blocked. Try a different, more appropriate prompt.")
+                return None
+
+        # No image found - check for text response
+        try:
+            if hasattr(response, 'text') and response.text:
+                _notify(notices, "info", f"Model response: {response.text}")
+        except Exception:
+            _notify(notices, "warning", "⚠️ No image was generated. The request may have been filtered or the model returned no content.")
+
+        return None
+    except Exception as e:
+        if "finish_reason is 1" in str(e):
+            _notify(notices, "error", "🚫 Image generation was blocked. Try a different, more appropriate prompt.")
+        else:
+            _notify(notices, "error", f"Error processing response: {str(e)}")
+        return None
+
+
+def build_contents(prompt, images, upload_format=None):
+    """Request contents for generate_content: the prompt plus preprocessed images.
+
+    ``upload_format`` overrides prepare_image's default encoding.
+    """
+    if not images:
+        return prompt
+    with metrics.span("upload_encode"):
+        blobs = [prepare_image(img, format=upload_format) for img in images]
+    metrics.inc("nano_banana_bytes_in_total", sum(len(blob["data"]) for blob in blobs))
+    return [prompt, *blobs]
+
+
+def _record_result(operation_type, result):
+    """Count the outcome of one model call and the bytes it returned."""
+    if result is None:
+        metrics.inc("nano_banana_operations_total", operation=operation_type, outcome="no_image")
+        metrics.inc(metrics.ERRORS, stage="parse", type="no_image")
+    else:
+        metrics.inc("nano_banana_operations_total", operation=operation_type, outcome="ok")
+        metrics.inc("nano_banana_bytes_out_total", len(result.data))
+
+
+def run_operation(operation_type, prompt, images=(), model_name=IMAGE_MODEL_NAME, notices=None, variant=0,
+                  upload_format=None):
+    """Run one operation against the model, using the result cache.
+
+    Returns a GeneratedImage or None. API errors are raised; explanations for
+    an empty result are appended to ``notices``. Safe to call from any thread.
+    ``variant`` selects which of several cached results for the same request
+    to use (see iter_variants). Identical requests made while one is already
+    in flight wait for it and share its result or error instead of calling
+    the model again. ``upload_format`` picks how the images are encoded for
+    upload (default preprocess.UPLOAD_FORMAT).
+    """
+    if operation_type not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation_type}'")
+    images = [] if operation_type == "generation" else list(images)
+
+    # Serve repeated requests straight from the result cache
+    cache = get_default_cache()
+    cache_key = make_cache_key(operation_type, model_name, prompt, images, variant)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        metrics.inc("nano_banana_operations_total", operation=operation_type, outcome="cached")
+        return GeneratedImage(cached)
+
+    def call_model():
+        call_notices = []
+        contents = build_contents(prompt, images, upload_format)
+        # The router picks the model(s), hedges slow calls and falls back on errors;
+        # every attempt still goes through the shared rate limiter / retry scheduler
+        with metrics.span("model_call"):
+            response, used_model = get_router().call(
+                operation_type, model_name,
+                lambda name: get_model(name).generate_content(contents, request_options=REQUEST_OPTIONS),
+            )
+        if used_model != model_name:
+            logger.info("%s answered by %s instead of %s", operation_type, used_model, model_name)
+        with metrics.span("parse"):
+            result = extract_image(response, call_notices)
+        _record_result(operation_type, result)
+        if result is not None:
+            cache.put(cache_key, result.data)
+        return result, call_notices
+
+    # The cache key already hashes operation, model, prompt and image bytes
+    result, call_notices = get_single_flight().do(cache_key, call_model)
+    for level, message in call_notices:
+        _notify(notices, level, message)
+    return result
+
+
+def stream_operation(operation_type, prompt, images=(), model_name=IMAGE_MODEL_NAME, notices=None,
+                     on_text=None, on_image=None, variant=0):
+    """Like run_operation, but streams the response with ``stream=True``.
+
+    ``on_text(text)`` is called for each text part as it arrives and
+    ``on_image(result)`` the moment the chunk carrying the image completes,
+    before the rest of the stream is drained. Returns ``(result, timings)``
+    where timings holds ``first_chunk`` (time to first chunk) and ``total``
+    latency in seconds; both are None on a cache hit, and for a caller that
+    joined an identical request already in flight (it gets only the image).
+    ``variant`` selects the cached result as for run_operation.
+    """
+    if operation_type not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation_type}'")
+    images = [] if operation_type == "generation" else list(images)
+    timings = {"first_chunk": None, "total": None}
+
+    cache = get_default_cache()
+    cache_key = make_cache_key(operation_type, model_name, prompt, images, variant)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        metrics.inc("nano_banana_operations_total", operation=operation_type, outcome="cached")
+        result = GeneratedImage(cached)
+        if on_image is not None:
+            on_image(result)
+        return result, timings
+
+    contents = None
+    led = False
+    # Parts already passed to the callbacks. A retried stream starts over from the first
+    # chunk and a hedge streams alongside the primary; only parts past these are emitted
+    emitted = {"text": 0, "image": False}
+    emit_lock = threading.Lock()
+
+    def consume(name):
+        started = time.perf_counter()
+        result = None
+        texts = 0
+        call_notices = []
+        response = get_model(name).generate_content(contents, stream=True, request_options=REQUEST_OPTIONS)
+        for chunk in response:
+            with emit_lock:
+                if timings["first_chunk"] is None:
+                    timings["first_chunk"] = time.perf_counter() - started
+            for candidate in getattr(chunk, 'candidates', None) or ():
+                if not (hasattr(candidate, 'content') and candidate.content):
+                    continue
+                for part in candidate.content.parts:
+                    if getattr(part, 'text', None):
+                        texts += 1
+                        with emit_lock:
+                            fresh = texts > emitted["text"]
+                            if fresh:
+                                emitted["text"] = texts
+                        if fresh and on_text is not None:
+                            on_text(part.text)
+                    elif result is None:
+                        result = image_from_part(part, call_notices)
+                        with emit_lock:
+                            fresh = result is not None and not emitted["image"]
+                            if fresh:
+                                emitted["image"] = True
+                        if fresh and on_image is not None:
+                            on_image(result)
+        timings["total"] = time.perf_counter() - started
+        return result, response, call_notices
+
+    def call_model():
+        nonlocal contents, led
+        led = True
+        # Encoded only by the leader: callers that join it upload nothing
+        contents = build_contents(prompt, images)
+        # Each attempt consumes its whole stream inside its scheduler slot, so concurrency
+        # stays accurate; the router hedges, falls back and keeps latency stats as for run_operation
+        with metrics.span("model_call"):
+            (result, response, call_notices), used_model = get_router().call(operation_type, model_name, consume)
+        if used_model != model_name:
+            logger.info("%s answered by %s instead of %s", operation_type, used_model, model_name)
+        metrics.observe(metrics.STAGE_SECONDS, timings["first_chunk"] or 0.0, stage="first_chunk")
+        logger.info("Streamed %s: first chunk %.2fs, total %.2fs",
+                    operation_type, timings["first_chunk"] or 0.0, timings["total"])
+        if result is None:
+            # The resolved stream carries the finish reason and any text for notices
+            with metrics.span("parse"):
+                result = extract_image(response, call_notices)
+        _record_result(operation_type, result)
+        if result is not None:
+            cache.put(cache_key, result.data)
+        return result, call_notices
+
+    # Shares run_operation's key, so a streamed and a plain request for the same edit coalesce too
+    result, call_notices = get_single_flight().do(cache_key, call_model)
+    for level, message in call_notices:
+        _notify(notices, level, message)
+    if not led and result is not None and on_image is not None:
+        on_image(result)
+    return result, timings
+
+
+def iter_variants(operation_type, prompt, images=(), count=4, model_name=IMAGE_MODEL_NAME):
+    """Request ``count`` variations concurrently and yield them as they arrive.
+
+    Yields ``(index, result, notices, error)`` in completion order, so callers
+    can show each image the moment it lands. The requests run in parallel
+    (still subject to the shared scheduler), so N variants take roughly as
+    long as the slowest single call rather than N calls back to back.
+    """
+    count = max(1, min(count, MAX_VARIANTS))
+
+    def one(index):
+        notices = []
+        result = run_operation(operation_type, prompt, images, model_name, notices, variant=index)
+        return result, notices
+
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="variant") as pool:
+        futures = {pool.submit(one, index): index for index in range(count)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result, notices = future.result()
+            except Exception as e:
+                yield index, None, [], e
+            else:
+                yield index, result, notices, None
+
+
+def save_image_from_response(response, filename):
+    """Helper function to save the image from the API response."""
+    notices = []
+    result = extract_image(response, notices)
+    return save_result(result, filename, notices)
+
+
+def save_result(result, filename, notices=()):
+    """Save a GeneratedImage to filename, printing any notices for the CLI.
+
+    A filename without an extension gets the one matching the model's
+    format. Returns the file name written, or None if there was no image.
+    """
+    for _, message in notices:
+        print(message)
+    if result is None:
+        print("No image data found in the response.")
+        return None
+    if not os.path.splitext(filename)[1]:
+        filename += result.extension
+    # Write the returned bytes directly; only re-encode if the extension asks for another format
+    with metrics.span("save"):
+        result.save(filename)
+    print(f"Image successfully saved as {filename}")
+    return filename
+
+
+def run_to_file(operation_type, prompt, images, filename, model_name=IMAGE_MODEL_NAME, stream=None):
+    """CLI entry point: run an operation and save its image to filename.
+
+    With ``stream`` (default NANO_BANANA_STREAM) text is printed as it
+    arrives and latency is reported as time-to-first-chunk and total.
+    """
+    notices = []
+    if not (STREAM if stream is None else stream):
+        result = run_operation(operation_type, prompt, images, model_name, notices)
+        return save_result(result, filename, notices)
+
+    result, timings = stream_operation(
+        operation_type, prompt, images, model_name, notices,
+        on_text=lambda text: print(text, end="", flush=True),
+    )
+    if timings["total"] is not None:
+        print(f"\nFirst chunk after {timings['first_chunk'] or 0:.2f}s, complete after {timings['total']:.2f}s")
+    return save_result(result, filename, notices)
@@ -0,0 +1,258 @@
+"""Conversational edit sessions: each follow-up builds on the previous result.
+
+An EditSession keeps a timeline of steps, starting from the uploaded image.
+Every prompt ("now make the sky darker", "now add fog") is sent as a new
+message in an SDK chat session whose history is the path from the source
+image to the current step, so the model edits its own last result instead
+of starting over from the original upload.
+
+The API itself is stateless and a chat resends its history on every
+message. So each step's image is uploaded once through the Files API, in
+the background as soon as the step exists, and every later request (the
+next step, retries, hedges, fallbacks, branches) refers to the uploaded
+file instead of carrying the bytes again. If an upload fails, that image
+is sent inline instead.
+
+Every image still costs input tokens, so the history is trimmed before
+each call. It keeps the last HISTORY_TURNS exchanges, and only as many of
+them as HISTORY_IMAGES images allow. The current image is always included.
+Dropped exchanges are not faked: their prompts are listed in a note in
+the first user turn, so the model knows what was already done.
+
+Every result stays in the timeline. Undo and branching just move the
+head to an earlier step, and the next prompt continues from there.
+Repeating a prompt from a step where it was already tried reuses the
+result without calling the model.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from core import IMAGE_MODEL_NAME, REQUEST_OPTIONS, extract_image, get_model, upload_blob
+from image_io import GeneratedImage
+from preprocess import prepare_image
+from result_cache import normalize_prompt
+from router import get_router
+
+logger = logging.getLogger("nano_banana.edit_session")
+
+# Configuration
+# Earlier exchanges (prompt + result) kept in the history sent with each message
+HISTORY_TURNS = int(os.getenv("NANO_BANANA_EDIT_HISTORY_TURNS", "4"))
+# Images in that history; exchanges beyond it are dropped and summarised
+HISTORY_IMAGES = int(os.getenv("NANO_BANANA_EDIT_HISTORY_IMAGES", "1"))
+# Steps one session may hold, including the source image
+MAX_STEPS = int(os.getenv("NANO_BANANA_EDIT_MAX_STEPS", "32"))
+# Upload each step's image once through the Files API and refer to it afterwards
+FILE_UPLOADS = os.getenv("NANO_BANANA_EDIT_FILE_UPLOADS", "1") == "1"
+# Background uploads running at once, across all sessions
+UPLOAD_WORKERS = int(os.getenv("NANO_BANANA_EDIT_UPLOAD_WORKERS", "4"))
+
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+
+def get_upload_pool():
+    """Return the process-wide pool that uploads step images in the background."""
+    global _upload_pool
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(max_workers=max(1, UPLOAD_WORKERS), thread_name_prefix="edit-upload")
+        return _upload_pool
+
+
+class Step:
+    """One point in the timeline: the source image (index 0) or an edit result."""
+
+    __slots__ = ("index", "parent", "prompt", "image", "blob", "file", "created_at")
+
+    def __init__(self, index, parent, prompt, image, blob=None):
+        self.index = index
+        self.parent = parent
+        self.prompt = prompt
+        self.image = image
+        self.blob = blob
+        # Future for the Files API upload, if one was started
+        self.file = None
+        self.created_at = time.time()
+
+    def __repr__(self):
+        return f"Step({self.index}, parent={self.parent}, prompt={self.prompt!r})"
+
+
+class EditSession:
+    """A branching timeline of edits to one source image.
+
+    ``send`` continues from the current head and moves it to the new
+    result. ``undo`` and ``checkout`` move the head back without any model
+    call. Safe to call from a background job while the UI reads the steps.
+    """
+
+    def __init__(self, source, model_name=IMAGE_MODEL_NAME, history_turns=HISTORY_TURNS,
+                 history_images=HISTORY_IMAGES, max_steps=MAX_STEPS, file_uploads=FILE_UPLOADS):
+        self.model_name = model_name
+        self.history_turns = max(0, history_turns)
+        self.history_images = max(0, history_images)
+        self.max_steps = max(2, max_steps)
+        self.file_uploads = file_uploads
+        # The source is encoded for upload once, here, rather than on every step
+        with metrics.span("upload_encode"):
+            blob = prepare_image(source)
+        self.steps = [Step(0, None, None, GeneratedImage(blob["data"], blob["mime_type"]), blob)]
+        self.head = 0
+        self._lock = threading.Lock()
+        self._upload(self.steps[0])
+
+    @property
+    def current(self):
+        return self.steps[self.head]
+
+    def path(self, index=None):
+        """Steps from the source image to ``index`` (default: the head), oldest first."""
+        with self._lock:
+            step = self.steps[self.head if index is None else index]
+            path = [step]
+            while step.parent is not None:
+                step = self.steps[step.parent]
+                path.append(step)
+        return path[::-1]
+
+    def children(self, index):
+        with self._lock:
+            return [step for step in self.steps if step.parent == index]
+
+    def checkout(self, index):
+        """Continue from step ``index``; the next prompt branches off it."""
+        with self._lock:
+            if not 0 <= index < len(self.steps):
+                raise IndexError(f"No step {index} in this session")
+            self.head = index
+            return self.steps[index]
+
+    def undo(self):
+        """Move the head back to its parent step (the source stays put)."""
+        parent = self.current.parent
+        return self.checkout(self.head if parent is None else parent)
+
+    def _blob(self, step):
+        # Results are re-encoded for upload once, the first time they go back to the model
+        if step.blob is None:
+            with metrics.span("upload_encode"):
+                step.blob = prepare_image(step.image.image, original_bytes=len(step.image.data))
+        return step.blob
+
+    def _upload(self, step):
+        # Started as soon as the step exists, so the next prompt usually finds it done
+        if self.file_uploads:
+            step.file = get_upload_pool().submit(lambda: upload_blob(self._blob(step)))
+
+    def _part(self, step):
+        """``(part, inline_bytes)``: the step's uploaded file, or its encoded bytes if there is none."""
+        upload = step.file
+        if upload is not None:
+            try:
+                return upload.result(), 0
+            except Exception as e:
+                logger.warning("Upload of step %d failed, sending it inline: %s", step.index, e)
+                metrics.inc(metrics.ERRORS, stage="upload", type=type(e).__name__)
+                step.file = None
+        blob = self._blob(step)
+        return blob, len(blob["data"])
+
+    def build_contents(self, prompt, head):
+        """``(history, message, inline_bytes)`` for a chat continuing from ``head``.
+
+        The history alternates user prompts and model results along the path
+        to ``head``, trimmed as described in the module docstring.
+        ``inline_bytes`` counts the image bytes sent in the request itself
+        rather than referenced as uploaded files.
+        """
+        path = self.path(head.index)
+        edits = path[1:]
+        recent = edits[len(edits) - self.history_turns:] if self.history_turns else []
+        # Newest first, keep exchanges while their results fit the image budget; the head always fits
+        kept = []
+        budget = self.history_images
+        for step in reversed(recent):
+            if budget <= 0 and step is not head:
+                break
+            kept.insert(0, step)
+            budget -= 1
+
+        inline = 0
+        history = []
+        for step in kept:
+            part, size = self._part(step)
+            inline += size
+            history.append({"role": "user", "parts": [step.prompt]})
+            history.append({"role": "model", "parts": [part]})
+        message = [prompt]
+        # Without history the head goes with the prompt; otherwise the oldest kept edit
+        # gets its input image if there is room, as a plain edit would send it
+        if not kept or budget > 0:
+            part, size = self._part(self.steps[kept[0].parent] if kept else head)
+            inline += size
+            (history[0]["parts"] if kept else message).append(part)
+
+        dropped = edits[:len(edits) - len(kept)]
+        if dropped:
+            note = "Edits already applied to this image, oldest first: " + "; ".join(
+                repr(step.prompt) for step in dropped)
+            (history[0]["parts"] if kept else message).insert(0, note)
+        return history, message, inline
+
+    def _cached_child(self, head, prompt):
+        key = normalize_prompt(prompt)
+        with self._lock:
+            for step in self.steps:
+                if step.parent == head.index and normalize_prompt(step.prompt) == key:
+                    return step
+        return None
+
+    def send(self, prompt, notices=None):
+        """Apply ``prompt`` to the current head and return the new GeneratedImage.
+
+        Returns None (with explanations in ``notices``) if the model sent no
+        image; the head stays where it was. API errors are raised.
+        """
+        head = self.current
+        cached = self._cached_child(head, prompt)
+        if cached is not None:
+            metrics.inc("nano_banana_operations_total", operation="edit_session", outcome="cached")
+            self.checkout(cached.index)
+            return cached.image
+        if len(self.steps) >= self.max_steps:
+            raise ValueError(f"This edit session already has {self.max_steps} steps; start a new one")
+
+        history, message, inline_bytes = self.build_contents(prompt, head)
+        metrics.inc("nano_banana_bytes_in_total", inline_bytes)
+        logger.info("Edit step from %d: %d history turns, %d inline image bytes",
+                    head.index, len(history), inline_bytes)
+
+        def call_model(name):
+            # Chats are rebuilt from the timeline, so undo and branches need no server state
+            chat = get_model(name).start_chat(history=history)
+            return chat.send_message(message, request_options=REQUEST_OPTIONS)
+
+        # Routed like run_operation: hedges, fallbacks and latency stats, each attempt scheduled
+        with metrics.span("model_call"):
+            response, used_model = get_router().call("edit", self.model_name, call_model)
+        if used_model != self.model_name:
+            logger.info("Edit step answered by %s instead of %s", used_model, self.model_name)
+        with metrics.span("parse"):
+            result = extract_image(response, notices)
+        if result is None:
+            metrics.inc("nano_banana_operations_total", operation="edit_session", outcome="no_image")
+            metrics.inc(metrics.ERRORS, stage="parse", type="no_image")
+            return None
+        metrics.inc("nano_banana_operations_total", operation="edit_session", outcome="ok")
+        metrics.inc("nano_banana_bytes_out_total", len(result.data))
+        with self._lock:
+            step = Step(len(self.steps), head.index, prompt, result)
+            self.steps.append(step)
+            self.head = step.index
+        self._upload(step)
+        return result
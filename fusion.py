@@ -0,0 +1,98 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import core
+
+logger = logging.getLogger("nano_banana.fusion")
+
+# Configuration
+# Most images sent in one fusion request; larger sets are reduced pairwise in a tree
+FUSION_MAX_INPUTS = int(os.getenv("NANO_BANANA_FUSION_MAX_INPUTS", "3"))
+# Upper bound on reference images accepted at all
+FUSION_MAX_IMAGES = int(os.getenv("NANO_BANANA_FUSION_MAX_IMAGES", "10"))
+
+INTERMEDIATE_PROMPT_SUFFIX = (
+    " This is an intermediate step that merges a subset of the reference images:"
+    " keep every subject and the key details of both images so later steps can"
+    " combine them with the rest."
+)
+
+
+class FusionError(RuntimeError):
+    """A fusion step came back without an image."""
+
+
+def plan_levels(count, max_inputs=FUSION_MAX_INPUTS):
+    """Group sizes per level of the reduction, e.g. 5 -> [[2, 2, 1], [2, 1], [2]].
+
+    A single level holding every input is returned when ``count`` fits in
+    one request. A trailing single entry is carried to the next level as is.
+    """
+    if count <= max(2, max_inputs):
+        return [[count]]
+    levels = []
+    while count > 1:
+        groups = [2] * (count // 2) + [1] * (count % 2)
+        levels.append(groups)
+        count = len(groups)
+    return levels
+
+
+def fuse_step(images, prompt, model_name, final, notices=None):
+    """One fusion request; intermediate steps get a prompt suffix asking to keep everything."""
+    step_prompt = prompt if final else prompt + INTERMEDIATE_PROMPT_SUFFIX
+    result = core.run_operation("fusion", step_prompt, images, model_name, notices)
+    if result is None:
+        raise FusionError("A fusion step returned no image")
+    return result
+
+
+def fuse_images(images, prompt, model_name=core.IMAGE_MODEL_NAME, max_inputs=FUSION_MAX_INPUTS,
+                notices=None, on_intermediate=None):
+    """Fuse any number of images and return a GeneratedImage.
+
+    Up to ``max_inputs`` images go to the model in a single request. Above
+    that they are merged pairwise in a tree: every pair on a level is fused
+    concurrently (still through the shared scheduler), so latency grows with
+    log2(N) model calls rather than N. ``on_intermediate(level, index,
+    result)`` is called as each intermediate merge completes.
+    """
+    images = list(images)
+    if len(images) < 2:
+        raise ValueError("Fusion needs at least two images")
+    if len(images) > FUSION_MAX_IMAGES:
+        raise ValueError(f"Fusion accepts at most {FUSION_MAX_IMAGES} images")
+    levels = plan_levels(len(images), max_inputs)
+    if len(levels) == 1:
+        return fuse_step(images, prompt, model_name, final=True, notices=notices)
+
+    logger.info("Fusing %d images in %d pairwise levels", len(images), len(levels))
+    current = images
+    for level, groups in enumerate(levels):
+        final = level == len(levels) - 1
+        merged = [None] * len(groups)
+        pairs = {}
+        start = 0
+        for index, size in enumerate(groups):
+            if size == 1:
+                # Odd one out moves up a level untouched
+                merged[index] = current[start]
+            else:
+                pairs[index] = current[start:start + size]
+            start += size
+
+        with ThreadPoolExecutor(max_workers=len(pairs), thread_name_prefix="fusion") as pool:
+            futures = {pool.submit(fuse_step, pair, prompt, model_name, final, notices): index
+                       for index, pair in pairs.items()}
+            for future in as_completed(futures):
+                index = futures[future]
+                result = future.result()
+                if final:
+                    return result
+                if on_intermediate is not None:
+                    on_intermediate(level, index, result)
+                # The next level needs pixels to re-upload
+                merged[index] = result.image
+        current = merged
+    raise FusionError("Fusion tree ended without a final image")
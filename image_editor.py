@@ -1,41 +1,51 @@
-import os
-import google.generativeai as genai
-from PIL import Image
-from io import BytesIO
-from dotenv import load_dotenv
-
-# Configuration
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
+import logging
+import argparse
+import ingest
+from batch import DEFAULT_WORKERS, run_batch
+import metrics
+from core import run_to_file
+from preprocess import MAX_EDGE
 
 # Prompt, Image, and Response Setup
 input_image_path = "input_dog.png"
 prommpt = "Make the dog wear a small wizard hat and spectacles."
 output_filename = "edited_image_result.png"
 
-# saving image helper function from text prompt response
-def save_image_from_response(response, filename):
-    """Helper function to save the image from the API response."""
-    if response.candidates and response.candidates[0].content.parts:
-        for part in response.candidates[0].content.parts:
-            if part.inline_data:
-                image_data = BytesIO(part.inline_data.data)
-                img = Image.open(image_data)
-                img.save(filename)
-                print(f"Image successfully saved as {filename}")
-                return filename
-    print("No image data found in the response.")
-    return None
+def edit_image(input_path, output_path, prompt_text, stream=None):
+    """Run one edit request for input_path and save the result to output_path."""
+    img_to_edit = ingest.open_file(input_path, MAX_EDGE)
+    return run_to_file("edit", prompt_text, [img_to_edit], output_path, stream=stream)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Edit images with Gemini.")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB",
+                        help="Process every image in a directory or glob pattern instead of the single input")
+    parser.add_argument("--output-dir", default="edited",
+                        help="Where batch outputs and manifest.jsonl are written")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Maximum number of concurrent requests in batch mode")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help="Stream the response and report time to first chunk")
+    parser.add_argument("--prompt", default=prommpt, help="Override the default prompt")
+    return parser.parse_args()
 
 def main():
-    print(f"Editing image '{input_image_path}' with prompt: '{prommpt}'...")
+    args = parse_args()
+    if args.batch:
+        run_batch(args.batch, args.output_dir,
+                  lambda i, o: edit_image(i, o, args.prompt, args.stream),
+                  workers=args.workers, suffix="_edited")
+        return
+
+    print(f"Editing image '{input_image_path}' with prompt: '{args.prompt}'...")
     try:
-        img_to_edit = Image.open(input_image_path)
-        response = model.generate_content([prommpt, img_to_edit])
-        save_image_from_response(response, output_filename)
+        edit_image(input_image_path, output_filename, args.prompt, args.stream)
     except FileNotFoundError:
         print(f"Error: The file '{input_image_path}' was not found.")
+    except ingest.UploadRejected as e:
+        print(f"Error: {e}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(message)s")
     main()
+    metrics.log_summary()
@@ -1,13 +1,10 @@
-import os
-import google.generativeai as genai
-from PIL import Image
-from io import BytesIO
-from dotenv import load_dotenv
-
-# Configuration
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
+import logging
+import argparse
+import fusion
+import ingest
+import metrics
+from core import run_to_file, save_result
+from preprocess import MAX_EDGE
 
 # Prompt, Images, and Response Setup
 image1_path = "dog_image.png"
@@ -15,28 +12,44 @@ image2_path = "cap_image.png"
 prompt = "Make the dog from the first image wear the cap from the second image. The cap should fit realistically on the dog's head."
 output_filename = "dog_with_cap_result.png"
 
-def save_image_from_response(response, filename):
-    """Helper function to save the image from the API response."""
-    if response.candidates and response.candidates[0].content.parts:
-        for part in response.candidates[0].content.parts:
-            if part.inline_data:
-                image_data = BytesIO(part.inline_data.data)
-                img = Image.open(image_data)
-                img.save(filename)
-                print(f"Image successfully saved as {filename}")
-                return filename
-    print("No image data found in the response.")
-    return None
+def fuse_images(input_paths, output_path, prompt_text):
+    """Run a fusion over input_paths and save the result to output_path.
+
+    Up to fusion.FUSION_MAX_INPUTS images go in one request; larger sets
+    are reduced pairwise in parallel (see fusion.fuse_images).
+    """
+    images = [ingest.open_file(path, MAX_EDGE) for path in input_paths]
+    if len(images) <= fusion.FUSION_MAX_INPUTS:
+        return run_to_file("fusion", prompt_text, images, output_path)
+    notices = []
+    result = fusion.fuse_images(
+        images, prompt_text, notices=notices,
+        on_intermediate=lambda level, index, _: print(f"Level {level + 1}: merge {index + 1} done"),
+    )
+    return save_result(result, output_path, notices)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fuse two or more images with Gemini.")
+    parser.add_argument("inputs", nargs="*", default=[image1_path, image2_path],
+                        help=f"Reference images to fuse (2-{fusion.FUSION_MAX_IMAGES})")
+    parser.add_argument("--output", default=output_filename, help="Where to save the fused image")
+    parser.add_argument("--prompt", default=prompt, help="Override the default prompt")
+    return parser.parse_args()
 
 def main():
-    print(f"Fusing images '{image1_path}' and '{image2_path}'...")
+    args = parse_args()
+    if len(args.inputs) < 2:
+        print("Error: Fusion needs at least two images.")
+        return
+    print(f"Fusing images {', '.join(repr(path) for path in args.inputs)}...")
     try:
-        img1 = Image.open(image1_path)
-        img2 = Image.open(image2_path)
-        response = model.generate_content([prompt, img1, img2])
-        save_image_from_response(response, output_filename)
-    except FileNotFoundError:
-        print("Error: One or both image files were not found.")
+        fuse_images(args.inputs, args.output, args.prompt)
+    except FileNotFoundError as e:
+        print(f"Error: The file '{e.filename}' was not found.")
+    except ingest.UploadRejected as e:
+        print(f"Error: {e}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(message)s")
     main()
+    metrics.log_summary()
@@ -1,36 +1,31 @@
-import os
-import google.generativeai as genai
-from PIL import Image
-from io import BytesIO
-from dotenv import load_dotenv
-
-# Configuration
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
+import logging
+import argparse
+import metrics
+from core import run_to_file
 
 # Prompt, Image, and Response Setup
 prompt = ""
 output_filename = "text_to_image_result.png"
 
-# saving image helper function from text prompt response
-def save_image_from_response(response, filename):
-    """Helper function to save the image from the API response."""
-    if response.candidates and response.candidates[0].content.parts:
-        for part in response.candidates[0].content.parts:
-            if part.inline_data:
-                image_data = BytesIO(part.inline_data.data)
-                img = Image.open(image_data)
-                img.save(filename)
-                print(f"Image successfully saved as {filename}")
-                return filename
-    print("No image data found in the response.")
-    return None
+def generate_image(output_path, prompt_text):
+    """Run one text-to-image request and save the result to output_path."""
+    return run_to_file("generation", prompt_text, [], output_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate an image from text with Gemini.")
+    parser.add_argument("--prompt", default=prompt, help="The text prompt")
+    parser.add_argument("--output", default=output_filename, help="Where to save the image")
+    return parser.parse_args()
 
 def main():
-    print(f"Generating image for prompt: '{prompt}'...")
-    response = model.generate_content(prompt)
-    save_image_from_response(response, output_filename)
+    args = parse_args()
+    if not args.prompt.strip():
+        print("Error: A prompt is required (use --prompt).")
+        return
+    print(f"Generating image for prompt: '{args.prompt}'...")
+    generate_image(args.output, args.prompt)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(message)s")
     main()
+    metrics.log_summary()
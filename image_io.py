@@ -0,0 +1,134 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import metrics
+
+# Configuration
+ENCODE_WORKERS = int(os.getenv("NANO_BANANA_ENCODE_WORKERS", "2"))
+# Re-encode saved results as optimized PNG/WebP even when the format already matches
+OPTIMIZE_OUTPUT = os.getenv("NANO_BANANA_OPTIMIZE_OUTPUT", "0") == "1"
+
+FORMATS = {
+    "PNG": ("image/png", ".png"),
+    "JPEG": ("image/jpeg", ".jpg"),
+    "WEBP": ("image/webp", ".webp"),
+    "GIF": ("image/gif", ".gif"),
+}
+EXTENSION_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".gif": "GIF"}
+
+_encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+
+
+def sniff_format(data):
+    """Return the PIL format name for encoded image bytes, or None if unknown."""
+    if data.startswith(b"\x89PNG"):
+        return "PNG"
+    if data.startswith(b"\xff\xd8"):
+        return "JPEG"
+    if data.startswith(b"GIF"):
+        return "GIF"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def mime_to_format(mime_type):
+    for format, (mime, _) in FORMATS.items():
+        if mime == mime_type:
+            return format
+    return None
+
+
+class GeneratedImage:
+    """Encoded image bytes as returned by the model, decoded only on demand.
+
+    Keeping the original bytes lets downloads and file saves skip the
+    decode/re-encode round-trip entirely; ``image`` is only materialized when
+    a caller actually needs pixels (for example to rotate).
+    """
+
+    def __init__(self, data, mime_type=None):
+        self.data = bytes(data)
+        self.format = mime_to_format(mime_type) or sniff_format(self.data) or "PNG"
+        self.mime_type = FORMATS[self.format][0]
+        self._image = None
+        self._digest = None
+        # Coalesced calls hand the same instance to several threads
+        self._decode_lock = threading.Lock()
+
+    @property
+    def digest(self):
+        """sha256 of the encoded bytes, used to key derived images."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data).hexdigest()
+        return self._digest
+
+    @property
+    def extension(self):
+        return FORMATS[self.format][1]
+
+    @property
+    def image(self):
+        """The decoded PIL image, decoded once on first access."""
+        if self._image is None:
+            with self._decode_lock:
+                if self._image is None:
+                    with metrics.span("decode"):
+                        image = Image.open(BytesIO(self.data))
+                        image.load()
+                    self._image = image
+        return self._image
+
+    def save(self, filename, format=None, optimize=None):
+        """Write the image to filename.
+
+        The original bytes are written untouched when the requested format
+        (explicit, or inferred from the extension, so ``.webp`` writes WebP
+        and ``.tif`` TIFF) matches what the model returned; otherwise the
+        image is decoded and re-encoded. Only a file without an extension
+        takes the model's format; an extension PIL can't write raises
+        ValueError.
+        """
+        optimize = OPTIMIZE_OUTPUT if optimize is None else optimize
+        ext = os.path.splitext(filename)[1].lower()
+        if format is None and ext:
+            format = EXTENSION_FORMATS.get(ext) or Image.registered_extensions().get(ext)
+            if format is None:
+                raise ValueError(f"Can't tell which image format to write for '{ext}' files")
+        format = (format or self.format).upper()
+        if format == self.format and not optimize:
+            data = self.data
+        else:
+            data = encode_image(self.image, format)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return filename
+
+    def __len__(self):
+        return len(self.data)
+
+
+def encode_image(image, format="PNG"):
+    """Encode a PIL image as WebP or optimized PNG (or any PIL format) bytes."""
+    format = format.upper()
+    buf = BytesIO()
+    with metrics.span("output_encode"):
+        if format == "WEBP":
+            image.save(buf, format="WEBP", quality=95, method=6)
+        elif format == "PNG":
+            image.save(buf, format="PNG", optimize=True)
+        elif format == "JPEG":
+            image.convert("RGB").save(buf, format="JPEG", quality=95, optimize=True)
+        else:
+            image.save(buf, format=format)
+    return buf.getvalue()
+
+
+def encode_in_background(image, format="PNG"):
+    """Encode on the shared encoder pool; returns a Future of the bytes."""
+    return _encode_pool.submit(encode_image, image, format)
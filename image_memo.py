@@ -0,0 +1,151 @@
+import os
+import hashlib
+from io import BytesIO
+
+from PIL import Image
+
+import ingest
+import transforms
+from image_store import get_image_store
+from result_cache import LRUCache
+
+# Configuration
+# Encoded previews only; full-resolution pixels live in the image store
+MEMO_BYTES = int(os.getenv("NANO_BANANA_MEMO_MB", "64")) * 1024 * 1024
+PREVIEW_EDGE = int(os.getenv("NANO_BANANA_PREVIEW_EDGE", "768"))
+
+
+def _sizeof(value):
+    """Approximate memory held by a memoized value."""
+    if isinstance(value, Image.Image):
+        return value.width * value.height * max(1, len(value.getbands()))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 64
+
+
+# Shared by every session in the process: module state survives Streamlit reruns
+_memo = LRUCache(MEMO_BYTES, sizeof=_sizeof)
+_digests = LRUCache(1024 * 64, sizeof=lambda _: 64)
+
+
+def memoize(key, compute):
+    """Return the memoized value for key, computing and storing it on a miss."""
+    value = _memo.get(key)
+    if value is None:
+        value = compute()
+        _memo.put(key, value)
+    return value
+
+
+def upload_digest(uploaded_file):
+    """Content hash of an uploaded file.
+
+    Streamlit hands back the same file_id for an unchanged upload on every
+    rerun, so the bytes are only hashed once per upload.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is not None:
+        digest = _digests.get(file_id)
+        if digest is not None:
+            return digest
+    digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    if file_id is not None:
+        _digests.put(file_id, digest)
+    return digest
+
+
+def _stored(key, compute):
+    """Image from the image store, computing and spilling it on a miss."""
+    store = get_image_store()
+    image = store.get(key)
+    if image is None:
+        image = compute()
+        store.put(key, image)
+    return image
+
+
+def _bytes(data):
+    return data() if callable(data) else data
+
+
+def upload_info(digest, data, record=False):
+    """Header facts for encoded bytes (see ingest.sniff), read once per content hash.
+
+    Raises ingest.UploadRejected for files over the byte or pixel limits.
+    Only the read that accepts a user upload passes ``record`` to count it;
+    previews and model results re-read here are not uploads.
+    """
+    return memoize(("info", digest), lambda: ingest.sniff(_bytes(data), record=record))
+
+
+def source_orientation(digest, data):
+    """EXIF orientation of the encoded image, read from its header only."""
+    return upload_info(digest, data).orientation
+
+
+def orientation_for(digest, data, rotation=0):
+    """EXIF auto-orientation followed by a clockwise rotation, folded into one transpose."""
+    return transforms.fold(source_orientation(digest, data), transforms.from_rotation(rotation))
+
+
+def _store_key(digest, data, max_edge):
+    size = upload_info(digest, data).size
+    return digest if ingest.scaled_size(size, max_edge) == size else f"{digest}-{max_edge}"
+
+
+def decoded(digest, data, max_edge=0):
+    """Decoded PIL image for encoded bytes as stored, decoded once per content hash.
+
+    With ``max_edge`` the pixels are decoded at reduced scale (see
+    ingest.decode) and stored separately from the full-resolution ones.
+    EXIF orientation is not applied here; it is tracked separately so it
+    can be folded with user rotations (see orientation_for).
+    """
+    key = _store_key(digest, data, max_edge)
+    return _stored(key, lambda: ingest.decode(_bytes(data), max_edge, key=digest))
+
+
+def rotated(digest, data, rotation, max_edge=0):
+    """Upright image rotated clockwise by ``rotation`` degrees, full resolution by default.
+
+    Computed on demand with a single lossless transpose; nothing but the
+    decoded source is kept.
+    """
+    return transforms.apply(decoded(digest, data, max_edge), orientation_for(digest, data, rotation))
+
+
+def rotated_handle(digest, data, rotation=0, max_edge=0):
+    """ImageHandle for the upright, rotated image, for keeping in session_state.
+
+    Nothing is decoded here: the store decodes the source (at ``max_edge``,
+    typically the size sent to the model) the first time the handle's image
+    is read, and the transform is applied on top of that.
+    """
+    key = _store_key(digest, data, max_edge)
+    store = get_image_store()
+    handle = store.handle(key)
+    if handle is None:
+        info = upload_info(digest, data)
+        handle = store.defer(key, lambda: ingest.decode(_bytes(data), max_edge, key=digest),
+                             info.mode, ingest.scaled_size(info.size, max_edge))
+    return handle.oriented(orientation_for(digest, data, rotation))
+
+
+def preview(digest, data, rotation=0, max_edge=PREVIEW_EDGE):
+    """Encoded, downsampled preview for display.
+
+    The source is decoded straight at preview size (JPEGs never exist at
+    full resolution in memory) and then transposed, which is far cheaper
+    than transforming the full-resolution pixels first.
+    """
+    def render():
+        thumb = ingest.decode(_bytes(data), max_edge, purpose="preview", key=digest)
+        thumb = transforms.apply(thumb, orientation_for(digest, data, rotation))
+        buf = BytesIO()
+        if thumb.mode in ("RGBA", "LA", "P"):
+            thumb.save(buf, format="PNG")
+        else:
+            thumb.convert("RGB").save(buf, format="JPEG", quality=85)
+        return buf.getvalue()
+    return memoize(("preview", digest, rotation, max_edge), render)
@@ -1,41 +1,73 @@
-import os
-import google.generativeai as genai
-from PIL import Image
-from io import BytesIO
-from dotenv import load_dotenv
-
-# Configuration
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
+import logging
+import argparse
+import ingest
+from batch import DEFAULT_WORKERS, run_batch
+import metrics
+from core import run_to_file, save_result
+from preprocess import MAX_EDGE
+from tiling import TILE_OVERLAP, TILE_SIZE, TILE_WORKERS, run_tiled_restoration
 
 # Prompt, Image, and Response Setup
 input_image_path = "old_photo.png"
-prompt = "Restore this old, faded photograph. Sharpen the details, remove any scratches or damage, and enhance the colors to make it look like a new, 
-high-quality photo."
+prompt = "Restore this old, faded photograph. Sharpen the details, remove any scratches or damage, and enhance the colors to make it look like a new, high-quality photo."
 output_filename = "restored_image_result.png"
 
-def save_image_from_response(response, filename):
-    """Helper function to save the image from the API response."""
-    if response.candidates and response.candidates[0].content.parts:
-        for part in response.candidates[0].content.parts:
-            if part.inline_data:
-                image_data = BytesIO(part.inline_data.data)
-                img = Image.open(image_data)
-                img.save(filename)
-                print(f"Image successfully saved as {filename}")
-                return filename
-    print("No image data found in the response.")
-    return None
+def restore_image(input_path, output_path, prompt_text, stream=None, tiled=False,
+                  tile_size=TILE_SIZE, overlap=TILE_OVERLAP, tile_workers=TILE_WORKERS):
+    """Run one restoration request for input_path and save the result to output_path.
+
+    With ``tiled`` the photo is restored at full resolution as overlapping tiles.
+    """
+    # Only tiled restoration needs more pixels than the model is sent
+    old_photo = ingest.open_file(input_path, 0 if tiled else MAX_EDGE)
+    if tiled:
+        result = run_tiled_restoration(
+            old_photo, prompt_text, tile_size=tile_size, overlap=overlap, workers=tile_workers,
+            on_tile=lambda done, total: print(f"Tile {done}/{total} restored"),
+        )
+        return save_result(result, output_path)
+    return run_to_file("restoration", prompt_text, [old_photo], output_path, stream=stream)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Restore old photographs with Gemini.")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB",
+                        help="Process every image in a directory or glob pattern instead of the single input")
+    parser.add_argument("--output-dir", default="restored",
+                        help="Where batch outputs and manifest.jsonl are written")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Maximum number of concurrent requests in batch mode")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help="Stream the response and report time to first chunk")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Restore large scans at full resolution as overlapping tiles")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="Tile edge in pixels")
+    parser.add_argument("--overlap", type=int, default=TILE_OVERLAP, help="Tile overlap in pixels")
+    parser.add_argument("--tile-workers", type=int, default=TILE_WORKERS,
+                        help="Maximum number of tiles restored concurrently per image")
+    parser.add_argument("--prompt", default=prompt, help="Override the default prompt")
+    return parser.parse_args()
+
+def tile_options(args):
+    return {"tiled": args.tiled, "tile_size": args.tile_size, "overlap": args.overlap,
+            "tile_workers": args.tile_workers}
 
 def main():
+    args = parse_args()
+    if args.batch:
+        run_batch(args.batch, args.output_dir,
+                  lambda i, o: restore_image(i, o, args.prompt, args.stream, **tile_options(args)),
+                  workers=args.workers, suffix="_restored")
+        return
+
     print(f"Attempting to restore image: '{input_image_path}'...")
     try:
-        old_photo = Image.open(input_image_path)
-        response = model.generate_content([prompt, old_photo])
-        save_image_from_response(response, output_filename)
+        restore_image(input_image_path, output_filename, args.prompt, args.stream, **tile_options(args))
     except FileNotFoundError:
         print(f"Error: The file '{input_image_path}' was not found.")
+    except ingest.UploadRejected as e:
+        print(f"Error: {e}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(message)s")
     main()
+    metrics.log_summary()
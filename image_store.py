@@ -0,0 +1,296 @@
+import os
+import mmap
+import time
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+import metrics
+import transforms
+from result_cache import LRUCache
+
+logger = logging.getLogger("nano_banana.image_store")
+
+# Configuration
+# Parent directory for the per-process spill directory (system temp by default)
+STORE_DIR = os.getenv("NANO_BANANA_STORE_DIR") or None
+STORE_MEMORY_BYTES = int(os.getenv("NANO_BANANA_STORE_MEMORY_MB", "256")) * 1024 * 1024
+STORE_DISK_BYTES = int(os.getenv("NANO_BANANA_STORE_DISK_MB", "4096")) * 1024 * 1024
+# Loaders kept for images deferred but not yet decoded (each holds its encoded bytes)
+STORE_MAX_DEFERRED = int(os.getenv("NANO_BANANA_STORE_MAX_DEFERRED", "64"))
+# Sessions idle this long release their images
+SESSION_TTL_SECONDS = int(os.getenv("NANO_BANANA_SESSION_TTL", "1800"))
+
+# Modes PIL can map straight onto a file buffer without copying
+MMAP_MODES = ("L", "RGBA", "RGBX", "CMYK", "I", "F")
+# Modes whose pixels round-trip through raw bytes; anything else (palettes) is saved as PNG
+RAW_MODES = MMAP_MODES + ("1", "LA", "RGB", "I;16")
+
+
+def pixel_bytes(image):
+    """Approximate memory held by a decoded image."""
+    return image.width * image.height * max(1, len(image.getbands()))
+
+
+class ImageHandle:
+    """Lightweight reference to an image in the store, safe to keep in session_state.
+
+    ``orientation`` (EXIF numbering, see transforms) is a pending lossless
+    transpose applied only when ``image`` is read.
+    """
+
+    __slots__ = ("key", "mode", "size", "orientation")
+
+    def __init__(self, key, mode, size, orientation=1):
+        self.key = key
+        self.mode = mode
+        self.size = size
+        self.orientation = orientation
+
+    def oriented(self, orientation):
+        """Handle to the same stored pixels with a different pending transform."""
+        return ImageHandle(self.key, self.mode, self.size, orientation)
+
+    @property
+    def image(self):
+        """The full-resolution image, loaded from memory or the spill file."""
+        image = get_image_store().get(self.key)
+        if image is None:
+            raise LookupError("This image is no longer available; please upload it again.")
+        return transforms.apply(image, self.orientation)
+
+    def __repr__(self):
+        return (f"ImageHandle({self.key!r}, {self.mode}, {self.size[0]}x{self.size[1]}, "
+                f"orientation={self.orientation})")
+
+
+class ImageStore:
+    """Decoded images spilled to a local directory, with memory and disk quotas.
+
+    Every image is written once to ``root`` as raw pixels (PNG for palette
+    modes) and read back memory-mapped where the mode allows it, so the
+    pages belong to the OS page cache rather than to the process heap. A
+    bounded in-memory LRU keeps the hottest images decoded; the spill
+    directory is trimmed least-recently-used first once it passes
+    ``disk_bytes``. Sessions record which keys they reference so their files
+    can be dropped as soon as the session goes away.
+    """
+
+    def __init__(self, root=None, memory_bytes=STORE_MEMORY_BYTES, disk_bytes=STORE_DISK_BYTES,
+                 max_deferred=STORE_MAX_DEFERRED):
+        if STORE_DIR:
+            os.makedirs(STORE_DIR, exist_ok=True)
+        self.root = root or tempfile.mkdtemp(prefix="nano_banana_images_", dir=STORE_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self.disk_bytes = disk_bytes
+        self.max_deferred = max(1, max_deferred)
+        self.memory = LRUCache(memory_bytes, sizeof=pixel_bytes)
+        # key -> (path, mode, size, nbytes), least recently used first
+        self._files = OrderedDict()
+        self._disk_total = 0
+        # session id -> (last seen, keys referenced)
+        self._sessions = {}
+        # key -> loader for images not decoded yet, least recently deferred first
+        self._loaders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key, raw):
+        return os.path.join(self.root, key + (".raw" if raw else ".png"))
+
+    def put(self, key, image):
+        """Store ``image`` under ``key`` (a filename-safe string) and return its handle."""
+        image.load()
+        raw = image.mode in RAW_MODES
+        path = self._path(key, raw)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        if raw:
+            with open(tmp_path, "wb") as f:
+                f.write(image.tobytes())
+        else:
+            image.save(tmp_path, format="PNG")
+        os.replace(tmp_path, path)
+        nbytes = os.path.getsize(path)
+
+        with self._lock:
+            # Materialized: the loader (and the encoded bytes it holds) is no longer needed
+            self._loaders.pop(key, None)
+            previous = self._files.pop(key, None)
+            if previous is not None:
+                self._disk_total -= previous[3]
+            self._files[key] = (path, image.mode, image.size, nbytes)
+            self._disk_total += nbytes
+            evicted = self._evict_locked()
+        for old_path in evicted:
+            self._remove(old_path)
+        if image.mode not in MMAP_MODES:
+            self.memory.put(key, image)
+        return ImageHandle(key, image.mode, image.size)
+
+    def _evict_locked(self):
+        evicted = []
+        while self._disk_total > self.disk_bytes and len(self._files) > 1:
+            key, (path, _, _, nbytes) = self._files.popitem(last=False)
+            self._disk_total -= nbytes
+            self.memory.pop(key)
+            evicted.append(path)
+        if evicted:
+            logger.info("Evicted %d spilled images to stay under the disk quota", len(evicted))
+        return evicted
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Return the image stored under ``key``, or None if it was evicted."""
+        image = self.memory.get(key)
+        with self._lock:
+            entry = self._files.get(key)
+            if entry is not None:
+                self._files.move_to_end(key)
+        if image is not None:
+            return image
+        if entry is None:
+            return self._load(key)
+        path, mode, size, _ = entry
+        try:
+            if path.endswith(".png"):
+                image = Image.open(path)
+                image.load()
+            else:
+                with open(path, "rb") as f:
+                    if mode in MMAP_MODES:
+                        # Zero-copy: the pixels stay in the page cache, not on the heap
+                        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        return Image.frombuffer(mode, size, buffer, "raw", mode, 0, 1)
+                    image = Image.frombytes(mode, size, f.read())
+        except (OSError, ValueError):
+            logger.warning("Spilled image %s could not be read", key)
+            return None
+        self.memory.put(key, image)
+        return image
+
+    def _load(self, key):
+        with self._lock:
+            loader = self._loaders.get(key)
+        if loader is None:
+            return None
+        image = loader()
+        self.put(key, image)
+        return image
+
+    def defer(self, key, loader, mode, size):
+        """Handle for an image that ``loader()`` decodes the first time it is read.
+
+        The loader is dropped once the image is stored. At most
+        ``max_deferred`` loaders are kept; reading a handle whose loader was
+        dropped unread raises LookupError like any evicted image, and the
+        app simply defers it again on its next run.
+        """
+        with self._lock:
+            if key not in self._files:
+                self._loaders[key] = loader
+                self._loaders.move_to_end(key)
+                while len(self._loaders) > self.max_deferred:
+                    self._loaders.popitem(last=False)
+        return ImageHandle(key, mode, size)
+
+    def handle(self, key):
+        """Handle for an existing key, or None."""
+        with self._lock:
+            entry = self._files.get(key)
+        return None if entry is None else ImageHandle(key, entry[1], entry[2])
+
+    def get_or_put(self, key, compute):
+        """Handle for ``key``, storing ``compute()`` first if it isn't present."""
+        handle = self.handle(key)
+        if handle is None:
+            handle = self.put(key, compute())
+        return handle
+
+    def discard(self, key):
+        with self._lock:
+            self._loaders.pop(key, None)
+            entry = self._files.pop(key, None)
+            if entry is not None:
+                self._disk_total -= entry[3]
+        self.memory.pop(key)
+        if entry is not None:
+            self._remove(entry[0])
+
+    def touch_session(self, session_id, keys):
+        """Record the keys a session currently references.
+
+        Keys it referenced last time but no longer does (a replaced upload)
+        are dropped unless another session still holds them.
+        """
+        keys = set(keys)
+        with self._lock:
+            _, dropped = self._sessions.get(session_id, (None, set()))
+            self._sessions[session_id] = (time.monotonic(), keys)
+            dropped = dropped - keys
+            for _, other in self._sessions.values():
+                dropped -= other
+        for key in dropped:
+            self.discard(key)
+
+    def release_session(self, session_id):
+        """Drop the images only this session referenced."""
+        with self._lock:
+            _, keys = self._sessions.pop(session_id, (None, set()))
+            for _, other in self._sessions.values():
+                keys -= other
+        for key in keys:
+            self.discard(key)
+        return len(keys)
+
+    def release_idle_sessions(self, idle_seconds=SESSION_TTL_SECONDS):
+        """Release every session not seen for ``idle_seconds``."""
+        cutoff = time.monotonic() - idle_seconds
+        with self._lock:
+            idle = [sid for sid, (seen, _) in self._sessions.items() if seen < cutoff]
+        released = sum(self.release_session(sid) for sid in idle)
+        if idle:
+            logger.info("Released %d idle sessions (%d images)", len(idle), released)
+        return released
+
+    def stats(self):
+        with self._lock:
+            return {
+                "images": len(self._files),
+                "disk_bytes": self._disk_total,
+                "memory_bytes": self.memory.current_bytes,
+                "sessions": len(self._sessions),
+                "deferred": len(self._loaders),
+            }
+
+    def close(self):
+        """Delete the spill directory."""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """Return the process-wide ImageStore, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ImageStore()
+            # The spill directory is scratch space for this process only
+            atexit.register(_default_store.close)
+        return _default_store
+
+
+metrics.register_collector(
+    "nano_banana_image_store", lambda: _default_store.stats() if _default_store else {}
+)
@@ -0,0 +1,208 @@
+"""Upload ingestion: header checks first, pixels only at the size that is needed.
+
+``sniff`` reads format, dimensions and orientation from the header without
+decoding any pixels and rejects files over the byte or pixel limits, so a
+decompression bomb is refused before it can allocate anything. ``decode``
+then produces pixels at reduced scale where only ``max_edge`` pixels are
+needed: JPEGs are decoded by libjpeg's DCT scaling (draft mode) straight
+to 1/2, 1/4 or 1/8 size, other formats are decoded once and reduced
+immediately. Every decode logs and records its estimated peak memory.
+"""
+import os
+import logging
+import resource
+import warnings
+import threading
+from io import BytesIO
+
+from PIL import Image, UnidentifiedImageError
+
+import metrics
+import transforms
+from result_cache import LRUCache
+
+logger = logging.getLogger("nano_banana.ingest")
+
+# Configuration
+MAX_UPLOAD_BYTES = int(os.getenv("NANO_BANANA_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+MAX_PIXELS = int(float(os.getenv("NANO_BANANA_MAX_MEGAPIXELS", "64")) * 1_000_000)
+ALLOWED_FORMATS = ("JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP", "TIFF")
+
+
+class UploadRejected(ValueError):
+    """An upload refused before decoding; the message is safe to show users."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class UploadInfo:
+    """What the header says about an upload."""
+
+    __slots__ = ("format", "mode", "size", "orientation", "nbytes")
+
+    def __init__(self, format, mode, size, orientation, nbytes):
+        self.format = format
+        self.mode = mode
+        self.size = size
+        self.orientation = orientation
+        self.nbytes = nbytes
+
+    @property
+    def megapixels(self):
+        return self.size[0] * self.size[1] / 1_000_000
+
+    def __repr__(self):
+        return f"UploadInfo({self.format}, {self.mode}, {self.size[0]}x{self.size[1]}, {self.nbytes} bytes)"
+
+
+def _reject(message, reason):
+    logger.info("Rejected upload: %s", message)
+    raise UploadRejected(message, reason)
+
+
+def _count(outcome, reason=""):
+    metrics.inc("nano_banana_uploads_total", outcome=outcome, reason=reason)
+
+
+def _check_size(nbytes):
+    if nbytes > MAX_UPLOAD_BYTES:
+        _reject(f"The file is {nbytes / 1024 / 1024:.1f} MB; the limit is "
+                f"{MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", "bytes")
+
+
+def check_size(nbytes):
+    """Reject an upload by its byte count alone, before it is read."""
+    try:
+        _check_size(nbytes)
+    except UploadRejected as e:
+        _count("rejected", e.reason)
+        raise
+
+
+def _open(data):
+    try:
+        with warnings.catch_warnings():
+            # sniff() enforces MAX_PIXELS itself; PIL's softer warning would only add noise
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            return Image.open(BytesIO(data))
+    except Image.DecompressionBombError:
+        # PIL's own guard fires on absurd headers before ours gets a look
+        _reject(f"The image has more than {MAX_PIXELS / 1_000_000:.0f} megapixels.", "pixels")
+    except (UnidentifiedImageError, OSError):
+        _reject("The file is not a readable image.", "format")
+
+
+def sniff(data, record=True):
+    """Header facts for encoded bytes, raising UploadRejected if over a limit.
+
+    Only the header is parsed; no pixel data is decoded. The outcome is
+    counted in ``nano_banana_uploads_total`` unless ``record`` is false,
+    as for the app re-reading model output it produced itself.
+    """
+    try:
+        info = _sniff(data)
+    except UploadRejected as e:
+        if record:
+            _count("rejected", e.reason)
+        raise
+    if record:
+        _count("accepted")
+    return info
+
+
+def _sniff(data):
+    _check_size(len(data))
+    with metrics.span("sniff"):
+        image = _open(data)
+    if image.format not in ALLOWED_FORMATS:
+        _reject(f"{image.format} images are not supported.", "format")
+    width, height = image.size
+    if width * height > MAX_PIXELS:
+        _reject(f"The image is {width}x{height} ({width * height / 1_000_000:.0f} megapixels); "
+                f"the limit is {MAX_PIXELS / 1_000_000:.0f} megapixels.", "pixels")
+    return UploadInfo(image.format, image.mode, image.size, transforms.exif_orientation(image), len(data))
+
+
+def scaled_size(size, max_edge):
+    """Size of ``size`` fitted inside a ``max_edge`` square, never enlarged."""
+    width, height = size
+    if not max_edge or max(width, height) <= max_edge:
+        return size
+    scale = max_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def decode(data, max_edge=None, purpose="model", key=None):
+    """Decode encoded bytes to a PIL image no larger than ``max_edge`` (0/None: full size).
+
+    EXIF orientation is stripped, not applied; callers track it separately
+    (see image_memo.orientation_for). The estimated peak memory (encoded
+    bytes plus the decode and resize buffers alive at once) is logged,
+    observed as ``nano_banana_decode_peak_bytes{purpose}`` and, with
+    ``key``, remembered for ``peak_bytes(key)``.
+    """
+    with metrics.span("decode"):
+        image = _open(data)
+        target = scaled_size(image.size, max_edge)
+        if target != image.size:
+            # JPEG: the decoder itself scales down; a no-op for other formats
+            image.draft(None, target)
+        image.load()
+        decoded_bytes = _pixel_bytes(image)
+        reduced_bytes = 0
+        if target != image.size:
+            image = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+            reduced_bytes = _pixel_bytes(image)
+    peak = len(data) + decoded_bytes + reduced_bytes
+    metrics.observe("nano_banana_decode_peak_bytes", peak, metrics.BYTE_BUCKETS, purpose=purpose)
+    logger.info("Decoded %s for %s at %dx%d, peak ~%.1f MB",
+                key or "image", purpose, image.width, image.height, peak / 1024 / 1024)
+    if key is not None:
+        _note_peak(key, peak)
+    return transforms.strip_orientation(image)
+
+
+def open_upload(data, max_edge=None, key=None):
+    """Check, decode and orient an upload in one step, for callers without a memo.
+
+    Returns the upright image; raises UploadRejected like ``sniff``.
+    """
+    info = sniff(data)
+    return transforms.apply(decode(data, max_edge, key=key), info.orientation)
+
+
+def open_file(path, max_edge=None):
+    """``open_upload`` for a file on disk; the byte limit is checked before it is read."""
+    check_size(os.path.getsize(path))
+    with open(path, "rb") as f:
+        data = f.read()
+    return open_upload(data, max_edge, key=path)
+
+
+def _pixel_bytes(image):
+    return image.width * image.height * max(1, len(image.getbands()))
+
+
+# Highest decode peak seen per upload key
+_peaks = LRUCache(4096 * 64, sizeof=lambda _: 64)
+_peaks_lock = threading.Lock()
+
+
+def _note_peak(key, nbytes):
+    with _peaks_lock:
+        _peaks.put(key, max(nbytes, _peaks.get(key) or 0))
+
+
+def peak_bytes(key):
+    """Largest estimated decode peak recorded for ``key``, or None."""
+    return _peaks.get(key)
+
+
+def _process_peak_rss():
+    # ru_maxrss is KiB on Linux
+    return {"process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+metrics.register_collector("nano_banana_ingest", _process_peak_rss)
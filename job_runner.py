@@ -0,0 +1,190 @@
+import os
+import logging
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import importlib
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from batch import DEFAULT_WORKERS
+
+# Configuration
+DEFAULT_CHECKPOINT = "jobs.checkpoint.jsonl"
+
+# operation name -> (module, function). Modules are imported on first use so
+# a run that only generates images never configures the other scripts.
+OPERATIONS = {
+    "edit": ("image_editor", "edit_image"),
+    "restoration": ("image_restoration", "restore_image"),
+    "fusion": ("image_fusion", "fuse_images"),
+    "generation": ("image_gen", "generate_image"),
+}
+OPERATION_ALIASES = {"restore": "restoration", "fuse": "fusion", "gen": "generation"}
+
+
+def get_operation(name):
+    """Resolve an operation name to the callable that performs it."""
+    name = OPERATION_ALIASES.get(name, name)
+    if name not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{name}'")
+    module_name, func_name = OPERATIONS[name]
+    return name, getattr(importlib.import_module(module_name), func_name)
+
+
+def job_fingerprint(job):
+    """Stable id for a job without one: a hash of its operation, prompt and inputs.
+
+    Unlike a line number it survives edits to the jobs file, so a resumed run
+    still recognises the jobs it already finished.
+    """
+    operation = str(job.get("operation", ""))
+    inputs = job.get("inputs") or ([job["input"]] if job.get("input") else [])
+    payload = json.dumps([OPERATION_ALIASES.get(operation, operation), job.get("prompt", ""), inputs])
+    return "job-" + hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def iter_jobs(path):
+    """Yield (job_id, job) pairs from a JSONL file one line at a time.
+
+    Lines that are blank are skipped; lines that fail to parse are yielded
+    with a None job so they show up as errors in the results. Jobs without
+    an id get job_fingerprint.
+    """
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError:
+                yield f"line-{line_number}", None
+                continue
+            job_id = str(job.get("id") or job.get("request_id") or job_fingerprint(job))
+            yield job_id, job
+
+
+def load_checkpoint(path):
+    """Return the ids of jobs that already finished successfully."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a torn final line behind
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def run_job(job_id, job):
+    """Execute a single job and return its result record."""
+    started = time.perf_counter()
+    record = {"id": job_id, "operation": None, "output": None, "status": "error", "error": None}
+    try:
+        if job is None:
+            raise ValueError("Malformed JSON line")
+        operation, func = get_operation(job.get("operation", ""))
+        record["operation"] = operation
+        prompt = job.get("prompt", "")
+        inputs = job.get("inputs") or ([job["input"]] if job.get("input") else [])
+        output = job.get("output") or f"{job_id}.png"
+
+        if operation == "generation":
+            result = func(output, prompt)
+        elif operation == "fusion":
+            if len(inputs) < 2:
+                raise ValueError("Fusion needs at least two inputs")
+            result = func(inputs, output, prompt)
+        else:
+            if len(inputs) != 1:
+                raise ValueError(f"{operation} needs exactly one input")
+            result = func(inputs[0], output, prompt)
+
+        if result:
+            record["status"] = "ok"
+            record["output"] = result
+        else:
+            record["error"] = "No image data found in the response."
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["latency"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def run_jobs(jobs_path, checkpoint_path=DEFAULT_CHECKPOINT, workers=DEFAULT_WORKERS, out=sys.stdout):
+    """Stream jobs from jobs_path through a bounded worker pool.
+
+    At most ``workers`` jobs run at once and at most ``2 * workers`` are read
+    ahead of them, so memory stays flat regardless of file size. Every
+    result is appended to the checkpoint and written as one JSON line to
+    ``out``. Jobs already marked ok in the checkpoint are skipped.
+    """
+    done = load_checkpoint(checkpoint_path)
+    slots = threading.BoundedSemaphore(max(1, workers) * 2)
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+
+    checkpoint = open(checkpoint_path, "a")
+
+    def finish(record):
+        line = json.dumps(record)
+        with write_lock:
+            checkpoint.write(line + "\n")
+            checkpoint.flush()
+            out.write(line + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+        slots.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for job_id, job in iter_jobs(jobs_path):
+                if job_id in done:
+                    counts["skipped"] += 1
+                    continue
+                slots.acquire()
+                future = pool.submit(run_job, job_id, job)
+                future.add_done_callback(lambda f: finish(f.result()))
+    finally:
+        checkpoint.close()
+
+    print(f"Jobs finished: {counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped.",
+          file=sys.stderr)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run image jobs from a JSONL file.")
+    parser.add_argument("jobs", nargs="?", default="requests.jsonl",
+                        help="JSONL file with one job per line: operation, prompt, inputs, output")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT,
+                        help="JSONL checkpoint used to resume an interrupted run")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Maximum number of jobs running at once")
+    parser.add_argument("--output", help="Write result JSONL here instead of stdout")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "a") as out:
+            run_jobs(args.jobs, args.checkpoint, args.workers, out)
+    else:
+        # Keep stdout clean for the result stream; progress prints go to stderr
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            run_jobs(args.jobs, args.checkpoint, args.workers, out)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=metrics.LOG_LEVEL, format="%(message)s")
+    main()
+    metrics.log_summary()
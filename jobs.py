@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import shared_store
+
+logger = logging.getLogger("nano_banana.jobs")
+
+# Configuration
+MAX_CONCURRENT_JOBS = int(os.getenv("NANO_BANANA_MAX_CONCURRENT_JOBS", "4"))
+# Finished jobs are forgotten after this many seconds
+JOB_TTL_SECONDS = int(os.getenv("NANO_BANANA_JOB_TTL", "900"))
+# Unfinished jobs stay visible to other replicas this long, in case their node dies
+UNFINISHED_JOB_TTL_SECONDS = int(os.getenv("NANO_BANANA_UNFINISHED_JOB_TTL", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """State of one submitted unit of work."""
+
+    def __init__(self, job_id, description=""):
+        self.id = job_id
+        self.description = description
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def elapsed(self):
+        """Seconds since the job started running (or was queued, if it hasn't)."""
+        end = self.finished_at or time.time()
+        return end - (self.started_at or self.submitted_at)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "description": self.description,
+            "status": self.status,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_record(cls, record, store):
+        """A job running (or finished) on another replica, from its shared record."""
+        job = cls(record["id"], record["description"])
+        for field in ("status", "error", "submitted_at", "started_at", "finished_at"):
+            setattr(job, field, record[field])
+        if "result" in record:
+            job.result = shared_store.decode(store, record["result"])
+        return job
+
+
+class JobQueue:
+    """Bounded background executor shared by every session in the process.
+
+    ``submit`` returns immediately with a job id; callers poll ``get`` for the
+    status. At most ``max_workers`` jobs run at once across all sessions and
+    the rest wait in the executor's queue, so a burst of users cannot pile
+    up unbounded threads.
+
+    With a ``store`` every state change is also published there, so any
+    replica can ``get``, ``cancel`` or ``forget`` a job by id; the result is
+    shared once the job is done. Jobs always run on the replica that
+    accepted them.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, ttl=JOB_TTL_SECONDS, store=None):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, description="", **kwargs):
+        """Queue ``fn(*args, **kwargs)`` and return the new job id."""
+        job = Job(uuid.uuid4().hex, description)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._publish(job)
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        if self._cancelled_elsewhere(job):
+            return
+        with self._lock:
+            if job.status == CANCELLED:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        self._publish(job)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                if job.status != CANCELLED:
+                    job.status = FAILED
+                    job.error = str(e) or type(e).__name__
+                job.finished_at = time.time()
+            self._publish(job)
+            return
+        cancelled_elsewhere = self._cancelled_elsewhere(job)
+        with self._lock:
+            # A job cancelled while running still occupies its worker until
+            # the call returns; its result is simply discarded.
+            if job.status != CANCELLED and not cancelled_elsewhere:
+                job.status = DONE
+                job.result = result
+            job.finished_at = time.time()
+        self._publish(job)
+
+    def _publish(self, job):
+        """Mirror the job's state (and, once done, its result) to the shared store."""
+        if self.store is None:
+            return
+        record = job.to_dict()
+        try:
+            if job.status == DONE:
+                record["result"] = shared_store.encode(self.store, job.result)
+            self.store.put_json("job", job.id, record,
+                                self.ttl if job.finished else UNFINISHED_JOB_TTL_SECONDS)
+        except Exception:
+            # Other replicas just won't see this update; the local job is unaffected
+            logger.exception("Could not publish job %s", job.id)
+
+    def _cancelled_elsewhere(self, job):
+        if self.store is None:
+            return False
+        if job.status == CANCELLED:
+            return True
+        record = self.store.get_json("job", job.id)
+        if record is not None and record["status"] == CANCELLED:
+            with self._lock:
+                job.status = CANCELLED
+                job.finished_at = record["finished_at"]
+            return True
+        return False
+
+    def get(self, job_id):
+        """The job, whichever replica it runs on, or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        record = self.store.get_json("job", job_id)
+        return None if record is None else Job.from_record(record, self.store)
+
+    def cancel(self, job_id):
+        """Cancel a job. Returns False if it already finished or is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job.finished:
+                    return False
+                job.status = CANCELLED
+                job.finished_at = time.time()
+        if job is None:
+            # Running elsewhere: its node discards the result when it sees the flag
+            job = self.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        self._publish(job)
+        if job.future is not None:
+            job.future.cancel()
+        return True
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        if self.store is not None:
+            self.store.delete("job", job_id)
+
+    def stats(self):
+        """Counts of jobs by status plus the configured concurrency limit."""
+        with self._lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts["max_workers"] = self.max_workers
+        return counts
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide JobQueue, creating it on first use."""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            # Jobs are mirrored only when replicas share a configured store; a single
+            # replica keeps them (and their result images) in process
+            store = shared_store.get_shared_store() if shared_store.SHARED_STORE_URL else None
+            _default_queue = JobQueue(store=store)
+        return _default_queue
+
+
+metrics.register_collector(
+    "nano_banana_jobs", lambda: _default_queue.stats() if _default_queue else {}
+)
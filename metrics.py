@@ -0,0 +1,262 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("nano_banana.metrics")
+
+# Configuration
+# Port for the Prometheus /metrics endpoint; 0 disables it
+METRICS_PORT = int(os.getenv("NANO_BANANA_METRICS_PORT", "9464"))
+METRICS_ADDRESS = os.getenv("NANO_BANANA_METRICS_ADDRESS", "0.0.0.0")
+# DEBUG logs every stage timing and a per-stage summary when a CLI run ends
+LOG_LEVEL = os.getenv("NANO_BANANA_LOG_LEVEL", "INFO").upper()
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTE_BUCKETS = tuple(2 ** power for power in range(16, 33, 2))  # 64 KiB .. 4 GiB
+
+STAGE_SECONDS = "nano_banana_stage_seconds"
+ERRORS = "nano_banana_errors_total"
+
+DESCRIPTIONS = {
+    STAGE_SECONDS: "Time spent in each processing stage",
+    ERRORS: "Errors by stage and exception type",
+    "nano_banana_operations_total": "Operations by type and outcome",
+    "nano_banana_bytes_in_total": "Image bytes uploaded to the model",
+    "nano_banana_bytes_out_total": "Image bytes received from the model",
+    "nano_banana_cache_requests_total": "Result cache lookups by outcome",
+    "nano_banana_coalesced_calls_total": "Model calls saved by joining an identical in-flight request",
+    "nano_banana_uploads_total": "Uploaded images by outcome and rejection reason",
+    "nano_banana_decode_peak_bytes": "Estimated peak memory of one image decode, by purpose",
+    "nano_banana_model_latency_seconds": "Latency of each model call attempt, by operation, model and outcome",
+    "nano_banana_routed_seconds": "Latency of routed requests, hedges and fallbacks included",
+    "nano_banana_route_attempts_total": "Model call attempts by role (primary, hedge, fallback)",
+    "nano_banana_route_wins_total": "Routed requests by the model and role whose answer was used",
+    "nano_banana_route_demotions_total": "Requests routed away from a model with a high recent error rate",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style (latency buckets by default)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def quantile(self, q):
+        """Bucket upper bound holding the ``q`` quantile (a coarse estimate)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= target:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """Thread-safe counters and histograms, rendered in Prometheus text format.
+
+    Collectors registered with ``register_collector`` are called at scrape
+    time and their numeric values exported as gauges, so components that
+    already keep stats (the scheduler, the job queue) don't need to mirror
+    them here.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def register_collector(self, prefix, collect):
+        """Export ``collect()``'s numeric dict values as ``<prefix>_<key>`` gauges."""
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def counters(self):
+        with self._lock:
+            return {key: value for key, value in self._counters.items()}
+
+    def stages(self):
+        """Per-stage summary: count, total and mean seconds, approximate p95."""
+        with self._lock:
+            return {
+                dict(labels).get("stage", ""): {
+                    "count": h.count,
+                    "total_s": h.sum,
+                    "mean_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                }
+                for (name, labels), h in sorted(self._histograms.items())
+                if name == STAGE_SECONDS
+            }
+
+    def gauges(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        gauges = {}
+        for prefix, collect in collectors:
+            try:
+                values = collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", prefix)
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{prefix}_{key}"] = value
+        return gauges
+
+    def render(self):
+        """The registry in Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.sum, h.buckets))
+                                for key, h in self._histograms.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (counts, count, total, buckets) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = Registry()
+
+
+def get_registry():
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    _registry.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    _registry.observe(name, value, buckets, **labels)
+
+
+def register_collector(prefix, collect):
+    _registry.register_collector(prefix, collect)
+
+
+@contextmanager
+def span(stage):
+    """Time a processing stage; exceptions are counted by type and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        inc(ERRORS, stage=stage, type=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(STAGE_SECONDS, elapsed, stage=stage)
+        logger.debug("%s took %.1f ms", stage, elapsed * 1000)
+
+
+def log_summary(level=logging.DEBUG):
+    """Log per-stage totals, e.g. at the end of a CLI run."""
+    for stage, summary in _registry.stages().items():
+        logger.log(level, "%-14s %4d calls, %8.1f ms mean, %8.2f s total",
+                   stage, summary["count"], summary["mean_ms"], summary["total_s"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = _registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics scrape: " + format, *args)
+
+
+_server = None
+_server_attempted = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, address=METRICS_ADDRESS):
+    """Serve /metrics on a daemon thread, once per process.
+
+    Returns the server, or None when disabled (port 0) or the port is taken,
+    e.g. by another process on the same host.
+    """
+    global _server, _server_attempted
+    with _server_lock:
+        if _server_attempted or not port:
+            return _server
+        _server_attempted = True
+        try:
+            _server = ThreadingHTTPServer((address, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on port %d: %s", port, e)
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        logger.info("Serving Prometheus metrics on http://%s:%d/metrics", address, port)
+        return _server
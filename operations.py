@@ -0,0 +1,39 @@
+import core
+from core import ANALYSIS_MODEL_NAME, IMAGE_GEN_MODEL_NAME
+from fusion import FUSION_MAX_IMAGES, FUSION_MAX_INPUTS, fuse_images
+from tiling import run_tiled_restoration
+
+# The app-facing operations shared by the Streamlit UI and the HTTP API.
+
+
+def model_name_for(operation_type):
+    return IMAGE_GEN_MODEL_NAME if operation_type == "generation" else ANALYSIS_MODEL_NAME
+
+
+def check_inputs(operation_type, images):
+    """Raise ValueError unless ``images`` is the right number of inputs for the operation."""
+    if operation_type not in core.OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation_type}'")
+    count = len(images)
+    if operation_type == "generation" and count:
+        raise ValueError("Generation takes no input images")
+    if operation_type in ("edit", "restoration") and count != 1:
+        raise ValueError(f"{operation_type} needs exactly one image")
+    if operation_type == "fusion" and not 2 <= count <= FUSION_MAX_IMAGES:
+        raise ValueError(f"Fusion needs 2-{FUSION_MAX_IMAGES} images")
+
+
+def run_operation(operation_type, prompt, images, notices=None, tiled=False, on_tile=None,
+                  on_intermediate=None):
+    """Run one operation on the app's models and return a GeneratedImage or None.
+
+    Restorations with ``tiled`` go through tiling.run_tiled_restoration and
+    fusions of more than FUSION_MAX_INPUTS images through the fusion tree;
+    everything else is a single core.run_operation call.
+    """
+    model_name = model_name_for(operation_type)
+    if tiled and operation_type == "restoration":
+        return run_tiled_restoration(images[0], prompt, model_name, on_tile=on_tile)
+    if operation_type == "fusion" and len(images) > FUSION_MAX_INPUTS:
+        return fuse_images(images, prompt, model_name, notices=notices, on_intermediate=on_intermediate)
+    return core.run_operation(operation_type, prompt, images, model_name, notices)
@@ -0,0 +1,86 @@
+import os
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("nano_banana.preprocess")
+
+# Configuration
+# Longest edge sent to the model; 0 disables downscaling.
+MAX_EDGE = int(os.getenv("NANO_BANANA_UPLOAD_MAX_EDGE", "2048"))
+# JPEG encodes an order of magnitude faster than WEBP for similar bytes (see
+# benchmarks/run.py); images with alpha fall back to WEBP. PNG is also accepted.
+UPLOAD_FORMAT = os.getenv("NANO_BANANA_UPLOAD_FORMAT", "JPEG").upper()
+UPLOAD_QUALITY = int(os.getenv("NANO_BANANA_UPLOAD_QUALITY", "90"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def estimate_original_bytes(image):
+    """Encoded size of an untouched image, from its file or buffer, or None if unknown."""
+    filename = getattr(image, "filename", None)
+    if filename and os.path.isfile(filename):
+        return os.path.getsize(filename)
+    fp = getattr(image, "fp", None)
+    if fp is not None and hasattr(fp, "getbuffer"):
+        return fp.getbuffer().nbytes
+    if fp is not None and hasattr(fp, "size") and isinstance(fp.size, int):
+        # Streamlit's UploadedFile exposes its byte size directly
+        return fp.size
+    return None
+
+
+def prepare_image(image, max_edge=None, format=None, quality=None, original_bytes=None):
+    """Downscale, strip metadata and re-encode an image before upload.
+
+    Returns a blob dict ({"mime_type", "data"}) that generate_content accepts
+    in place of a PIL image, so the bytes on the wire are exactly the ones
+    produced here. ``original_bytes`` is the encoded size the image came
+    from, when the caller knows it; the savings are logged only if it is
+    known or can be read off the image's file.
+    """
+    max_edge = MAX_EDGE if max_edge is None else max_edge
+    format = (format or UPLOAD_FORMAT).upper()
+    quality = UPLOAD_QUALITY if quality is None else quality
+    if format not in MIME_TYPES:
+        raise ValueError(f"Unsupported upload format '{format}'")
+
+    if original_bytes is None:
+        original_bytes = estimate_original_bytes(image)
+
+    # Bake in the EXIF orientation before the metadata is dropped
+    img = ImageOps.exif_transpose(image)
+    if max_edge and max(img.size) > max_edge:
+        img = img.copy()
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if format == "JPEG" and has_alpha:
+        # JPEG has no alpha channel; keep transparency by falling back to WEBP
+        format = "WEBP"
+    if format == "JPEG":
+        img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    buf = BytesIO()
+    # No exif/icc_profile arguments: metadata is stripped on re-encode
+    if format == "PNG":
+        img.save(buf, format="PNG", optimize=True)
+    elif format == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    data = buf.getvalue()
+
+    if original_bytes is None:
+        logger.info("Upload preprocessing: %dx%d -> %dx%d %s, %d bytes",
+                    image.width, image.height, img.width, img.height, format, len(data))
+    else:
+        logger.info(
+            "Upload preprocessing: %dx%d -> %dx%d %s, %d -> %d bytes (saved %d bytes)",
+            image.width, image.height, img.width, img.height, format,
+            original_bytes, len(data), original_bytes - len(data),
+        )
+    return {"mime_type": MIME_TYPES[format], "data": data}
@@ -0,0 +1,259 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+import metrics
+
+# Configuration
+DEFAULT_CACHE_DIR = os.getenv("NANO_BANANA_CACHE_DIR", os.path.join(".cache", "results"))
+DEFAULT_MEMORY_BYTES = int(os.getenv("NANO_BANANA_CACHE_MEMORY_MB", "64")) * 1024 * 1024
+DEFAULT_DISK_BYTES = int(os.getenv("NANO_BANANA_CACHE_DISK_MB", "1024")) * 1024 * 1024
+# Lifetime of entries kept in a shared (Redis) store; its own eviction policy applies too
+SHARED_CACHE_TTL = int(os.getenv("NANO_BANANA_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def hash_image(image):
+    """Return a stable sha256 hex digest for an input image.
+
+    Accepts raw bytes, a blob dict ({"mime_type", "data"}) or a PIL image.
+    PIL images are hashed on their decoded pixels so the same picture hashes
+    the same whether it came from an upload or from disk.
+    """
+    digest = hashlib.sha256()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        digest.update(bytes(image))
+    elif isinstance(image, dict) and "data" in image:
+        digest.update(image.get("mime_type", "").encode())
+        digest.update(bytes(image["data"]))
+    elif isinstance(image, Image.Image):
+        digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+        digest.update(image.tobytes())
+    else:
+        raise TypeError(f"Cannot hash image of type {type(image).__name__}")
+    return digest.hexdigest()
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so trivially different prompts share a key.
+
+    Case is kept: the model can render it ("a sign saying OPEN").
+    """
+    return " ".join((prompt or "").split())
+
+
+def make_cache_key(operation, model_name, prompt, images=(), variant=0):
+    """Build the content address for one request.
+
+    The key covers the operation type, model name, normalized prompt and the
+    hash of every input image in order (so both fusion inputs are included).
+    ``variant`` distinguishes otherwise identical requests made to get
+    several different results for the same prompt.
+    """
+    digest = hashlib.sha256()
+    if variant:
+        digest.update(f"variant:{variant}".encode())
+        digest.update(b"\0")
+    for field in (operation, model_name, normalize_prompt(prompt)):
+        digest.update(field.encode())
+        digest.update(b"\0")
+    for image in images or ():
+        if image is not None:
+            digest.update(hash_image(image).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU bounded by the total size of its values."""
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self.sizeof(self._items.pop(key))
+            self._items[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= self.sizeof(evicted)
+
+    def pop(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self.current_bytes -= self.sizeof(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+class ResultCache:
+    """Two-tier cache for generated images: in-process LRU in front of a disk store.
+
+    Values are the encoded image bytes returned by the model. The disk tier
+    keeps one file per key and evicts the least recently used files once the
+    directory grows past ``disk_bytes``. With ``store`` (a shared_store
+    backend) the second tier lives there instead, so replicas share hits.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_bytes=DEFAULT_MEMORY_BYTES,
+                 disk_bytes=DEFAULT_DISK_BYTES, store=None):
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+        self.store = store
+        self.memory = LRUCache(memory_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._disk_lock = threading.Lock()
+        # Running estimate of the disk tier size; None until the first scan
+        self._disk_total = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """Return the cached bytes for ``key`` or None."""
+        data = self.memory.get(key)
+        if data is not None:
+            self.hits += 1
+            metrics.inc("nano_banana_cache_requests_total", result="hit", tier="memory")
+            return data
+        if self.store is not None:
+            return self._get_shared(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Bump mtime so disk eviction treats the entry as recently used
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            metrics.inc("nano_banana_cache_requests_total", result="miss")
+            return None
+        self.memory.put(key, data)
+        self.hits += 1
+        metrics.inc("nano_banana_cache_requests_total", result="hit", tier="disk")
+        return data
+
+    def _get_shared(self, key):
+        data = self.store.get("cache", key)
+        if data is None:
+            self.misses += 1
+            metrics.inc("nano_banana_cache_requests_total", result="miss")
+            return None
+        self.memory.put(key, data)
+        self.hits += 1
+        metrics.inc("nano_banana_cache_requests_total", result="hit", tier="shared")
+        return data
+
+    def put(self, key, data):
+        """Store ``data`` under ``key`` in both tiers."""
+        data = bytes(data)
+        self.memory.put(key, data)
+        if self.store is not None:
+            self.store.put("cache", key, data, SHARED_CACHE_TTL)
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._disk_lock:
+            try:
+                # Overwriting a key replaces its file, so only the difference is new
+                previous = os.path.getsize(path)
+            except OSError:
+                previous = 0
+            os.replace(tmp_path, path)
+            if self._disk_total is not None:
+                self._disk_total += len(data) - previous
+        if self._disk_total is None or self._disk_total > self.disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        with self._disk_lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total <= self.disk_bytes:
+                self._disk_total = total
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.memory.pop(os.path.basename(path))
+            self._disk_total = total
+
+    def clear(self):
+        self.memory.clear()
+        with self._disk_lock:
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except OSError:
+                        pass
+            self._disk_total = 0
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Return the process-wide ResultCache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            import shared_store
+            store = shared_store.get_shared_store() if shared_store.SHARED_STORE_URL else None
+            # Replicas on one host already share the cache directory; only a networked store replaces it
+            _default_cache = ResultCache(store=store if store is not None and store.shared else None)
+        return _default_cache
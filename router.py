@@ -0,0 +1,349 @@
+"""Latency-aware model routing with hedged requests and fallbacks.
+
+Each operation has a list of candidate models: the model the caller asked
+for, then NANO_BANANA_ROUTE_<OPERATION> (comma separated), which by default
+is the image preview model. For every (operation, model) pair the router
+keeps a rolling window of call latencies and errors, and uses it in three
+ways:
+
+- Models whose recent error rate is above ERROR_RATE_THRESHOLD move to the
+  back of the list. Their samples age out after WINDOW_SECONDS, so they
+  get traffic again once they have had time to recover.
+- A request still running after the latency budget (the primary model's
+  rolling HEDGE_QUANTILE, or a fixed NANO_BANANA_HEDGE_AFTER_SECONDS) gets
+  a hedge. The hedge goes to the next candidate when that model's rolling
+  median is faster, otherwise it duplicates the request on the same model.
+  Hedges are capped at HEDGE_MAX_RATIO of requests, so a slow backend
+  doesn't double the load on it.
+- A request whose every attempt failed with a retryable error (throttling,
+  a server error or a timeout) falls back to the next candidate. Any other
+  error, such as a rejected prompt, would fail on every model too and is
+  raised at once. Attempts with a fallback still to come get only
+  ATTEMPT_MAX_RETRIES scheduler retries, so the next model is tried within
+  seconds rather than after the scheduler's full backoff; the last
+  candidate gets the scheduler's usual retries.
+
+The first successful attempt wins. Attempts still waiting for a scheduler
+slot are cancelled; one already on the wire can't be interrupted by the
+SDK, so it finishes in the background and its answer is dropped. The
+budget clock starts when the primary actually reaches the model, so time
+spent queueing behind our own rate limit never triggers a hedge.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from scheduler import RETRYABLE_CODES, get_scheduler, status_code
+
+logger = logging.getLogger("nano_banana.router")
+
+# Configuration
+# Fixed hedge delay in seconds; unset or 0 uses the primary model's rolling HEDGE_QUANTILE
+HEDGE_AFTER_SECONDS = float(os.getenv("NANO_BANANA_HEDGE_AFTER_SECONDS", "0"))
+HEDGE_QUANTILE = float(os.getenv("NANO_BANANA_HEDGE_QUANTILE", "0.95"))
+# Budget used until a model has MIN_SAMPLES calls, and the floor for the adaptive budget
+HEDGE_DEFAULT_SECONDS = float(os.getenv("NANO_BANANA_HEDGE_DEFAULT_SECONDS", "30"))
+HEDGE_MIN_SECONDS = float(os.getenv("NANO_BANANA_HEDGE_MIN_SECONDS", "2"))
+# Share of requests that may be hedged (0 disables hedging), and how many may be saved up
+HEDGE_MAX_RATIO = float(os.getenv("NANO_BANANA_HEDGE_MAX_RATIO", "0.1"))
+HEDGE_BURST = float(os.getenv("NANO_BANANA_HEDGE_BURST", "4"))
+ERROR_RATE_THRESHOLD = float(os.getenv("NANO_BANANA_ERROR_RATE_THRESHOLD", "0.5"))
+MIN_SAMPLES = int(os.getenv("NANO_BANANA_ROUTE_MIN_SAMPLES", "10"))
+WINDOW_SIZE = int(os.getenv("NANO_BANANA_ROUTE_WINDOW", "200"))
+WINDOW_SECONDS = float(os.getenv("NANO_BANANA_ROUTE_WINDOW_SECONDS", "300"))
+# Scheduler retries for an attempt that still has a fallback behind it
+ATTEMPT_MAX_RETRIES = int(os.getenv("NANO_BANANA_ROUTE_ATTEMPT_RETRIES", "1"))
+# Threads that carry routed attempts (the caller's thread only waits)
+ROUTER_WORKERS = int(os.getenv("NANO_BANANA_ROUTER_WORKERS", "64"))
+
+
+def default_routes():
+    """``{operation: [alternative models]}`` from NANO_BANANA_ROUTE_<OPERATION>.
+
+    Defaults to the image preview model, the one model that handles every
+    operation. core imports this module, so its names are read here, at
+    call time.
+    """
+    from core import IMAGE_MODEL_NAME, OPERATIONS
+    return {
+        operation: [name.strip() for name in
+                    os.getenv(f"NANO_BANANA_ROUTE_{operation.upper()}", IMAGE_MODEL_NAME).split(",")
+                    if name.strip()]
+        for operation in OPERATIONS
+    }
+
+
+class Abandoned(Exception):
+    """Raised inside an attempt that lost the race before it reached the model."""
+
+
+def can_fall_back(exc):
+    """Whether another model might succeed where ``exc`` failed: throttling, 5xx or a timeout."""
+    return isinstance(exc, TimeoutError) or status_code(exc) in RETRYABLE_CODES
+
+
+class ModelStats:
+    """Rolling latency and error rate of one model for one operation."""
+
+    def __init__(self, size=WINDOW_SIZE, window_seconds=WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds, ok))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            return [(seconds, ok) for at, seconds, ok in self._samples if at >= cutoff]
+
+    def summary(self):
+        """``calls``, ``error_rate`` and latency quantiles of successful calls, in seconds."""
+        recent = self._recent()
+        latencies = sorted(seconds for seconds, ok in recent if ok)
+        summary = {"calls": len(recent), "error_rate": 0.0, "p50": None, "p95": None, "p99": None}
+        if recent:
+            summary["error_rate"] = 1 - len(latencies) / len(recent)
+        if latencies:
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                summary[name] = latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        return summary
+
+    def quantile(self, q):
+        latencies = sorted(seconds for seconds, ok in self._recent() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class _Race:
+    """Attempts of one routed request; the first to succeed wins."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.finished = deque()
+        self.futures = {}
+        self.primary_started = None
+        self.cancelled = False
+
+
+class Router:
+    """Routes model calls for each operation across candidate models.
+
+    ``call(operation, model_name, fn)`` runs ``fn(model)`` for the chosen
+    model(s) through the shared scheduler and returns ``(result, model)``
+    for the attempt that won. See the module docstring for the policy.
+    """
+
+    def __init__(self, routes=None, hedge_after=HEDGE_AFTER_SECONDS, hedge_quantile=HEDGE_QUANTILE,
+                 hedge_default=HEDGE_DEFAULT_SECONDS, hedge_min=HEDGE_MIN_SECONDS,
+                 hedge_max_ratio=HEDGE_MAX_RATIO, hedge_burst=HEDGE_BURST,
+                 error_rate_threshold=ERROR_RATE_THRESHOLD, min_samples=MIN_SAMPLES,
+                 attempt_retries=ATTEMPT_MAX_RETRIES, workers=ROUTER_WORKERS):
+        self.routes = default_routes() if routes is None else routes
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.hedge_default = hedge_default
+        self.hedge_min = hedge_min
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_burst = max(1.0, hedge_burst)
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.attempt_retries = attempt_retries
+        self._stats = {}
+        self._hedge_credit = 1.0
+        self._counts = {"requests": 0, "hedges": 0, "fallbacks": 0, "abandoned": 0}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(2, workers), thread_name_prefix="route")
+
+    def stats_for(self, operation, model):
+        with self._lock:
+            stats = self._stats.get((operation, model))
+            if stats is None:
+                stats = self._stats[(operation, model)] = ModelStats()
+            return stats
+
+    def _unhealthy(self, operation, model):
+        summary = self.stats_for(operation, model).summary()
+        return summary["calls"] >= self.min_samples and summary["error_rate"] >= self.error_rate_threshold
+
+    def candidates(self, operation, model_name):
+        """Models to try for ``operation``, the requested one first unless it is failing."""
+        models = [model_name] + [m for m in self.routes.get(operation, ()) if m != model_name]
+        healthy = [m for m in models if not self._unhealthy(operation, m)]
+        return healthy + [m for m in models if m not in healthy]
+
+    def budget(self, operation, model):
+        """Seconds the primary may run before a hedge is sent."""
+        if self.hedge_after > 0:
+            return self.hedge_after
+        stats = self.stats_for(operation, model)
+        if stats.summary()["calls"] < self.min_samples:
+            return self.hedge_default
+        return max(self.hedge_min, stats.quantile(self.hedge_quantile) or self.hedge_default)
+
+    def _take_hedge(self):
+        with self._lock:
+            if self.hedge_max_ratio <= 0 or self._hedge_credit < 1:
+                return False
+            self._hedge_credit -= 1
+            self._counts["hedges"] += 1
+            return True
+
+    def _hedge_target(self, operation, primary, candidates):
+        """The next candidate if its rolling median beats the primary's, else the primary again."""
+        if len(candidates) < 2:
+            return primary
+        mine = self.stats_for(operation, primary).summary()["p50"]
+        theirs = self.stats_for(operation, candidates[1]).summary()["p50"]
+        if mine is not None and theirs is not None and theirs < mine:
+            return candidates[1]
+        return primary
+
+    def _attempt(self, race, operation, model, role, fn, last):
+        def guarded():
+            # Runs inside the scheduler slot, so the clock covers only the model call
+            with race.cond:
+                if race.cancelled:
+                    raise Abandoned()
+                if role == "primary" and race.primary_started is None:
+                    race.primary_started = time.monotonic()
+                    race.cond.notify_all()
+            started = time.perf_counter()
+            try:
+                result = fn(model)
+            except Exception:
+                self._record(operation, model, time.perf_counter() - started, False)
+                raise
+            self._record(operation, model, time.perf_counter() - started, True)
+            return result
+
+        def run():
+            try:
+                retries = None if last else self.attempt_retries
+                outcome = (get_scheduler().call(guarded, max_retries=retries), None)
+            except Exception as e:
+                outcome = (None, e)
+            with race.cond:
+                race.finished.append((future, *outcome))
+                race.cond.notify_all()
+
+        metrics.inc("nano_banana_route_attempts_total", operation=operation, model=model, role=role)
+        with race.cond:
+            future = self._pool.submit(run)
+            race.futures[future] = (model, role)
+
+    def _record(self, operation, model, seconds, ok):
+        self.stats_for(operation, model).record(seconds, ok)
+        metrics.observe("nano_banana_model_latency_seconds", seconds, operation=operation, model=model,
+                        outcome="ok" if ok else "error")
+
+    def call(self, operation, model_name, fn):
+        """Run ``fn(model)`` under the routing policy; returns ``(result, model)``.
+
+        Raises the first error if every candidate failed, or a non-retryable
+        error as soon as any attempt hits one.
+        """
+        candidates = self.candidates(operation, model_name)
+        primary = candidates[0]
+        if primary != model_name:
+            metrics.inc("nano_banana_route_demotions_total", operation=operation, model=model_name)
+            logger.info("%s is failing for %s; routing to %s first", model_name, operation, primary)
+        budget = self.budget(operation, primary)
+        with self._lock:
+            self._counts["requests"] += 1
+            self._hedge_credit = min(self.hedge_burst, self._hedge_credit + self.hedge_max_ratio)
+
+        race = _Race()
+        started = time.perf_counter()
+        next_candidate = 1
+        hedged = False
+        errors = []
+        self._attempt(race, operation, primary, "primary", fn, last=len(candidates) == 1)
+        with race.cond:
+            while True:
+                while race.finished:
+                    future, result, error = race.finished.popleft()
+                    model, role = race.futures.pop(future)
+                    if error is None:
+                        self._finish(race, operation, model, role, started)
+                        return result, model
+                    if not isinstance(error, Abandoned):
+                        logger.info("%s attempt on %s failed: %s", operation, model, error)
+                        if not can_fall_back(error):
+                            self._cancel(race)
+                            raise error
+                        errors.append(error)
+                if not race.futures:
+                    if next_candidate >= len(candidates):
+                        raise errors[0]
+                    with self._lock:
+                        self._counts["fallbacks"] += 1
+                    next_candidate += 1
+                    self._attempt(race, operation, candidates[next_candidate - 1], "fallback", fn,
+                                  last=next_candidate >= len(candidates))
+                    # Fallbacks are not hedged; the budget belongs to the primary
+                    hedged = True
+                    continue
+
+                timeout = None
+                if not hedged and race.primary_started is not None:
+                    timeout = race.primary_started + budget - time.monotonic()
+                    if timeout <= 0:
+                        hedged = True
+                        if self._take_hedge():
+                            target = self._hedge_target(operation, primary, candidates)
+                            logger.info("%s on %s passed its %.1fs budget; hedging on %s",
+                                        operation, primary, budget, target)
+                            self._attempt(race, operation, target, "hedge", fn, last=len(candidates) == 1)
+                        continue
+                race.cond.wait(timeout)
+
+    def _cancel(self, race):
+        race.cancelled = True
+        # Attempts that already finished (their outcome may still be queued) lost nothing
+        finished = {future for future, _, _ in race.finished}
+        for future in race.futures:
+            if future not in finished and not future.done() and not future.cancel():
+                with self._lock:
+                    self._counts["abandoned"] += 1
+
+    def _finish(self, race, operation, model, role, started):
+        self._cancel(race)
+        metrics.inc("nano_banana_route_wins_total", operation=operation, model=model, role=role)
+        metrics.observe("nano_banana_routed_seconds", time.perf_counter() - started, operation=operation)
+
+    def snapshot(self):
+        """Rolling stats per (operation, model), for dashboards."""
+        with self._lock:
+            stats = dict(self._stats)
+        return [dict(operation=operation, model=model, **s.summary())
+                for (operation, model), s in sorted(stats.items())]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, hedge_credit=self._hedge_credit)
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide Router, creating it on first use."""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = Router()
+        return _default_router
+
+
+metrics.register_collector(
+    "nano_banana_router", lambda: _default_router.stats() if _default_router else {}
+)
@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger("nano_banana.scheduler")
+
+# Configuration
+RATE_PER_SECOND = float(os.getenv("NANO_BANANA_RATE_PER_SECOND", "2"))
+BURST = int(os.getenv("NANO_BANANA_RATE_BURST", "4"))
+MAX_CONCURRENCY = int(os.getenv("NANO_BANANA_MAX_CONCURRENCY", "8"))
+INITIAL_CONCURRENCY = int(os.getenv("NANO_BANANA_INITIAL_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("NANO_BANANA_MAX_RETRIES", "5"))
+BASE_BACKOFF = float(os.getenv("NANO_BANANA_BASE_BACKOFF", "1.0"))
+MAX_BACKOFF = float(os.getenv("NANO_BANANA_MAX_BACKOFF", "60"))
+
+THROTTLE_CODES = (429, 503)
+RETRYABLE_CODES = THROTTLE_CODES + (500, 502, 504)
+_RETRY_IN_PATTERN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+
+def status_code(exc):
+    """HTTP status code for an SDK error, or None if it doesn't carry one."""
+    code = getattr(exc, "code", None)
+    if callable(code):
+        # grpc errors expose code() returning a StatusCode enum
+        try:
+            code = code()
+        except Exception:
+            return None
+    if isinstance(code, int):
+        return int(code)
+    name = type(exc).__name__
+    if name in ("TooManyRequests", "ResourceExhausted"):
+        return 429
+    if name == "ServiceUnavailable":
+        return 503
+    if name == "DeadlineExceeded":
+        return 504
+    return None
+
+
+def retry_hint(exc):
+    """Seconds the server asked us to wait, if the error says so."""
+    delay = getattr(exc, "retry_delay", None)
+    for detail in getattr(exc, "details", None) or ():
+        delay = delay or getattr(detail, "retry_delay", None)
+    if delay is not None:
+        if hasattr(delay, "total_seconds"):
+            return delay.total_seconds()
+        if hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+        return float(delay)
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if "Retry-After" in headers:
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+    match = _RETRY_IN_PATTERN.search(str(exc))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, up to ``burst`` saved."""
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available; returns the seconds waited."""
+        if self.rate <= 0:
+            # Rate limiting disabled
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class Scheduler:
+    """Rate-limited, adaptively concurrent gateway for model calls.
+
+    Every call takes a token from the bucket and a concurrency slot, then runs
+    with retries. Throttling responses (429/503) halve the concurrency limit
+    and successes grow it back by one per window of ``limit`` successes
+    (AIMD). Retries use full-jitter exponential backoff, but never wait less
+    than a server-provided retry hint.
+    """
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST, max_concurrency=MAX_CONCURRENCY,
+                 initial_concurrency=INITIAL_CONCURRENCY, max_retries=MAX_RETRIES,
+                 base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(max(1, min(initial_concurrency, self.max_concurrency)))
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0,
+                       "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def _acquire_slot(self):
+        started = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+        return time.monotonic() - started
+
+    def _release_slot(self, throttled):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                logger.info("Throttled; concurrency limit now %d", int(self.limit))
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _record_wait(self, seconds):
+        with self._cond:
+            self._stats["wait_seconds_total"] += seconds
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], seconds)
+
+    def backoff(self, attempt, exc):
+        """Seconds to sleep before retry number ``attempt`` (1-based)."""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)))
+        hint = retry_hint(exc)
+        if hint is not None:
+            delay = max(delay, hint + random.uniform(0, self.base_backoff))
+        return delay
+
+    def call(self, fn, *args, max_retries=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` under the rate limit with retries.
+
+        ``max_retries`` overrides the scheduler's own limit for this call.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        with self._cond:
+            self._stats["calls"] += 1
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire() + self._acquire_slot()
+            self._record_wait(waited)
+            throttled = False
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                code = status_code(e)
+                throttled = code in THROTTLE_CODES
+                if throttled:
+                    with self._cond:
+                        self._stats["throttled"] += 1
+                if code not in RETRYABLE_CODES or attempt >= max_retries:
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    raise
+                attempt += 1
+                delay = self.backoff(attempt, e)
+                logger.info("Model call failed with %s; retry %d/%d in %.1fs",
+                            code, attempt, max_retries, delay)
+                with self._cond:
+                    self._stats["retries"] += 1
+            else:
+                with self._cond:
+                    self._stats["succeeded"] += 1
+                return result
+            finally:
+                self._release_slot(throttled)
+            time.sleep(delay)
+
+    def generate_content(self, model, contents, **kwargs):
+        """Scheduled ``model.generate_content(contents, **kwargs)``."""
+        return self.call(model.generate_content, contents, **kwargs)
+
+    def stats(self):
+        """Snapshot of queue depth, concurrency and wait-time statistics."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self.waiting
+            stats["in_flight"] = self.in_flight
+            stats["concurrency_limit"] = int(self.limit)
+        attempts = stats["succeeded"] + stats["failed"] + stats["retries"]
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / attempts if attempts else 0.0
+        return stats
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide Scheduler, creating it on first use."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Scheduler()
+        return _default_scheduler
+
+
+# Exported at scrape time; nothing is reported until the scheduler exists
+metrics.register_collector(
+    "nano_banana_scheduler", lambda: _default_scheduler.stats() if _default_scheduler else {}
+)
@@ -0,0 +1,200 @@
+"""State shared between app/API replicas: jobs, results and cache entries.
+
+Every replica points at the same store, so a job submitted on one node can
+be polled, cancelled and collected on another, and a browser tab that
+reconnects to a different node finds its results again.
+
+    NANO_BANANA_SHARED_STORE=                      # unset: one replica, jobs stay in process
+    NANO_BANANA_SHARED_STORE=sqlite:///data/shared.sqlite3
+    NANO_BANANA_SHARED_STORE=redis://redis:6379/0  # Redis, Valkey or anything speaking its protocol
+
+Jobs and the result cache use the store only when it is configured. Unset,
+a local SQLite file (NANO_BANANA_LOCAL_STORE) still backs the app's
+session recovery for reconnecting tabs.
+
+The SQLite backend suits one host (replicas sharing a volume); the Redis
+backend needs the ``redis`` package. Values are bytes in namespaces with an
+optional TTL; ``encode``/``decode`` turn job results into JSON with every
+GeneratedImage stored once, content-addressed, in the ``result`` namespace.
+"""
+import os
+import abc
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from image_io import GeneratedImage
+
+logger = logging.getLogger("nano_banana.shared_store")
+
+# Configuration
+SHARED_STORE_URL = os.getenv("NANO_BANANA_SHARED_STORE", "")
+LOCAL_STORE_PATH = os.getenv("NANO_BANANA_LOCAL_STORE", os.path.join(".cache", "shared.sqlite3"))
+# How long stored result images outlive the jobs and sessions that reference them
+RESULT_TTL_SECONDS = int(os.getenv("NANO_BANANA_RESULT_TTL", "86400"))
+# Keys are namespaced so several deployments can share one Redis database
+KEY_PREFIX = os.getenv("NANO_BANANA_STORE_PREFIX", "nano_banana")
+
+
+class SharedStore(abc.ABC):
+    """Namespaced bytes store with optional per-key TTL (seconds)."""
+
+    shared = False
+
+    @abc.abstractmethod
+    def get(self, namespace, key):
+        """The value, or None if missing or expired."""
+
+    @abc.abstractmethod
+    def put(self, namespace, key, value, ttl=None):
+        """Store ``value``, replacing any previous one."""
+
+    @abc.abstractmethod
+    def delete(self, namespace, key):
+        """Remove the key if present."""
+
+    def get_json(self, namespace, key):
+        value = self.get(namespace, key)
+        return None if value is None else json.loads(value)
+
+    def put_json(self, namespace, key, value, ttl=None):
+        self.put(namespace, key, json.dumps(value).encode(), ttl)
+
+
+class SQLiteStore(SharedStore):
+    """One SQLite file in WAL mode; safe for several processes on one host."""
+
+    # Expired rows are swept every this many writes
+    PURGE_EVERY = 256
+
+    def __init__(self, path=LOCAL_STORE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        with self._connection() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value BLOB, expires_at REAL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self):
+        # sqlite3 connections are per thread; each thread keeps its own
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10)
+        return db
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def put(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)", (namespace, key, value, expires_at))
+        # Writers run on pool threads; only one of them should see each multiple
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def delete(self, namespace, key):
+        with self._connection() as db:
+            db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge_expired(self):
+        with self._connection() as db:
+            removed = db.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),)).rowcount
+        if removed:
+            logger.debug("Purged %d expired entries from %s", removed, self.path)
+
+
+class RedisStore(SharedStore):
+    """Redis (or any server speaking its protocol), for replicas on several hosts.
+
+    ``client`` may be any object with redis-py's ``get``/``set``/``delete``,
+    such as a ``fakeredis.FakeRedis`` stand-in.
+    """
+
+    shared = True
+
+    def __init__(self, url=None, client=None, prefix=KEY_PREFIX):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("The Redis shared store needs the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        return self.client.get(self._key(namespace, key))
+
+    def put(self, namespace, key, value, ttl=None):
+        self.client.set(self._key(namespace, key), value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+
+def open_store(url=SHARED_STORE_URL):
+    """Build the store a NANO_BANANA_SHARED_STORE value describes."""
+    if not url or url == "local":
+        return SQLiteStore(LOCAL_STORE_PATH)
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported shared store '{url}'")
+
+
+def encode(store, value):
+    """JSON-safe form of a job result; GeneratedImages are stored by digest."""
+    if isinstance(value, GeneratedImage):
+        store.put("result", value.digest, value.data, RESULT_TTL_SECONDS)
+        return {"__image__": value.digest, "mime_type": value.mime_type}
+    if isinstance(value, (list, tuple)):
+        return [encode(store, item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode(store, item) for key, item in value.items()}
+    return value
+
+
+def decode(store, value):
+    """Inverse of ``encode``; images that expired come back as None."""
+    if isinstance(value, dict):
+        if "__image__" in value:
+            data = store.get("result", value["__image__"])
+            return None if data is None else GeneratedImage(data, value["mime_type"])
+        return {key: decode(store, item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(store, item) for item in value]
+    return value
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_shared_store():
+    """Return the process-wide SharedStore, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = open_store()
+            logger.info("Shared store: %s", type(_default_store).__name__)
+        return _default_store
@@ -0,0 +1,88 @@
+import os
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger("nano_banana.singleflight")
+
+# Configuration
+# How long a coalesced caller waits for the in-flight call before giving up
+COALESCE_TIMEOUT = float(os.getenv("NANO_BANANA_COALESCE_TIMEOUT", "300"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result, or the same
+    exception. Each waiter has its own timeout. Nothing is remembered once
+    the call finishes; repeats after that are the result cache's job.
+    """
+
+    def __init__(self, timeout=COALESCE_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+                if call.waiters:
+                    logger.info("Shared one model call between %d callers", call.waiters + 1)
+            return call.result
+
+        metrics.inc("nano_banana_coalesced_calls_total")
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            metrics.inc(metrics.ERRORS, stage="coalesce", type="TimeoutError")
+            raise TimeoutError("Timed out waiting for an identical request already in progress")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+_default_single_flight = None
+_default_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide SingleFlight, creating it on first use."""
+    global _default_single_flight
+    with _default_single_flight_lock:
+        if _default_single_flight is None:
+            _default_single_flight = SingleFlight()
+        return _default_single_flight
+
+
+metrics.register_collector(
+    "nano_banana_singleflight",
+    lambda: {"in_flight": _default_single_flight.in_flight()} if _default_single_flight else {},
+)
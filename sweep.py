@@ -0,0 +1,271 @@
+"""Prompt sweeps: one prompt template expanded over a parameter matrix.
+
+    nano-banana sweep "a lighthouse, {style}, {lighting} light, {lens} lens" \
+        -P style="oil painting,watercolor" -P lighting=dawn,noon,dusk -P lens=24mm,85mm
+
+Every combination is generated concurrently (still paced by the shared
+scheduler's rate limit), saved to the output directory the moment it
+finishes and pasted into a labeled contact sheet that is rewritten as it
+fills in. Only the sheet and the images currently being thumbnailed are
+held in memory.
+"""
+import os
+import json
+import math
+import time
+import string
+import logging
+import itertools
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PIL import Image, ImageDraw, ImageFont
+
+import core
+import metrics
+from batch import MANIFEST_NAME, Manifest
+from image_io import EXTENSION_FORMATS
+from operations import model_name_for
+
+logger = logging.getLogger("nano_banana.sweep")
+
+# Configuration
+SWEEP_WORKERS = int(os.getenv("NANO_BANANA_SWEEP_WORKERS", "4"))
+MAX_COMBINATIONS = int(os.getenv("NANO_BANANA_SWEEP_MAX", "256"))
+SHEET_CELL = int(os.getenv("NANO_BANANA_SHEET_CELL", "256"))
+# Minimum seconds between contact sheet rewrites while a sweep is running
+SHEET_FLUSH_SECONDS = float(os.getenv("NANO_BANANA_SHEET_FLUSH_SECONDS", "2"))
+SHEET_NAME = "contact_sheet.png"
+LABEL_HEIGHT = 20
+
+
+def parse_param(text):
+    """Parse ``name=value1,value2`` into ``(name, [values])``."""
+    name, sep, values = text.partition("=")
+    values = [value.strip() for value in values.split(",") if value.strip()]
+    if not sep or not name.strip() or not values:
+        raise ValueError(f"Expected NAME=VALUE[,VALUE...], got '{text}'")
+    return name.strip(), values
+
+
+def load_matrix(path):
+    """Read a ``{"name": [values, ...]}`` JSON matrix file."""
+    with open(path) as f:
+        matrix = json.load(f)
+    if not isinstance(matrix, dict) or not all(isinstance(v, list) and v for v in matrix.values()):
+        raise ValueError(f"{path} must hold an object mapping each parameter to a list of values")
+    return {name: [str(value) for value in values] for name, values in matrix.items()}
+
+
+def template_fields(template):
+    return {field for _, field, _, _ in string.Formatter().parse(template) if field}
+
+
+def expand(template, matrix):
+    """Return one ``{"index", "params", "prompt"}`` dict per combination.
+
+    Combinations are ordered like nested loops over the matrix, last
+    parameter fastest. Every template field needs a parameter and every
+    parameter must appear in the template, so typos fail before any
+    requests are made.
+    """
+    fields = template_fields(template)
+    missing = sorted(fields - set(matrix))
+    unused = sorted(set(matrix) - fields)
+    if missing:
+        raise ValueError(f"No values given for {', '.join(missing)}")
+    if unused:
+        raise ValueError(f"Parameters not used in the template: {', '.join(unused)}")
+    count = math.prod(len(values) for values in matrix.values())
+    if count > MAX_COMBINATIONS:
+        raise ValueError(f"{count} combinations is more than the limit of {MAX_COMBINATIONS}")
+
+    names = list(matrix)
+    return [
+        {"index": index, "params": dict(zip(names, values)), "prompt": template.format(**dict(zip(names, values)))}
+        for index, values in enumerate(itertools.product(*matrix.values()))
+    ]
+
+
+def output_stem_for(combination, output_dir):
+    """Output path without extension; the model's own format decides that."""
+    slug = "_".join(combination["params"].values())
+    slug = "".join(c if c.isalnum() else "-" for c in slug.lower()).strip("-")[:80]
+    return os.path.join(output_dir, f"{combination['index']:04d}_{slug}")
+
+
+def existing_output(stem):
+    for extension in EXTENSION_FORMATS:
+        if os.path.exists(stem + extension):
+            return stem + extension
+    return None
+
+
+def sheet_layout(matrix, count):
+    """Columns follow the last parameter; rows cover the other combinations."""
+    if len(matrix) > 1:
+        columns = len(list(matrix.values())[-1])
+    else:
+        columns = math.ceil(math.sqrt(count))
+    return math.ceil(count / columns), columns
+
+
+class ContactSheet:
+    """A labeled thumbnail grid filled in as results arrive.
+
+    Each result is decoded, reduced to a ``cell`` thumbnail (JPEGs via the
+    decoder's draft mode) and pasted, so memory stays at one sheet plus the
+    images in flight. The PNG on disk is replaced atomically at most every
+    ``flush_seconds`` and once more on close.
+    """
+
+    def __init__(self, path, rows, columns, cell=SHEET_CELL, flush_seconds=SHEET_FLUSH_SECONDS):
+        self.path = path
+        self.columns = columns
+        self.cell = cell
+        self.flush_seconds = flush_seconds
+        self.canvas = Image.new("RGB", (columns * cell, rows * (cell + LABEL_HEIGHT)), "white")
+        self.font = ImageFont.load_default()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flushed_at = 0.0
+
+    def _origin(self, index):
+        row, column = divmod(index, self.columns)
+        return column * self.cell, row * (self.cell + LABEL_HEIGHT)
+
+    def _label(self, draw, index, label, fill="black"):
+        x, y = self._origin(index)
+        width = self.cell - 8
+        if draw.textlength(label, font=self.font) > width:
+            while label and draw.textlength(label + "...", font=self.font) > width:
+                label = label[:-1]
+            label += "..."
+        draw.text((x + 4, y + self.cell + 4), label, fill=fill, font=self.font)
+
+    def add(self, index, source, label):
+        """Paste the image in ``source`` (encoded bytes or a path) at ``index``."""
+        with metrics.span("thumbnail"):
+            with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+                image.draft("RGB", (self.cell, self.cell))
+                image.thumbnail((self.cell, self.cell))
+                thumb = image.convert("RGB")
+        x, y = self._origin(index)
+        with self._lock:
+            self.canvas.paste(thumb, (x + (self.cell - thumb.width) // 2, y + (self.cell - thumb.height) // 2))
+            self._label(ImageDraw.Draw(self.canvas), index, label)
+            self._dirty = True
+        self.flush()
+
+    def add_failure(self, index, label):
+        x, y = self._origin(index)
+        with self._lock:
+            draw = ImageDraw.Draw(self.canvas)
+            draw.rectangle((x, y, x + self.cell - 1, y + self.cell - 1), fill=(235, 235, 235))
+            draw.text((x + 8, y + 8), "failed", fill="firebrick", font=self.font)
+            self._label(draw, index, label, fill="firebrick")
+            self._dirty = True
+        self.flush()
+
+    def flush(self, force=False):
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._flushed_at < self.flush_seconds):
+                return
+            temp_path = f"{self.path}.tmp"
+            self.canvas.save(temp_path, format="PNG")
+            os.replace(temp_path, self.path)
+            logger.debug("Contact sheet written to %s", self.path)
+            self._dirty = False
+            self._flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush(force=True)
+
+
+def run_sweep(template, matrix, output_dir, workers=SWEEP_WORKERS, model_name=None, cell=SHEET_CELL,
+              on_result=None):
+    """Generate every combination of ``matrix`` into output_dir.
+
+    Like batch.run_batch, combinations whose image already exists are
+    skipped (and read back into the contact sheet), so an interrupted sweep
+    resumes, and every attempt is appended to the manifest.
+    ``on_result(record)`` is called as each combination finishes. Returns a
+    summary dict.
+    """
+    combinations = expand(template, matrix)
+    model_name = model_name or model_name_for("generation")
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    rows, columns = sheet_layout(matrix, len(combinations))
+    sheet = ContactSheet(os.path.join(output_dir, SHEET_NAME), rows, columns, cell)
+
+    pending = []
+    skipped = 0
+    for combination in combinations:
+        stem = output_stem_for(combination, output_dir)
+        output_path = existing_output(stem)
+        if output_path is not None:
+            sheet.add(combination["index"], output_path, " / ".join(combination["params"].values()))
+            skipped += 1
+        else:
+            pending.append((combination, stem))
+
+    print(f"Sweeping {len(combinations)} combinations, {skipped} already done, "
+          f"{len(pending)} to generate with {workers} workers.")
+
+    def run_one(combination, stem):
+        started = time.perf_counter()
+        label = " / ".join(combination["params"].values())
+        notices = []
+        output_path = None
+        try:
+            result = core.run_operation("generation", combination["prompt"], [], model_name, notices)
+            if result is not None:
+                # Written as returned, without a decode/re-encode round-trip
+                output_path = result.save(stem + result.extension)
+                sheet.add(combination["index"], result.data, label)
+            error = None if result is not None else (notices[-1][1] if notices else "no image in response")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error is not None:
+            sheet.add_failure(combination["index"], label)
+        record = dict(
+            combination,
+            output=output_path if error is None else None,
+            status="ok" if error is None else "error",
+            seconds=round(time.perf_counter() - started, 3),
+            error=error,
+        )
+        manifest.write(record)
+        return record
+
+    succeeded = failed = 0
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sweep") as pool:
+            futures = [pool.submit(run_one, c, o) for c, o in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                if record["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+                    print(f"Failed: {record['prompt']} ({record['error']})")
+                print(f"[{done}/{len(pending)}] {record['prompt']}")
+                if on_result is not None:
+                    on_result(record)
+    finally:
+        sheet.close()
+    elapsed = time.perf_counter() - started
+
+    summary = {
+        "generated": succeeded,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 2),
+        "contact_sheet": sheet.path,
+    }
+    print(f"Sweep finished: {succeeded} ok, {failed} failed, {skipped} skipped in {elapsed:.1f}s. "
+          f"Contact sheet: {sheet.path}")
+    return summary
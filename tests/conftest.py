@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repo, next to benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    """``benchmarks.stub_model.install_stub`` with a private result cache and no rate limit.
+
+    Call it with install_stub's arguments; the real SDK functions are restored afterwards.
+    """
+    import google.generativeai as genai
+
+    import core
+    import result_cache
+    import scheduler
+    from benchmarks.stub_model import install_stub
+
+    monkeypatch.setattr(genai, "GenerativeModel", genai.GenerativeModel)
+    monkeypatch.setattr(genai, "upload_file", genai.upload_file)
+    monkeypatch.setattr(result_cache, "_default_cache", result_cache.ResultCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(scheduler, "_default_scheduler", scheduler.Scheduler(rate=0, base_backoff=0))
+    get_model = core.get_model
+    yield install_stub
+    get_model.cache_clear()
@@ -0,0 +1,145 @@
+import json
+import asyncio
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import api
+import ingest
+import jobs
+from benchmarks.stub_model import make_png
+
+
+def call(method, path, body=b"", headers=None, chunks=None, query=b""):
+    """Drive the ASGI app directly; returns ``(status, headers, body)``."""
+    headers = dict(headers or {})
+    if chunks is None:
+        chunks = [body]
+        headers.setdefault("content-length", str(len(body)))
+    scope = {"type": "http", "method": method, "path": path, "raw_path": path.encode(),
+             "query_string": query, "root_path": "", "scheme": "http", "http_version": "1.1",
+             "server": ("test", 80), "client": ("test", 1),
+             "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+    pending = list(chunks)
+    sent = []
+
+    async def receive():
+        if pending:
+            chunk = pending.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(api.app(scope, receive, send))
+    start = sent[0]
+    return (start["status"], {k.decode(): v.decode() for k, v in start["headers"]},
+            b"".join(m.get("body", b"") for m in sent[1:]))
+
+
+def multipart(fields, files):
+    boundary = "testboundary"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+
+def png(size=(32, 32)):
+    buf = BytesIO()
+    Image.new("RGB", size, "red").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def error(body):
+    return json.loads(body)["error"]
+
+
+def test_unknown_operation_is_404():
+    status, _, _ = call("POST", "/v1/paint", b"{}", {"content-type": "application/json"})
+    assert status == 404
+
+
+def test_malformed_json_is_400():
+    status, _, body = call("POST", "/v1/generate", b"{bad", {"content-type": "application/json"})
+    assert status == 400 and "not valid JSON" in error(body)
+
+
+def test_json_that_is_not_an_object_is_400():
+    status, _, body = call("POST", "/v1/generate", b"[1, 2]", {"content-type": "application/json"})
+    assert status == 400 and "object" in error(body)
+
+
+def test_missing_prompt_is_400():
+    status, _, body = call("POST", "/v1/generate", b'{"prompt": "  "}', {"content-type": "application/json"})
+    assert status == 400 and "prompt" in error(body)
+
+
+def test_declared_oversized_body_is_413_before_reading():
+    status, _, _ = call("POST", "/v1/edit", headers={"content-type": "multipart/form-data; boundary=b",
+                                                    "content-length": str(api.MAX_BODY_BYTES + 1)},
+                        chunks=[])
+    assert status == 413
+
+
+def test_streamed_oversized_body_is_cut_off(monkeypatch):
+    monkeypatch.setattr(api, "MAX_BODY_BYTES", 1000)
+    status, _, _ = call("POST", "/v1/generate", headers={"content-type": "application/json"},
+                        chunks=[b" " * 400] * 5)
+    assert status == 413
+
+
+def test_image_over_the_byte_limit_is_413(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_UPLOAD_BYTES", 100)
+    body, headers = multipart({"prompt": "hat"}, [("image", ("big.png", png((64, 64))))])
+    status, _, body = call("POST", "/v1/edit", body, headers)
+    assert status == 413 and "big.png" in error(body)
+
+
+def test_image_over_the_pixel_limit_is_413(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_PIXELS", 100)
+    body, headers = multipart({"prompt": "hat"}, [("image", ("wide.png", png()))])
+    status, _, body = call("POST", "/v1/edit", body, headers)
+    assert status == 413 and "megapixels" in error(body)
+
+
+def test_unreadable_image_is_400():
+    body, headers = multipart({"prompt": "hat"}, [("image", ("notes.png", b"not an image"))])
+    status, _, _ = call("POST", "/v1/edit", body, headers)
+    assert status == 400
+
+
+def test_edit_without_an_image_is_400():
+    body, headers = multipart({"prompt": "hat"}, [])
+    status, _, _ = call("POST", "/v1/edit", body, headers)
+    assert status == 400
+
+
+def test_sync_edit_returns_the_image(stub):
+    stub(latency=0, payload=make_png((16, 16)))
+    body, headers = multipart({"prompt": "add a hat"}, [("image", ("dog.png", png()))])
+    status, response_headers, body = call("POST", "/v1/edit", body, headers)
+    assert status == 200
+    assert response_headers["content-type"] == "image/png" and "x-image-digest" in response_headers
+    assert Image.open(BytesIO(body)).size == (16, 16)
+
+
+def test_async_generation_is_polled_to_its_result(stub, monkeypatch):
+    stub(latency=0, payload=make_png((16, 16)))
+    monkeypatch.setattr(jobs, "_default_queue", jobs.JobQueue())
+    status, headers, body = call("POST", "/v1/generate", b'{"prompt": "a lighthouse"}',
+                                 {"content-type": "application/json"}, query=b"async=true")
+    assert status == 202
+    job_id = json.loads(body)["id"]
+    assert headers["location"] == f"/v1/jobs/{job_id}"
+    jobs._default_queue.get(job_id).future.result(timeout=5)
+    status, _, body = call("GET", f"/v1/jobs/{job_id}/result")
+    assert status == 200 and body.startswith(b"\x89PNG")
+    assert call("DELETE", f"/v1/jobs/{job_id}")[0] == 404
+    assert call("GET", "/v1/jobs/nope")[0] == 404
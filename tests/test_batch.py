@@ -0,0 +1,72 @@
+import json
+import os
+
+from PIL import Image
+
+import batch
+import image_editor
+from benchmarks.stub_model import make_png
+
+
+def write_inputs(directory, names):
+    os.makedirs(directory, exist_ok=True)
+    for index, name in enumerate(names):
+        Image.new("RGB", (64, 64), (index * 40, 0, 0)).save(os.path.join(directory, name))
+
+
+def read_manifest(output_dir):
+    with open(os.path.join(output_dir, batch.MANIFEST_NAME)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_output_path_keeps_subfolders(tmp_path):
+    root = str(tmp_path / "in")
+    path = batch.output_path_for(os.path.join(root, "a", "cat.jpg"), "out", "_edited", root)
+    assert path == os.path.join("out", "a", "cat_edited")
+    assert batch.output_path_for(os.path.join(root, "cat.jpg"), "out", "", root, keep_extension=True) == \
+        os.path.join("out", "cat_jpg")
+
+
+def test_outputs_take_the_models_format(stub, tmp_path):
+    payload = make_png((64, 64))
+    stub(latency=0, payload=payload)
+    source, output = str(tmp_path / "in"), str(tmp_path / "out")
+    write_inputs(source, ["dog.jpg", "cat.webp"])
+    summary = batch.run_batch(source, output, lambda i, o: image_editor.edit_image(i, o, "add a hat"),
+                              workers=2, suffix="_edited")
+    assert summary["processed"] == 2
+    assert sorted(os.listdir(output)) == ["cat_edited.png", "dog_edited.png", batch.MANIFEST_NAME]
+    # The model's PNG bytes are written as they came, not re-encoded
+    with open(os.path.join(output, "dog_edited.png"), "rb") as f:
+        assert f.read() == payload
+    assert {record["output"] for record in read_manifest(output)} == \
+        {os.path.join(output, "cat_edited.png"), os.path.join(output, "dog_edited.png")}
+
+
+def test_inputs_differing_by_extension_do_not_collide(stub, tmp_path):
+    stub(latency=0, payload=make_png((64, 64)))
+    source, output = str(tmp_path / "in"), str(tmp_path / "out")
+    write_inputs(source, ["dog.jpg", "dog.png"])
+    batch.run_batch(source, output, lambda i, o: image_editor.edit_image(i, o, "add a hat"))
+    assert sorted(os.listdir(output)) == ["dog_jpg.png", "dog_png.png", batch.MANIFEST_NAME]
+
+
+def test_rerun_skips_finished_inputs(tmp_path):
+    source, output = str(tmp_path / "in"), str(tmp_path / "out")
+    write_inputs(source, ["a.png", "b.png", "c.png"])
+    calls = []
+
+    def process(input_path, output_path):
+        calls.append(input_path)
+        if input_path.endswith("b.png") and len(calls) <= 3:
+            raise RuntimeError("model unavailable")
+        with open(output_path + ".png", "wb") as f:
+            f.write(b"done")
+        return output_path + ".png"
+
+    first = batch.run_batch(source, output, process, workers=1)
+    assert (first["processed"], first["failed"]) == (2, 1)
+    second = batch.run_batch(source, output, process, workers=1)
+    assert (second["processed"], second["failed"], second["skipped"]) == (1, 0, 2)
+    assert calls[3:] == [os.path.join(source, "b.png")]
+    assert [record["status"] for record in read_manifest(output)].count("error") == 1
@@ -0,0 +1,51 @@
+import io
+import sys
+
+import pytest
+from google.api_core import exceptions
+from PIL import Image
+
+import cli
+import operations
+
+
+@pytest.fixture
+def stdin(monkeypatch):
+    def feed(text=""):
+        monkeypatch.setattr(sys, "stdin", io.StringIO(text))
+    return feed
+
+
+def test_gen_writes_the_result(stub, stdin, tmp_path, capsys):
+    stub(latency=0)
+    stdin()
+    output = tmp_path / "out.png"
+    assert cli.main(["gen", "a lighthouse at dusk", "-o", str(output)]) == 0
+    assert Image.open(output).format == "PNG"
+    assert "saved as" in capsys.readouterr().err
+
+
+def test_api_errors_are_reported_not_raised(stdin, monkeypatch, capsys):
+    def quota_exceeded(*args, **kwargs):
+        raise exceptions.ResourceExhausted("quota exceeded")
+    monkeypatch.setattr(operations, "run_operation", quota_exceeded)
+    stdin()
+    assert cli.main(["gen", "a lighthouse", "-o", "unused.png"]) == 1
+    assert "Error: ResourceExhausted: 429 quota exceeded" in capsys.readouterr().err
+
+
+def test_missing_prompt_fails_before_decoding(stdin, monkeypatch, tmp_path, capsys):
+    path = tmp_path / "photo.png"
+    Image.new("RGB", (32, 32)).save(path)
+    loaded = []
+    monkeypatch.setattr(cli, "load_images", lambda *args, **kwargs: loaded.append(args))
+    stdin("")
+    assert cli.main(["edit", str(path)]) == 1
+    assert loaded == []
+    assert "A prompt is required" in capsys.readouterr().err
+
+
+def test_missing_input_file(stdin, capsys):
+    stdin()
+    assert cli.main(["edit", "no-such-file.png", "-p", "make it snow"]) == 1
+    assert "was not found" in capsys.readouterr().err
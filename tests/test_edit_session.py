@@ -0,0 +1,110 @@
+import google.generativeai as genai
+import pytest
+from PIL import Image
+
+from benchmarks.stub_model import make_png, stub_upload_file
+from edit_session import EditSession
+
+
+@pytest.fixture
+def model(stub):
+    factory = stub(latency=0, payload=make_png((64, 64)))
+
+    def calls():
+        return sum(model.calls for model in factory.models)
+    return calls
+
+
+def session(**kwargs):
+    return EditSession(Image.new("RGB", (64, 64), "red"), **kwargs)
+
+
+def image_parts(turns):
+    return [part for turn in turns for part in turn["parts"] if not isinstance(part, str)]
+
+
+def test_undo_and_branch(model):
+    edits = session()
+    edits.send("darker sky")
+    edits.send("add fog")
+    assert [step.index for step in edits.path()] == [0, 1, 2]
+    assert edits.undo().index == 1
+    edits.send("add rain")
+    assert edits.current.parent == 1
+    assert [step.prompt for step in edits.children(1)] == ["add fog", "add rain"]
+    assert [step.index for step in edits.path()] == [0, 1, 3]
+    assert edits.undo().index == 1 and edits.undo().index == 0 and edits.undo().index == 0
+    assert model() == 3
+
+
+def test_repeated_prompt_reuses_the_earlier_result(model):
+    edits = session()
+    first = edits.send("darker sky")
+    edits.undo()
+    assert edits.send("  darker  sky ") is first
+    assert edits.head == 1 and len(edits.steps) == 2
+    assert model() == 1
+
+
+def test_max_steps(model):
+    edits = session(max_steps=2)
+    edits.send("darker sky")
+    with pytest.raises(ValueError):
+        edits.send("add fog")
+
+
+def test_trimmed_history_summarises_dropped_edits(model):
+    edits = session(history_turns=4, history_images=2, file_uploads=False)
+    for prompt in ("one", "two", "three", "four"):
+        edits.send(prompt)
+    history, message, inline = edits.build_contents("five", edits.current)
+    assert [turn["role"] for turn in history] == ["user", "model", "user", "model"]
+    assert history[0]["parts"][0] == "Edits already applied to this image, oldest first: 'one'; 'two'"
+    assert history[0]["parts"][1] == "three"
+    # Model turns hold only the model's own images, never text written for it
+    assert all(not isinstance(part, str) for turn in history[1::2] for part in turn["parts"])
+    assert message == ["five"]
+    assert inline == sum(len(part["data"]) for part in image_parts(history))
+
+
+def test_input_image_of_oldest_kept_edit(model):
+    edits = session(history_images=3, file_uploads=False)
+    edits.send("one")
+    edits.send("two")
+    history, message, _ = edits.build_contents("three", edits.current)
+    assert len(history) == 4 and len(image_parts(history)) == 3
+    assert history[0]["parts"][1]["data"] == edits.steps[0].blob["data"]
+
+
+def test_without_history_the_head_goes_with_the_prompt(model):
+    edits = session(history_turns=0, file_uploads=False)
+    edits.send("one")
+    history, message, inline = edits.build_contents("two", edits.current)
+    assert history == []
+    assert message[0] == "Edits already applied to this image, oldest first: 'one'"
+    assert message[1] == "two" and inline == len(message[2]["data"])
+
+
+def test_uploaded_steps_are_referenced_not_resent(model):
+    uploads = len(stub_upload_file.uploads)
+    edits = session(history_images=4)
+    edits.send("one")
+    edits.send("two")
+    history, message, inline = edits.build_contents("three", edits.current)
+    assert inline == 0
+    assert all(part.name.startswith("files/") for part in image_parts(history))
+    # A branch from an earlier step costs no image bytes either
+    edits.undo()
+    assert edits.build_contents("again", edits.current)[2] == 0
+    assert len(stub_upload_file.uploads) - uploads == 3
+
+
+def test_failed_upload_falls_back_to_inline(model, monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError("upload refused")
+    monkeypatch.setattr(genai, "upload_file", broken)
+    edits = session()
+    edits.send("one")
+    history, message, inline = edits.build_contents("two", edits.current)
+    assert inline == len(edits.steps[1].blob["data"]) > 0
+    assert edits.steps[1].file is None
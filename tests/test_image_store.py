@@ -0,0 +1,74 @@
+import pytest
+from PIL import Image
+
+import image_store
+from image_store import ImageStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ImageStore(str(tmp_path / "store"), memory_bytes=0, disk_bytes=10 * 1024 * 1024)
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "P"])
+def test_images_round_trip_through_the_spill_directory(store, mode):
+    image = Image.effect_noise((40, 30), 64).convert(mode)
+    handle = store.put(f"image-{mode}", image)
+    assert (handle.mode, handle.size) == (mode, (40, 30))
+    assert store.get(handle.key).tobytes() == image.tobytes()
+
+
+def test_handle_applies_its_orientation_on_read(store, monkeypatch):
+    monkeypatch.setattr(image_store, "get_image_store", lambda: store)
+    handle = store.put("wide", Image.new("RGB", (40, 20)))
+    assert handle.oriented(6).image.size == (20, 40)
+    assert handle.image.size == (40, 20)
+
+
+def test_disk_quota_evicts_least_recently_used(tmp_path):
+    store = ImageStore(str(tmp_path / "store"), memory_bytes=0, disk_bytes=2 * 64 * 64 * 3)
+    for key in ("a", "b"):
+        store.put(key, Image.new("RGB", (64, 64)))
+    store.get("a")
+    store.put("c", Image.new("RGB", (64, 64)))
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.stats()["disk_bytes"] <= store.disk_bytes
+
+
+def test_evicted_handle_raises_lookup_error(store, monkeypatch):
+    monkeypatch.setattr(image_store, "get_image_store", lambda: store)
+    handle = store.put("gone", Image.new("RGB", (8, 8)))
+    store.discard("gone")
+    with pytest.raises(LookupError):
+        handle.image
+
+
+def test_deferred_images_decode_once_on_first_read(store):
+    decoded = []
+
+    def loader():
+        decoded.append(1)
+        return Image.new("RGB", (16, 16), "red")
+
+    handle = store.defer("lazy", loader, "RGB", (16, 16))
+    assert decoded == [] and store.stats()["deferred"] == 1
+    assert store.get(handle.key).getpixel((0, 0)) == (255, 0, 0)
+    store.get(handle.key)
+    assert decoded == [1] and store.stats()["deferred"] == 0
+
+
+def test_sessions_release_only_their_own_images(store):
+    for key in ("shared", "mine", "old"):
+        store.put(key, Image.new("RGB", (8, 8)))
+    store.touch_session("tab-1", ["shared", "old"])
+    store.touch_session("tab-2", ["shared"])
+    # Replacing an upload drops the image it replaced
+    store.touch_session("tab-1", ["shared", "mine"])
+    assert store.handle("old") is None
+    assert store.release_session("tab-1") == 1
+    assert store.handle("mine") is None and store.handle("shared") is not None
+    assert store.release_idle_sessions(idle_seconds=0) == 1
+    assert store.stats()["images"] == 0
@@ -0,0 +1,71 @@
+import struct
+import zlib
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import ingest
+
+
+def encode(size, format="PNG", **kwargs):
+    buf = BytesIO()
+    Image.new("RGB", size, "white").save(buf, format=format, **kwargs)
+    return buf.getvalue()
+
+
+def test_sniff_reads_the_header():
+    info = ingest.sniff(encode((120, 80), "JPEG"))
+    assert (info.format, info.size, info.orientation) == ("JPEG", (120, 80), 1)
+
+
+def test_byte_limit(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_UPLOAD_BYTES", 1024)
+    with pytest.raises(ingest.UploadRejected) as e:
+        ingest.check_size(2048)
+    assert e.value.reason == "bytes"
+    ingest.check_size(1024)
+
+
+def test_pixel_limit_is_enforced_from_the_header(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_PIXELS", 100 * 100)
+    with pytest.raises(ingest.UploadRejected) as e:
+        ingest.sniff(encode((101, 100)))
+    assert e.value.reason == "pixels"
+    assert ingest.sniff(encode((100, 100))).size == (100, 100)
+
+
+def test_decompression_bomb_is_refused_before_decoding(monkeypatch):
+    # A PNG header claiming 20000x20000 pixels, with an 8x8 image's data behind it
+    data = bytearray(encode((8, 8)))
+    ihdr = bytes(data[12:16]) + struct.pack(">II", 20000, 20000) + bytes(data[24:29])
+    data[16:33] = ihdr[4:] + struct.pack(">I", zlib.crc32(ihdr))
+    data = bytes(data)
+    decoded = []
+    monkeypatch.setattr(ingest, "decode", lambda *args, **kwargs: decoded.append(args))
+    with pytest.raises(ingest.UploadRejected) as e:
+        ingest.open_upload(data)
+    assert e.value.reason == "pixels" and decoded == []
+
+
+def test_unreadable_and_unsupported_formats():
+    with pytest.raises(ingest.UploadRejected) as e:
+        ingest.sniff(b"definitely not an image")
+    assert e.value.reason == "format"
+    with pytest.raises(ingest.UploadRejected) as e:
+        ingest.sniff(encode((8, 8), "ICO"))
+    assert e.value.reason == "format"
+
+
+def test_decode_at_reduced_scale():
+    image = ingest.decode(encode((2000, 1500), "JPEG"), max_edge=500, key="large")
+    assert image.size == (500, 375)
+    assert ingest.peak_bytes("large") > 0
+    assert ingest.scaled_size((300, 200), 1000) == (300, 200)
+
+
+def test_open_upload_applies_exif_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise to display
+    image = ingest.open_upload(encode((40, 20), "JPEG", exif=exif.tobytes()))
+    assert image.size == (20, 40)
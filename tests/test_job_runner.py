@@ -0,0 +1,52 @@
+import io
+import json
+
+import job_runner
+
+
+def write_jobs(path, jobs):
+    path.write_text("".join((job if isinstance(job, str) else json.dumps(job)) + "\n" for job in jobs))
+
+
+def test_fallback_ids_survive_edits_to_the_file(tmp_path):
+    job = {"operation": "gen", "prompt": "a lighthouse"}
+    path = tmp_path / "jobs.jsonl"
+    write_jobs(path, [job])
+    [(first_id, _)] = job_runner.iter_jobs(str(path))
+    write_jobs(path, ["", {"operation": "edit", "prompt": "snow", "input": "a.png"}, job])
+    ids = [job_id for job_id, _ in job_runner.iter_jobs(str(path))]
+    assert ids[1] == first_id and ids[0] != first_id
+    # Aliases name the same operation
+    assert job_runner.job_fingerprint({"operation": "generation", "prompt": "a lighthouse"}) == first_id
+
+
+def test_explicit_ids_and_malformed_lines(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    write_jobs(path, [{"id": 7, "operation": "gen"}, "{not json"])
+    assert list(job_runner.iter_jobs(str(path))) == [("7", {"id": 7, "operation": "gen"}), ("line-2", None)]
+
+
+def test_resume_skips_finished_jobs(tmp_path, monkeypatch):
+    calls = []
+
+    def generate(output, prompt):
+        calls.append(prompt)
+        if prompt == "flaky" and calls.count("flaky") == 1:
+            raise RuntimeError("model unavailable")
+        return output
+
+    monkeypatch.setattr(job_runner, "get_operation", lambda name: ("generation", generate))
+    jobs = tmp_path / "jobs.jsonl"
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    write_jobs(jobs, [{"operation": "gen", "prompt": prompt} for prompt in ("one", "flaky", "two")])
+
+    out = io.StringIO()
+    first = job_runner.run_jobs(str(jobs), checkpoint, workers=2, out=out)
+    assert (first["ok"], first["error"], first["skipped"]) == (2, 1, 0)
+    assert len(out.getvalue().splitlines()) == 3
+
+    # A job added at the top shifts every line but not the ids
+    write_jobs(jobs, [{"operation": "gen", "prompt": prompt} for prompt in ("new", "one", "flaky", "two")])
+    second = job_runner.run_jobs(str(jobs), checkpoint, workers=2, out=io.StringIO())
+    assert (second["ok"], second["error"], second["skipped"]) == (2, 0, 2)
+    assert sorted(calls[3:]) == ["flaky", "new"]
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+import jobs
+import shared_store
+from benchmarks.stub_model import make_png
+from image_io import GeneratedImage
+from jobs import CANCELLED, DONE, FAILED, JobQueue
+
+
+def wait_for(queue, job_id):
+    queue.get(job_id).future.result(timeout=5)
+    return queue.get(job_id)
+
+
+@pytest.fixture
+def default_queue(monkeypatch):
+    monkeypatch.setattr(jobs, "_default_queue", None)
+    yield
+    if jobs._default_queue is not None:
+        jobs._default_queue._executor.shutdown()
+
+
+def test_single_replica_keeps_jobs_in_process(monkeypatch, default_queue):
+    monkeypatch.setattr(shared_store, "SHARED_STORE_URL", "")
+    assert jobs.get_job_queue().store is None
+
+
+def test_configured_store_is_attached(monkeypatch, tmp_path, default_queue):
+    monkeypatch.setattr(shared_store, "SHARED_STORE_URL", f"sqlite:///{tmp_path / 'shared.sqlite3'}")
+    monkeypatch.setattr(shared_store, "_default_store", None)
+    assert isinstance(jobs.get_job_queue().store, shared_store.SQLiteStore)
+
+
+def test_job_result_and_failure():
+    queue = JobQueue(max_workers=2)
+    done = wait_for(queue, queue.submit(lambda x: x * 2, 21))
+    assert (done.status, done.result) == (DONE, 42)
+    failed = wait_for(queue, queue.submit(lambda: 1 / 0))
+    assert failed.status == FAILED and "division" in failed.error
+
+
+def test_cancelled_queued_job_never_runs():
+    release = threading.Event()
+    ran = []
+    queue = JobQueue(max_workers=1)
+    queue.submit(release.wait)
+    job_id = queue.submit(ran.append, 1)
+    assert queue.cancel(job_id)
+    release.set()
+    queue._executor.shutdown(wait=True)
+    assert queue.get(job_id).status == CANCELLED and ran == []
+
+
+def test_replicas_share_jobs_through_the_store(tmp_path):
+    store = shared_store.SQLiteStore(str(tmp_path / "shared.sqlite3"))
+    here, there = JobQueue(store=store), JobQueue(store=store)
+    image = GeneratedImage(make_png((16, 16)), "image/png")
+    job_id = here.submit(lambda: [image, "note"])
+    wait_for(here, job_id)
+    seen = there.get(job_id)
+    assert seen.status == DONE
+    assert seen.result[0].data == image.data and seen.result[1] == "note"
+    there.forget(job_id)
+    assert store.get_json("job", job_id) is None
+
+
+def test_cancel_from_another_replica_discards_the_result(tmp_path):
+    store = shared_store.SQLiteStore(str(tmp_path / "shared.sqlite3"))
+    here, there = JobQueue(store=store), JobQueue(store=store)
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    job_id = here.submit(work)
+    started.wait(5)
+    assert there.cancel(job_id)
+    release.set()
+    job = wait_for(here, job_id)
+    assert job.status == CANCELLED and job.result is None
@@ -0,0 +1,89 @@
+import os
+
+from result_cache import LRUCache, ResultCache, make_cache_key, normalize_prompt
+
+
+def disk_usage(cache):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(cache.cache_dir) for name in files)
+
+
+def test_normalize_prompt_collapses_whitespace_but_keeps_case():
+    assert normalize_prompt("  add a   sign\tsaying  OPEN\n") == "add a sign saying OPEN"
+    assert normalize_prompt(None) == ""
+    assert make_cache_key("edit", "m", "OPEN") != make_cache_key("edit", "m", "open")
+    assert make_cache_key("edit", "m", "make it  snow") == make_cache_key("edit", "m", "make it snow")
+
+
+def test_cache_key_covers_operation_model_and_variant():
+    base = make_cache_key("edit", "m", "p")
+    assert base != make_cache_key("restoration", "m", "p")
+    assert base != make_cache_key("edit", "other", "p")
+    assert base != make_cache_key("edit", "m", "p", variant=1)
+    assert base == make_cache_key("edit", "m", "p", variant=0)
+
+
+def test_lru_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", b"xxxx")
+    cache.put("b", b"xxxx")
+    cache.get("a")
+    cache.put("c", b"xxxx")
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.current_bytes == 8
+
+
+def test_lru_overwrite_replaces_the_size():
+    cache = LRUCache(max_bytes=100)
+    cache.put("a", b"x" * 40)
+    cache.put("a", b"x" * 10)
+    assert cache.current_bytes == 10 and len(cache) == 1
+    assert cache.pop("a") == b"x" * 10
+    assert cache.current_bytes == 0
+
+
+def test_lru_skips_values_larger_than_the_cache():
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", b"xxxx")
+    cache.put("big", b"x" * 11)
+    assert "big" not in cache and "a" in cache
+
+
+def test_disk_tier_serves_after_memory_is_cleared(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=1024, disk_bytes=1024)
+    cache.put("ab12", b"image")
+    cache.memory.clear()
+    assert cache.get("ab12") == b"image"
+    assert cache.get("cd34") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_overwriting_a_key_counts_its_file_once(tmp_path):
+    cache = ResultCache(str(tmp_path), disk_bytes=1000)
+    cache.put("aa", b"x" * 100)
+    for _ in range(20):
+        cache.put("aa", b"y" * 100)
+    assert cache._disk_total == disk_usage(cache) == 100
+    cache.put("aa", b"z" * 30)
+    assert cache._disk_total == 30
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+    cache = ResultCache(str(tmp_path), disk_bytes=250)
+    for age, key in enumerate(("aa", "bb", "cc")):
+        cache.put(key, b"x" * 100)
+        # Older entries get older mtimes, as real traffic would leave them
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    assert cache._disk_total <= 250
+    assert not os.path.exists(cache._path("aa"))
+    assert os.path.exists(cache._path("bb")) and os.path.exists(cache._path("cc"))
+    assert "aa" not in cache.memory
+    assert cache._disk_total == disk_usage(cache)
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("aa", b"x")
+    cache.clear()
+    assert cache.get("aa") is None
+    assert cache._disk_total == 0 and disk_usage(cache) == 0
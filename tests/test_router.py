@@ -0,0 +1,156 @@
+import time
+
+import pytest
+
+import scheduler
+from benchmarks.stub_model import StubModel
+from router import ModelStats, Router, can_fall_back
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FailingModel(StubModel):
+    def __init__(self, model_name, code):
+        super().__init__(model_name, latency=0, payload=b"png")
+        self.code = code
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        raise APIError(self.code)
+
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    # Retries belong to the scheduler; here every error goes straight to the router
+    monkeypatch.setattr(scheduler, "_default_scheduler", scheduler.Scheduler(rate=0, max_retries=0))
+
+
+def route(models, **kwargs):
+    names = list(models)
+    router = Router(routes={"edit": names[1:]}, **kwargs)
+    result, model = router.call("edit", names[0], lambda name: models[name].generate_content("a cat"))
+    return router, model
+
+
+def test_model_stats_quantiles_and_error_rate():
+    stats = ModelStats()
+    for seconds in (1, 2, 3, 4):
+        stats.record(seconds, True)
+    stats.record(9, False)
+    summary = stats.summary()
+    assert summary["calls"] == 5
+    assert summary["error_rate"] == pytest.approx(0.2)
+    assert summary["p50"] == 3 and summary["p99"] == 4
+    assert stats.quantile(0.0) == 1
+
+
+def test_model_stats_samples_age_out():
+    stats = ModelStats(window_seconds=0.05)
+    stats.record(1, False)
+    time.sleep(0.1)
+    assert stats.summary()["calls"] == 0
+
+
+def test_failing_model_moves_to_the_back():
+    router = Router(routes={"edit": ["b"]}, min_samples=3, error_rate_threshold=0.5)
+    assert router.candidates("edit", "a") == ["a", "b"]
+    for _ in range(3):
+        router.stats_for("edit", "a").record(1, False)
+    assert router.candidates("edit", "a") == ["b", "a"]
+
+
+def test_can_fall_back_only_on_retryable_errors():
+    assert can_fall_back(APIError(429)) and can_fall_back(APIError(503)) and can_fall_back(APIError(500))
+    assert can_fall_back(TimeoutError())
+    assert not can_fall_back(APIError(400)) and not can_fall_back(ValueError())
+
+
+def test_retryable_error_falls_back_to_next_candidate():
+    models = {"primary": FailingModel("primary", 503), "backup": StubModel("backup", latency=0, payload=b"png")}
+    router, model = route(models, hedge_max_ratio=0)
+    assert model == "backup"
+    assert router.stats()["fallbacks"] == 1
+
+
+def test_non_retryable_error_is_raised_without_fallback():
+    models = {"primary": FailingModel("primary", 400), "backup": StubModel("backup", latency=0, payload=b"png")}
+    with pytest.raises(APIError) as raised:
+        route(models, hedge_max_ratio=0)
+    assert raised.value.code == 400
+    assert models["backup"].calls == 0
+
+
+def test_every_candidate_failing_raises_the_first_error():
+    models = {"primary": FailingModel("primary", 500), "backup": FailingModel("backup", 503)}
+    with pytest.raises(APIError) as raised:
+        route(models, hedge_max_ratio=0)
+    assert raised.value.code == 500
+
+
+def test_slow_primary_is_hedged_on_a_faster_candidate():
+    models = {"slow": StubModel("slow", latency=0.5, payload=b"png"),
+              "fast": StubModel("fast", latency=0.01, payload=b"png")}
+    router = Router(routes={"edit": ["fast"]}, hedge_after=0.05, hedge_max_ratio=1)
+    router.stats_for("edit", "slow").record(0.5, True)
+    router.stats_for("edit", "fast").record(0.01, True)
+    started = time.perf_counter()
+    _, model = router.call("edit", "slow", lambda name: models[name].generate_content("a cat"))
+    assert model == "fast"
+    assert time.perf_counter() - started < 0.4
+    assert router.stats()["hedges"] == 1
+
+
+def test_hedges_are_capped_by_the_credit():
+    models = {"slow": StubModel("slow", latency=0.15, payload=b"png")}
+    router = Router(routes={"edit": []}, hedge_after=0.01, hedge_max_ratio=0.1, hedge_burst=1)
+    for _ in range(3):
+        router.call("edit", "slow", lambda name: models[name].generate_content("a cat"))
+    # The first request spends the one saved hedge; 0.1 per request refills it slowly
+    assert router.stats()["hedges"] == 1
+
+
+def test_winner_is_not_counted_as_abandoned():
+    models = {"primary": StubModel("primary", latency=0, payload=b"png")}
+    router, model = route(models)
+    assert model == "primary"
+    assert router.stats()["abandoned"] == 0
+
+
+def test_attempt_with_a_fallback_gets_capped_retries(monkeypatch):
+    monkeypatch.setattr(scheduler, "_default_scheduler",
+                        scheduler.Scheduler(rate=0, base_backoff=0, max_retries=5))
+    models = {"primary": FailingModel("primary", 503), "backup": FailingModel("backup", 503)}
+    with pytest.raises(APIError):
+        route(models, hedge_max_ratio=0, attempt_retries=1)
+    # The primary gives way after one retry; the last candidate keeps the scheduler's five
+    assert models["primary"].calls == 2
+    assert models["backup"].calls == 6
+
+
+def test_streams_and_chat_edits_are_routed(stub, monkeypatch):
+    import core
+    import edit_session
+    import router
+    from PIL import Image
+
+    stub(latency=0)
+    backup = StubModel("backup", latency=0)
+    models = {core.IMAGE_MODEL_NAME: FailingModel(core.IMAGE_MODEL_NAME, 503), "backup": backup}
+    monkeypatch.setattr(core, "get_model", models.__getitem__)
+    monkeypatch.setattr(edit_session, "get_model", models.__getitem__)
+    monkeypatch.setattr(router, "_default_router", Router(routes={"generation": ["backup"], "edit": ["backup"]},
+                                                          hedge_max_ratio=0))
+
+    texts = []
+    result, _ = core.stream_operation("generation", "a lighthouse", on_text=texts.append)
+    assert result is not None and texts == ["Working on it..."]
+    assert backup.calls == 1
+
+    session = edit_session.EditSession(Image.new("RGB", (32, 32)))
+    assert session.send("make it snow") is not None
+    assert backup.calls == 2
+    assert router._default_router.stats()["fallbacks"] == 2
@@ -0,0 +1,123 @@
+import time
+import random
+
+import pytest
+
+from benchmarks.stub_model import StubModel
+from scheduler import RETRYABLE_CODES, Scheduler, TokenBucket, retry_hint, status_code
+
+
+class APIError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message or f"HTTP {code}")
+        self.code = code
+
+
+class FlakyModel(StubModel):
+    """StubModel whose first ``failures`` calls raise ``error``."""
+
+    def __init__(self, error, failures):
+        super().__init__(latency=0, payload=b"png")
+        self.error = error
+        self.failures = failures
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if self.calls < self.failures:
+            self.calls += 1
+            raise self.error
+        return super().generate_content(contents, stream, **kwargs)
+
+
+def test_status_code_reads_code_attribute_and_error_names():
+    assert status_code(APIError(429)) == 429
+    assert status_code(type("ResourceExhausted", (Exception,), {})()) == 429
+    assert status_code(type("ServiceUnavailable", (Exception,), {})()) == 503
+    assert status_code(type("DeadlineExceeded", (Exception,), {})()) == 504
+    assert status_code(ValueError("nope")) is None
+    assert 504 in RETRYABLE_CODES
+
+
+def test_retry_hint_from_message():
+    assert retry_hint(Exception("Quota exceeded, please retry in 7.5s")) == 7.5
+    assert retry_hint(Exception("bad request")) is None
+
+
+def test_token_bucket_spends_burst_then_waits_for_refill():
+    bucket = TokenBucket(rate=50, burst=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    started = time.monotonic()
+    waited = bucket.acquire()
+    assert waited > 0
+    assert time.monotonic() - started >= 1 / 50 * 0.5
+
+
+def test_token_bucket_disabled_by_zero_rate():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.acquire() == 0.0 for _ in range(100))
+
+
+def test_aimd_halves_on_throttle_and_grows_additively():
+    scheduler = Scheduler(rate=0, max_concurrency=8, initial_concurrency=8)
+    scheduler.in_flight = 1
+    scheduler._release_slot(throttled=True)
+    assert scheduler.limit == 4
+    for _ in range(4):
+        scheduler.in_flight = 1
+        scheduler._release_slot(throttled=False)
+    # One window of ``limit`` successes adds one slot
+    assert scheduler.limit == pytest.approx(5, abs=0.1)
+
+
+def test_aimd_stays_within_bounds():
+    scheduler = Scheduler(rate=0, max_concurrency=3, initial_concurrency=1)
+    for _ in range(5):
+        scheduler.in_flight = 1
+        scheduler._release_slot(throttled=True)
+    assert scheduler.limit == 1
+    for _ in range(100):
+        scheduler.in_flight = 1
+        scheduler._release_slot(throttled=False)
+    assert scheduler.limit == 3
+
+
+def test_backoff_is_full_jitter_capped_exponential():
+    random.seed(0)
+    scheduler = Scheduler(base_backoff=1.0, max_backoff=10)
+    for attempt in range(1, 8):
+        delays = [scheduler.backoff(attempt, Exception()) for _ in range(200)]
+        ceiling = min(10, 2 ** (attempt - 1))
+        assert all(0 <= delay <= ceiling for delay in delays)
+        # Full jitter spreads retries over the whole window
+        assert max(delays) > ceiling * 0.8 and min(delays) < ceiling * 0.2
+
+
+def test_backoff_never_undercuts_server_hint():
+    scheduler = Scheduler(base_backoff=0.5, max_backoff=60)
+    assert all(scheduler.backoff(1, Exception("retry in 4s")) >= 4 for _ in range(50))
+
+
+def test_call_retries_retryable_errors():
+    model = FlakyModel(APIError(503), failures=2)
+    scheduler = Scheduler(rate=0, base_backoff=0, max_retries=3)
+    response = scheduler.generate_content(model, "a cat")
+    assert response.candidates[0].content.parts[0].inline_data.data == b"png"
+    stats = scheduler.stats()
+    assert (stats["retries"], stats["throttled"], stats["succeeded"]) == (2, 2, 1)
+    assert scheduler.limit < 4
+
+
+def test_call_raises_other_errors_at_once():
+    model = FlakyModel(APIError(400), failures=1)
+    scheduler = Scheduler(rate=0, base_backoff=0)
+    with pytest.raises(APIError):
+        scheduler.generate_content(model, "a cat")
+    assert model.calls == 1
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_call_gives_up_after_max_retries():
+    model = FlakyModel(APIError(500), failures=10)
+    scheduler = Scheduler(rate=0, base_backoff=0, max_retries=2)
+    with pytest.raises(APIError):
+        scheduler.generate_content(model, "a cat")
+    assert model.calls == 3
@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.stub_model import make_png
+from image_io import GeneratedImage
+from shared_store import SharedStore, SQLiteStore, decode, encode, open_store
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        SharedStore()
+
+
+def test_sqlite_round_trip_and_ttl(tmp_path):
+    store = SQLiteStore(str(tmp_path / "s.sqlite3"))
+    store.put("ns", "k", b"v")
+    store.put_json("ns", "j", {"a": 1}, ttl=0.05)
+    assert store.get("ns", "k") == b"v" and store.get("other", "k") is None
+    assert store.get_json("ns", "j") == {"a": 1}
+    time.sleep(0.1)
+    assert store.get_json("ns", "j") is None
+    store.delete("ns", "k")
+    assert store.get("ns", "k") is None
+
+
+def test_concurrent_writes_purge_on_every_multiple(tmp_path, monkeypatch):
+    store = SQLiteStore(str(tmp_path / "s.sqlite3"))
+    store.PURGE_EVERY = 10
+    purges = []
+    monkeypatch.setattr(store, "purge_expired", lambda: purges.append(1))
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: store.put("ns", str(i), b"x"), range(200)))
+    assert store._writes == 200
+    assert len(purges) == 20
+
+
+def test_images_are_stored_once_by_digest(tmp_path):
+    store = SQLiteStore(str(tmp_path / "s.sqlite3"))
+    image = GeneratedImage(make_png((8, 8)), "image/png")
+    encoded = encode(store, {"results": [image, image], "n": 2})
+    assert encoded["results"][0] == {"__image__": image.digest, "mime_type": "image/png"}
+    decoded = decode(store, encoded)
+    assert decoded["n"] == 2 and [r.data for r in decoded["results"]] == [image.data] * 2
+    store.delete("result", image.digest)
+    assert decode(store, encoded)["results"] == [None, None]
+
+
+def test_open_store_urls(tmp_path):
+    assert isinstance(open_store(f"sqlite:///{tmp_path / 'x.sqlite3'}"), SQLiteStore)
+    with pytest.raises(ValueError):
+        open_store("ftp://nowhere")
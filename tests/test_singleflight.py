@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.stub_model import StubModel
+from singleflight import SingleFlight
+
+
+def together(count, fn):
+    """Run ``fn`` on ``count`` threads released at once; returns results or exceptions."""
+    barrier = threading.Barrier(count)
+
+    def run():
+        barrier.wait()
+        try:
+            return fn()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(count) as pool:
+        return [f.result() for f in [pool.submit(run) for _ in range(count)]]
+
+
+def test_concurrent_callers_share_one_execution():
+    model = StubModel(latency=0.2, payload=b"png")
+    flight = SingleFlight()
+    results = together(8, lambda: flight.do("key", model.generate_content, "a cat"))
+    assert model.calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+def test_distinct_keys_run_separately():
+    model = StubModel(latency=0.05, payload=b"png")
+    flight = SingleFlight()
+    counter = iter(range(100))
+    together(4, lambda: flight.do(next(counter), model.generate_content, "a cat"))
+    assert model.calls == 4
+
+
+def test_waiters_get_the_leaders_error():
+    def fail():
+        threading.Event().wait(0.1)
+        raise RuntimeError("boom")
+
+    flight = SingleFlight()
+    results = together(4, lambda: flight.do("key", fail))
+    assert all(isinstance(r, RuntimeError) and str(r) == "boom" for r in results)
+    assert flight.in_flight() == 0
+
+
+def test_nothing_is_remembered_after_the_call():
+    model = StubModel(latency=0, payload=b"png")
+    flight = SingleFlight()
+    flight.do("key", model.generate_content, "a cat")
+    flight.do("key", model.generate_content, "a cat")
+    assert model.calls == 2
+
+
+def test_waiter_times_out_on_its_own():
+    release = threading.Event()
+    flight = SingleFlight()
+    leader = threading.Thread(target=flight.do, args=("key", release.wait))
+    leader.start()
+    while not flight.in_flight():
+        pass
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: "never runs", timeout=0.05)
+    release.set()
+    leader.join()
+
+
+def test_identical_operations_call_the_model_once(stub):
+    import core
+
+    factory = stub(latency=0.2)
+    results = together(4, lambda: core.run_operation("generation", "a lighthouse at dusk"))
+    assert sum(model.calls for model in factory.models) == 1
+    assert len({result.digest for result in results}) == 1
+
+
+def test_streamed_followers_encode_nothing(stub, monkeypatch):
+    import core
+    from PIL import Image
+
+    factory = stub(latency=0.2)
+    encoded = []
+    build_contents = core.build_contents
+    monkeypatch.setattr(core, "build_contents", lambda *args: encoded.append(1) or build_contents(*args))
+    source = Image.new("RGB", (64, 64), "blue")
+    results = together(4, lambda: core.stream_operation("edit", "add a moon", [source])[0])
+    assert len({result.digest for result in results}) == 1
+    assert sum(model.calls for model in factory.models) == 1
+    assert len(encoded) == 1
+
+
+def test_streamed_variants_are_cached_separately(stub):
+    import core
+
+    factory = stub(latency=0)
+    first, _ = core.stream_operation("generation", "a lighthouse at dusk")
+    again, _ = core.stream_operation("generation", "a lighthouse at dusk")
+    second, _ = core.stream_operation("generation", "a lighthouse at dusk", variant=1)
+    assert first.digest == again.digest and second is not None
+    assert sum(model.calls for model in factory.models) == 2
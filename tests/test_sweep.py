@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import sweep
+from benchmarks.stub_model import make_png
+
+
+def test_parse_param():
+    assert sweep.parse_param(" style = oil, ink ,") == ("style", ["oil", "ink"])
+    for bad in ("style", "=oil", "style="):
+        with pytest.raises(ValueError):
+            sweep.parse_param(bad)
+
+
+def test_expand_orders_like_nested_loops():
+    combinations = sweep.expand("a {animal}, {style}", {"animal": ["fox", "owl"], "style": ["oil", "ink"]})
+    assert [c["prompt"] for c in combinations] == ["a fox, oil", "a fox, ink", "a owl, oil", "a owl, ink"]
+    assert combinations[3] == {"index": 3, "params": {"animal": "owl", "style": "ink"}, "prompt": "a owl, ink"}
+
+
+def test_expand_rejects_mismatched_parameters(monkeypatch):
+    with pytest.raises(ValueError, match="No values given for style"):
+        sweep.expand("a fox, {style}", {})
+    with pytest.raises(ValueError, match="not used in the template: lens"):
+        sweep.expand("a fox", {"lens": ["24mm"]})
+    monkeypatch.setattr(sweep, "MAX_COMBINATIONS", 3)
+    with pytest.raises(ValueError, match="more than the limit"):
+        sweep.expand("{a}{b}", {"a": ["1", "2"], "b": ["1", "2"]})
+
+
+def test_sheet_layout():
+    assert sweep.sheet_layout({"a": ["1", "2", "3"], "b": ["x", "y"]}, 6) == (3, 2)
+    assert sweep.sheet_layout({"a": [str(i) for i in range(5)]}, 5) == (2, 3)
+
+
+def test_sweep_writes_images_sheet_and_resumes(stub, tmp_path):
+    factory = stub(latency=0, payload=make_png((64, 64)))
+    output = str(tmp_path / "sweep")
+    matrix = {"style": ["oil", "ink"], "lens": ["24mm", "85mm"]}
+    summary = sweep.run_sweep("a lighthouse, {style}, {lens} lens", matrix, output, workers=2, cell=32)
+    assert (summary["generated"], summary["failed"], summary["skipped"]) == (4, 0, 0)
+    assert sorted(name for name in os.listdir(output) if name.endswith(".png") and name != sweep.SHEET_NAME) == \
+        ["0000_oil-24mm.png", "0001_oil-85mm.png", "0002_ink-24mm.png", "0003_ink-85mm.png"]
+    assert Image.open(summary["contact_sheet"]).size == (2 * 32, 2 * (32 + sweep.LABEL_HEIGHT))
+    with open(os.path.join(output, sweep.MANIFEST_NAME)) as f:
+        assert {json.loads(line)["status"] for line in f} == {"ok"}
+
+    os.remove(os.path.join(output, "0001_oil-85mm.png"))
+    again = sweep.run_sweep("a lighthouse, {style}, {lens} lens", matrix, output, workers=2, cell=32)
+    assert (again["generated"], again["skipped"]) == (1, 3)
+    # The second run's one request for 0001 was served from the result cache
+    assert sum(model.calls for model in factory.models) == 4
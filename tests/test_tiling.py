@@ -0,0 +1,80 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from tiling import feather_mask, plan_tiles, restore_tile, restore_tiled
+
+
+def solid_png(color, size=(64, 64)):
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_plan_tiles_covers_the_image_with_the_requested_overlap():
+    boxes = plan_tiles((300, 200), tile_size=128, overlap=32)
+    assert boxes[0] == (0, 0, 128, 128)
+    lefts = sorted({box[0] for box in boxes})
+    tops = sorted({box[1] for box in boxes})
+    assert lefts == [0, 96, 172]
+    assert tops == [0, 72]
+    # The last tile on each axis is flush with the edge rather than spilling over
+    assert max(box[2] for box in boxes) == 300 and max(box[3] for box in boxes) == 200
+    assert all(box[2] - box[0] == 128 and box[3] - box[1] == 128 for box in boxes)
+
+
+def test_plan_tiles_small_image_is_one_tile():
+    assert plan_tiles((100, 50), tile_size=128, overlap=32) == [(0, 0, 100, 50)]
+
+
+def test_plan_tiles_rejects_overlap_not_smaller_than_tile():
+    with pytest.raises(ValueError):
+        plan_tiles((300, 300), tile_size=64, overlap=64)
+
+
+def test_feather_mask_without_overlap_is_opaque():
+    assert feather_mask((40, 30)).getextrema() == (255, 255)
+
+
+def test_feather_mask_ramps_across_the_left_overlap():
+    mask = feather_mask((100, 10), left=32)
+    row = [mask.getpixel((x, 5)) for x in range(100)]
+    assert row[0] < 8
+    assert abs(row[16] - 128) < 12
+    assert all(value == 255 for value in row[32:])
+    assert row == sorted(row)
+    # Every row carries the same ramp
+    assert [mask.getpixel((x, 0)) for x in range(100)] == row
+
+
+def test_feather_mask_multiplies_left_and_top_ramps():
+    mask = feather_mask((64, 64), left=16, top=16)
+    assert mask.getpixel((0, 40)) <= 16 and mask.getpixel((40, 0)) <= 16
+    assert mask.getpixel((40, 40)) == 255
+    corner = mask.getpixel((8, 8))
+    assert abs(corner - feather_mask((64, 64), left=16).getpixel((8, 8)) ** 2 / 255) <= 2
+
+
+def test_cross_fade_of_identical_tiles_is_seamless(stub):
+    stub(latency=0, payload=solid_png((200, 40, 90)))
+    restored = restore_tiled(Image.new("RGB", (300, 200), "white"), "restore", tile_size=128,
+                             overlap=32, workers=2)
+    assert restored.size == (300, 200)
+    for channel, value in zip(restored.split(), (200, 40, 90)):
+        low, high = channel.getextrema()
+        assert value - 1 <= low <= high <= value + 1
+
+
+def test_tiles_are_uploaded_losslessly(stub, monkeypatch):
+    import core
+
+    stub(latency=0)
+    sent = []
+    build_contents = core.build_contents
+    monkeypatch.setattr(core, "build_contents", lambda *args: sent.append(build_contents(*args)) or sent[-1])
+    tile = Image.effect_noise((128, 128), 64).convert("RGB")
+    restore_tile(tile, "restore", core.IMAGE_MODEL_NAME)
+    blob = sent[0][1]
+    assert blob["mime_type"] == "image/png"
+    assert Image.open(BytesIO(blob["data"])).tobytes() == tile.tobytes()
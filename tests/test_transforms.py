@@ -0,0 +1,91 @@
+import itertools
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageOps
+
+import transforms
+from transforms import apply, exif_orientation, fold, from_rotation, lossless_bytes, set_jpeg_orientation
+
+
+def probe():
+    # Asymmetric, so every orientation gives different pixels
+    return Image.frombytes("L", (3, 2), bytes(range(6)))
+
+
+def jpeg(orientation=None, size=(48, 32)):
+    image = Image.new("RGB", size, "white")
+    image.paste((255, 0, 0), (0, 0, 12, 8))
+    buf = BytesIO()
+    if orientation is None:
+        image.save(buf, format="JPEG")
+    else:
+        exif = Image.Exif()
+        exif[transforms.ORIENTATION_TAG] = orientation
+        image.save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def same(a, b):
+    return a.size == b.size and a.tobytes() == b.tobytes()
+
+
+def test_from_rotation():
+    assert [from_rotation(d) for d in (0, 90, 180, 270, 360, -90)] == [1, 6, 3, 8, 1, 8]
+    with pytest.raises(ValueError):
+        from_rotation(45)
+
+
+def test_fold_identity_and_quarter_turns():
+    assert fold() == 1
+    assert fold(1, None, 1) == 1
+    quarter = from_rotation(90)
+    assert fold(quarter, quarter) == from_rotation(180)
+    assert fold(quarter, quarter, quarter, quarter) == 1
+    # Flipping twice undoes itself
+    assert fold(2, 2) == 1 and fold(4, 4) == 1
+
+
+@pytest.mark.parametrize("first,second", list(itertools.product(range(1, 9), repeat=2)))
+def test_fold_matches_applying_in_sequence(first, second):
+    image = probe()
+    assert same(apply(apply(image, first), second), apply(image, fold(first, second)))
+
+
+def test_fold_three_way_is_associative():
+    for a, b, c in itertools.product(range(1, 9), repeat=3):
+        assert fold(a, b, c) == fold(fold(a, b), c) == fold(a, fold(b, c))
+
+
+@pytest.mark.parametrize("orientation", list(range(1, 9)))
+def test_apply_matches_exif_transpose(orientation):
+    image = Image.open(BytesIO(jpeg(orientation)))
+    assert exif_orientation(image) == orientation
+    image.load()
+    assert same(apply(image.copy(), orientation), ImageOps.exif_transpose(image))
+
+
+def test_exif_orientation_defaults_to_one():
+    assert exif_orientation(Image.open(BytesIO(jpeg()))) == 1
+
+
+@pytest.mark.parametrize("existing", [None, 1, 6])
+def test_set_jpeg_orientation_keeps_the_scan_data(existing):
+    data = jpeg(existing)
+    rotated = set_jpeg_orientation(data, 8)
+    assert exif_orientation(Image.open(BytesIO(rotated))) == 8
+    scan = data[data.index(b"\xff\xda"):]
+    assert rotated.endswith(scan)
+
+
+def test_lossless_bytes_composes_with_the_existing_tag():
+    data = jpeg(6)
+    rotated = lossless_bytes(data, from_rotation(90))
+    assert exif_orientation(Image.open(BytesIO(rotated))) == fold(6, from_rotation(90))
+    assert lossless_bytes(data, 1) is data
+
+
+def test_lossless_bytes_needs_a_jpeg():
+    buf = BytesIO()
+    Image.new("RGB", (4, 4)).save(buf, format="PNG")
+    assert lossless_bytes(buf.getvalue(), 6) is None
@@ -0,0 +1,144 @@
+import os
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from PIL import Image, ImageChops
+
+import core
+from image_io import GeneratedImage, encode_image
+from result_cache import get_default_cache, make_cache_key
+
+logger = logging.getLogger("nano_banana.tiling")
+
+# Configuration
+TILE_SIZE = int(os.getenv("NANO_BANANA_TILE_SIZE", "1024"))
+TILE_OVERLAP = int(os.getenv("NANO_BANANA_TILE_OVERLAP", "128"))
+TILE_WORKERS = int(os.getenv("NANO_BANANA_TILE_WORKERS", "4"))
+# Tiles are uploaded losslessly: JPEG artefacts would be "restored" along with the photo
+TILE_UPLOAD_FORMAT = os.getenv("NANO_BANANA_TILE_UPLOAD_FORMAT", "PNG").upper()
+
+TILE_PROMPT_SUFFIX = (
+    " This is one tile cut from a larger photograph: restore it in place without"
+    " cropping, adding borders or changing the framing."
+)
+
+
+def _starts(length, tile, step):
+    """Tile start offsets along one axis; the last tile is flush with the edge."""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def plan_tiles(size, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Split an image size into overlapping tile boxes in raster order."""
+    width, height = size
+    if overlap >= tile_size:
+        raise ValueError("Tile overlap must be smaller than the tile size")
+    step = tile_size - overlap
+    return [
+        (left, top, min(left + tile_size, width), min(top + tile_size, height))
+        for top in _starts(height, tile_size, step)
+        for left in _starts(width, tile_size, step)
+    ]
+
+
+def _ramp(length, size, horizontal):
+    """L-mode mask rising 0 -> 255 across ``length`` pixels, then solid."""
+    gradient = Image.linear_gradient("L")  # 256x256, dark at the top
+    if horizontal:
+        # Counter-clockwise: the dark top edge becomes the left edge
+        gradient = gradient.rotate(90, expand=True)
+    ramp = gradient.resize((length, size[1]) if horizontal else (size[0], length))
+    mask = Image.new("L", size, 255)
+    mask.paste(ramp, (0, 0))
+    return mask
+
+
+def feather_mask(size, left=0, top=0):
+    """Blend mask for a tile whose left/top edges overlap already placed tiles."""
+    mask = Image.new("L", size, 255)
+    if left > 0:
+        mask = ImageChops.multiply(mask, _ramp(left, size, horizontal=True))
+    if top > 0:
+        mask = ImageChops.multiply(mask, _ramp(top, size, horizontal=False))
+    return mask
+
+
+def restore_tile(tile, prompt, model_name):
+    """Restore a single tile and return it at the tile's original size."""
+    result = core.run_operation("restoration", prompt + TILE_PROMPT_SUFFIX, [tile], model_name,
+                                upload_format=TILE_UPLOAD_FORMAT)
+    if result is None:
+        # Keep the original pixels rather than leaving a hole in the mosaic
+        logger.warning("Tile came back without an image; keeping the original")
+        return tile
+    restored = result.image.convert(tile.mode)
+    if restored.size != tile.size:
+        restored = restored.resize(tile.size, Image.LANCZOS)
+    return restored
+
+
+def restore_tiled(image, prompt, model_name=core.IMAGE_MODEL_NAME, tile_size=TILE_SIZE,
+                  overlap=TILE_OVERLAP, workers=TILE_WORKERS, on_tile=None):
+    """Restore a large image tile by tile and stitch a full-resolution result.
+
+    Tiles are restored concurrently on ``workers`` threads (and still pass
+    through the shared scheduler), so wall-clock time scales with the worker
+    count rather than the tile count. Finished tiles are pasted in raster
+    order with a linear cross-fade over the overlaps. At most ``2 * workers``
+    restored tiles are held in memory at any time; the only full-size
+    buffers are the source and the output canvas.
+
+    ``on_tile(done, total)`` is called after each tile is placed.
+    """
+    source = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    boxes = plan_tiles(source.size, tile_size, overlap)
+    canvas = Image.new(source.mode, source.size)
+    limit = max(1, workers) * 2
+    pending = {}
+    ready = {}
+    next_submit = next_paste = 0
+
+    logger.info("Restoring %dx%d image as %d tiles with %d workers",
+                source.width, source.height, len(boxes), workers)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tile") as pool:
+        while next_paste < len(boxes):
+            while next_submit < len(boxes) and next_submit - next_paste < limit:
+                tile = source.crop(boxes[next_submit])
+                pending[pool.submit(restore_tile, tile, prompt, model_name)] = next_submit
+                next_submit += 1
+
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                ready[pending.pop(future)] = future.result()
+
+            # Paste strictly in raster order so left/top neighbours are already in place
+            while next_paste in ready:
+                left, top, right, bottom = boxes[next_paste]
+                overlap_left = max((b[2] for b in boxes[:next_paste]
+                                    if b[1] == top and b[0] < left), default=left) - left
+                overlap_top = max((b[3] for b in boxes[:next_paste]
+                                   if b[0] == left and b[1] < top), default=top) - top
+                tile = ready.pop(next_paste)
+                canvas.paste(tile, (left, top), feather_mask(tile.size, overlap_left, overlap_top))
+                next_paste += 1
+                if on_tile is not None:
+                    on_tile(next_paste, len(boxes))
+    return canvas
+
+
+def run_tiled_restoration(image, prompt, model_name=core.IMAGE_MODEL_NAME, tile_size=TILE_SIZE,
+                          overlap=TILE_OVERLAP, workers=TILE_WORKERS, on_tile=None):
+    """Cached tiled restoration returning a GeneratedImage (PNG)."""
+    cache = get_default_cache()
+    cache_key = make_cache_key(f"restoration:tiled:{tile_size}:{overlap}", model_name, prompt, [image])
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return GeneratedImage(cached)
+    restored = restore_tiled(image, prompt, model_name, tile_size, overlap, workers, on_tile)
+    result = GeneratedImage(encode_image(restored, "PNG"), "image/png")
+    cache.put(cache_key, result.data)
+    return result
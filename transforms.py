@@ -0,0 +1,150 @@
+import struct
+from io import BytesIO
+from functools import lru_cache
+
+from PIL import Image
+
+import metrics
+
+# Orientations use the EXIF numbering (1 = as stored ... 8). Each one is a
+# single lossless transpose, and any sequence of rotations and flips folds
+# into exactly one of them.
+ORIENTATION_TAG = 0x0112
+TRANSPOSE_METHODS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# Clockwise slider rotations in degrees
+ROTATIONS = {0: 1, 90: 6, 180: 3, 270: 8}
+
+
+def from_rotation(degrees):
+    """Orientation for a clockwise rotation by a multiple of 90 degrees."""
+    if degrees % 90:
+        raise ValueError("Only quarter-turn rotations are lossless")
+    return ROTATIONS[degrees % 360]
+
+
+@lru_cache(maxsize=None)
+def _compose_table():
+    # Derived by applying every pair of transposes to a tiny asymmetric image
+    probe = Image.frombytes("L", (3, 2), bytes(range(6)))
+
+    def run(image, orientation):
+        method = TRANSPOSE_METHODS.get(orientation)
+        return image if method is None else image.transpose(method)
+
+    signatures = {(run(probe, o).size, run(probe, o).tobytes()): o for o in range(1, 9)}
+    return {
+        (first, second): signatures[(run(run(probe, first), second).size,
+                                     run(run(probe, first), second).tobytes())]
+        for first in range(1, 9) for second in range(1, 9)
+    }
+
+
+def fold(*orientations):
+    """Compose orientations applied left to right into a single one."""
+    result = 1
+    table = _compose_table()
+    for orientation in orientations:
+        result = table[(result, orientation or 1)]
+    return result
+
+
+def exif_orientation(image):
+    """EXIF orientation of an opened (not necessarily loaded) image; 1 when absent."""
+    try:
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in range(1, 9) else 1
+
+
+def strip_orientation(image):
+    """Drop the EXIF orientation from a decoded image so nothing re-applies it."""
+    image.getexif().pop(ORIENTATION_TAG, None)
+    image.info.pop("exif", None)
+    return image
+
+
+def apply(image, orientation):
+    """Apply an orientation with one lossless transpose (no resampling)."""
+    method = TRANSPOSE_METHODS.get(orientation)
+    if method is None:
+        return image
+    with metrics.span("transform"):
+        return image.transpose(method)
+
+
+def _minimal_exif(orientation):
+    # Big-endian TIFF header, one IFD0 entry: Orientation SHORT = orientation
+    return (b"Exif\0\0MM\x00\x2a\x00\x00\x00\x08\x00\x01"
+            + struct.pack(">HHIH2x", ORIENTATION_TAG, 3, 1, orientation)
+            + b"\x00\x00\x00\x00")
+
+
+def _patch_orientation(tiff, orientation):
+    """Rewrite the Orientation entry of IFD0 in place; None if it has none."""
+    if tiff[:2] not in (b"II", b"MM"):
+        return None
+    endian = "<" if tiff[:2] == b"II" else ">"
+    try:
+        (ifd,) = struct.unpack_from(endian + "I", tiff, 4)
+        (count,) = struct.unpack_from(endian + "H", tiff, ifd)
+        for index in range(count):
+            entry = ifd + 2 + index * 12
+            tag, kind = struct.unpack_from(endian + "HH", tiff, entry)
+            if tag == ORIENTATION_TAG and kind == 3:
+                patched = bytearray(tiff)
+                struct.pack_into(endian + "H", patched, entry + 8, orientation)
+                return bytes(patched)
+    except struct.error:
+        return None
+    return None
+
+
+def set_jpeg_orientation(data, orientation):
+    """JPEG bytes with their EXIF Orientation set to ``orientation``.
+
+    The compressed image data is copied untouched, so rotating a JPEG this
+    way is lossless and costs no decode or encode; viewers apply the tag.
+    """
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG")
+    insert_at = 2
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker in (0xDA, 0xD9):  # start of scan / end of image
+            break
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if marker == 0xE0:
+            # Keep JFIF first; a new EXIF segment goes right after it
+            insert_at = pos + 2 + length
+        if marker == 0xE1 and data[pos + 4:pos + 10] == b"Exif\0\0":
+            patched = _patch_orientation(data[pos + 10:pos + 2 + length], orientation)
+            if patched is not None:
+                return data[:pos + 10] + patched + data[pos + 2 + length:]
+        pos += 2 + length
+    segment = _minimal_exif(orientation)
+    return (data[:insert_at] + b"\xff\xe1" + struct.pack(">H", len(segment) + 2)
+            + segment + data[insert_at:])
+
+
+def lossless_bytes(data, orientation):
+    """Encoded bytes shown with ``orientation`` applied, or None if that needs a re-encode.
+
+    Only JPEG can carry the rotation losslessly (via its EXIF tag); the tag
+    composes with any orientation the file already has.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    if orientation == 1:
+        return data
+    current = exif_orientation(Image.open(BytesIO(data)))
+    return set_jpeg_orientation(data, fold(current, orientation))